@@ -0,0 +1,197 @@
+"""
+Admission control - shares the agent's LLM capacity fairly between sessions
+
+Every agent call takes a slot from an ``AdmissionController``. A session is rejected with a
+retry-after hint when its token bucket is empty or it already has too many calls in flight.
+Admitted calls beyond the global capacity wait in per-session queues that are served round
+robin, so a session with many queued calls cannot delay the others' next call.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+# Bucket tokens an agent call of each task costs; roadmaps and analyses are the longest prompts
+TASK_COSTS = {"roadmap": 3, "analyze": 2}
+DEFAULT_TASK_COST = 1
+# Idle sessions are forgotten once this many are tracked
+MAX_TRACKED_SESSIONS = 1000
+# Weight of the newest call in the moving average of call durations used for retry hints
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+def task_cost(task: Optional[str]) -> int:
+    return TASK_COSTS.get(task or "", DEFAULT_TASK_COST)
+
+
+class AdmissionRejected(Exception):
+    """The call was not admitted; retry after ``retry_after`` seconds"""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _SessionState:
+    __slots__ = ("tokens", "refilled_at", "running", "waiting", "admitted", "rejected", "completed")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.refilled_at = now
+        self.running = 0
+        self.waiting: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+
+
+class AdmissionController:
+    """Per-session token buckets, per-session concurrency caps and fair queuing for agent calls.
+
+    ``capacity`` calls run at once (what the LLM backend can serve in parallel). Each session's
+    bucket holds up to ``burst`` tokens and refills at ``rate_per_minute``; a call costs
+    ``task_cost(task)`` tokens. State lives in this process and must only be used from one
+    event loop; with several workers every worker enforces the limits on its own.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 2,
+        rate_per_minute: float = 30.0,
+        burst: int = 10,
+        max_in_flight_per_session: int = 2,
+        max_queue: int = 100,
+        queue_timeout: float = 60.0,
+        idle_ttl: float = 600.0,
+    ):
+        self.capacity = capacity
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight_per_session = max_in_flight_per_session
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[str, _SessionState] = {}
+        # Sessions with waiting calls, in the order they get their next slot
+        self._rotation: "OrderedDict[str, None]" = OrderedDict()
+        self._running = 0
+        self._queued = 0
+        self._service_time = 5.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _state(self, key: str, now: float) -> _SessionState:
+        state = self._sessions.get(key)
+        if state is None:
+            if len(self._sessions) >= MAX_TRACKED_SESSIONS:
+                self._prune(now)
+            state = self._sessions[key] = _SessionState(float(self.burst), now)
+        else:
+            state.tokens = min(float(self.burst), state.tokens + (now - state.refilled_at) * self.rate)
+            state.refilled_at = now
+        return state
+
+    def _prune(self, now: float) -> None:
+        # Idle sessions have a full bucket again, so forgetting them changes no decision
+        for key, state in list(self._sessions.items()):
+            if not state.running and not state.waiting and now - state.refilled_at > self.idle_ttl:
+                del self._sessions[key]
+
+    def _reject(self, state: _SessionState, detail: str, retry_after: float) -> AdmissionRejected:
+        state.rejected += 1
+        self.rejected += 1
+        return AdmissionRejected(detail, max(retry_after, 1.0))
+
+    async def acquire(self, key: str, cost: int = DEFAULT_TASK_COST) -> None:
+        """Wait for a slot or raise ``AdmissionRejected``; every successful call needs a ``release``"""
+        now = time.monotonic()
+        state = self._state(key, now)
+        if state.running + len(state.waiting) >= self.max_in_flight_per_session:
+            raise self._reject(state, "Too many agent calls in flight for this session", self._service_time)
+        if state.tokens < cost:
+            raise self._reject(state, "Agent call rate limit exceeded", (cost - state.tokens) / self.rate)
+        if self._running >= self.capacity and self._queued >= self.max_queue:
+            wait = self._service_time * (self._queued + 1) / self.capacity
+            raise self._reject(state, "Agent is at capacity", wait)
+        state.tokens -= cost
+        state.admitted += 1
+        self.admitted += 1
+        if self._running < self.capacity and not self._queued:
+            self._running += 1
+            state.running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiting.append(waiter)
+        self._queued += 1
+        self._rotation.setdefault(key, None)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted as the wait ended: give it back
+                self.release(key)
+            else:
+                waiter.cancel()
+                state.waiting.remove(waiter)
+                self._queued -= 1
+                if not state.waiting:
+                    self._rotation.pop(key, None)
+                # The call never ran, so it does not count against the bucket
+                state.tokens = min(float(self.burst), state.tokens + cost)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject(state, "Timed out waiting for agent capacity", self._service_time)
+            raise
+
+    def release(self, key: str, elapsed: Optional[float] = None) -> None:
+        state = self._sessions[key]
+        state.running -= 1
+        state.completed += 1
+        self._running -= 1
+        if elapsed is not None:
+            self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+        # Hand free slots to the waiting sessions in turn, one call each
+        while self._running < self.capacity and self._rotation:
+            next_key, _ = self._rotation.popitem(last=False)
+            next_state = self._sessions[next_key]
+            waiter = next_state.waiting.popleft()
+            self._queued -= 1
+            if next_state.waiting:
+                self._rotation[next_key] = None
+            self._running += 1
+            next_state.running += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: str, cost: int = DEFAULT_TASK_COST) -> AsyncIterator[None]:
+        """Hold an agent slot for the duration of the block"""
+        await self.acquire(key, cost)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        sessions = {}
+        for key, state in self._sessions.items():
+            tokens = min(float(self.burst), state.tokens + (now - state.refilled_at) * self.rate)
+            sessions[key] = {
+                "tokens": round(tokens, 2),
+                "running": state.running,
+                "queued": len(state.waiting),
+                "admitted": state.admitted,
+                "rejected": state.rejected,
+                "completed": state.completed,
+            }
+        return {
+            "capacity": self.capacity,
+            "running": self._running,
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_call_seconds": round(self._service_time, 2),
+            "sessions": sessions,
+        }
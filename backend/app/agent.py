@@ -1,12 +1,57 @@
 import json
 import re
-from typing import TypedDict, List, Literal, Optional, Dict, Any
+import sqlite3
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, TypedDict, List, Literal, Optional, Dict, Any
+from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph import StateGraph, END
 
-from .memory import FAISSMemory
+from .memory import FAISSMemory, retrieval_refs
 from .utils.ollama_client import OllamaClient
 from .storage import Storage
 
+# Bounds for incremental quiz analysis so prompt size stays flat as attempts accumulate
+MAX_ANALYZED_ATTEMPTS = 5
+MAX_SUMMARY_CHARS = 2000
+
+# Token callback of the run in progress; a context variable so graph nodes reach it without
+# threading it through the state (which is checkpointed)
+_token_stream: ContextVar[Optional[Callable[[str], None]]] = ContextVar("token_stream", default=None)
+
+# Checkpoints are only needed while a run may still be retried; prune_checkpoints drops the
+# threads of runs started longer ago than this
+CHECKPOINT_MAX_AGE_HOURS = 24.0
+# Start time of every checkpointed run, kept next to LangGraph's tables for pruning
+_CHECKPOINT_RUNS_DDL = "CREATE TABLE IF NOT EXISTS checkpoint_runs (thread_id TEXT PRIMARY KEY, started_at REAL NOT NULL)"
+
+
+def prune_checkpoints(checkpoint_path: str, max_age_hours: float = CHECKPOINT_MAX_AGE_HOURS) -> int:
+    """Delete the checkpoints of runs started more than ``max_age_hours`` ago; returns the thread count.
+
+    Threads written before runs were recorded are recorded now and pruned on a later call.
+    """
+    now = time.time()
+    saver = SqliteSaver(sqlite3.connect(checkpoint_path, timeout=30))
+    try:
+        with saver.cursor() as cur:
+            cur.execute(_CHECKPOINT_RUNS_DDL)
+            cur.execute(
+                "INSERT OR IGNORE INTO checkpoint_runs (thread_id, started_at) "
+                "SELECT DISTINCT thread_id, ? FROM checkpoints",
+                (now,),
+            )
+            cur.execute("SELECT thread_id FROM checkpoint_runs WHERE started_at < ?", (now - max_age_hours * 3600,))
+            expired = [row[0] for row in cur.fetchall()]
+        for thread_id in expired:
+            saver.delete_thread(thread_id)
+            with saver.cursor() as cur:
+                cur.execute("DELETE FROM checkpoint_runs WHERE thread_id = ?", (thread_id,))
+        return len(expired)
+    finally:
+        saver.conn.close()
+
 
 class State(TypedDict, total=False):
     task: Literal["tutor", "quiz", "analyze", "roadmap", "questions"]
@@ -18,15 +63,33 @@ class State(TypedDict, total=False):
     roadmap: Dict[str, Any]
     output: Any
     session_id: Optional[str]
+    meta: Dict[str, Any]
+    persisted: bool
 
 
 class StudyAgent:
-    def __init__(self, memory: FAISSMemory, model: str = "llama3", storage: Optional[Storage] = None):
+    def __init__(
+        self,
+        memory: FAISSMemory,
+        model: str = "llama3",
+        storage: Optional[Storage] = None,
+        checkpoint_path: Optional[str] = None,
+    ):
         self.memory = memory
         self.llm = OllamaClient(model=model)
         self.storage = storage
+        # With a checkpoint database every completed node is saved per (session, run id),
+        # so a retried run resumes where it stopped instead of regenerating
+        self.checkpointer = None
+        if checkpoint_path:
+            self.checkpointer = SqliteSaver(sqlite3.connect(checkpoint_path, check_same_thread=False))
+            with self.checkpointer.cursor() as cur:
+                cur.execute(_CHECKPOINT_RUNS_DDL)
         self.graph = self._build_graph()
 
+    def _generate(self, prompt: str) -> str:
+        return self.llm.generate(prompt, on_token=_token_stream.get())
+
     # Nodes
     def _route(self, state: State) -> str:
         return state["task"]
@@ -35,8 +98,8 @@ class StudyAgent:
         query = state.get("input", "")
         hits = self.memory.similarity_search(query, k=5)
         retrieved = []
-        for _, score, md in hits:
-            retrieved.append({"score": score, **md})
+        for doc_id, score, md in hits:
+            retrieved.append({"doc_id": doc_id, "score": score, **md})
         state["retrieved"] = retrieved
         return state
 
@@ -49,7 +112,7 @@ class StudyAgent:
             f"Question: {state.get('input','')}\n"
             "Answer:"
         )
-        answer = self.llm.generate(prompt)
+        answer = self._generate(prompt)
         state["output"] = {"answer": answer, "citations": [r.get("meta", {}) for r in state.get("retrieved", [])]}
         return state
 
@@ -60,7 +123,7 @@ class StudyAgent:
             "Return as a numbered list only.\n\n"
             f"Context (may be empty):\n{ctx}\n\nTopic or prompt: {state.get('input','')}\n"
         )
-        qtext = self.llm.generate(prompt)
+        qtext = self._generate(prompt)
         state["output"] = {"questions": qtext}
         return state
 
@@ -93,7 +156,7 @@ class StudyAgent:
             "Format strictly as: Q:..., A) ..., B) ..., C) ..., D) ..., Answer: <letter>, Explanation: ...\n\n"
             f"Context (may be empty):\n{ctx}\n\nTopic: {topic_input}\n"
         )
-        quiz = self.llm.generate(prompt)
+        quiz = self._generate(prompt)
         questions = self._parse_quiz_output(quiz)
         state["quiz"] = {"raw": quiz, "questions": questions}
         state["output"] = state["quiz"]
@@ -153,46 +216,67 @@ class StudyAgent:
             return self._analyze_quiz(state, session_id)
     
     def _analyze_quiz(self, state: State, session_id: str) -> State:
-        """Analyze based on quiz performance"""
-        quiz_history = self.storage.get_quiz_history(session_id)
-        
-        if not quiz_history or len(quiz_history) == 0:
-            state["analysis"] = {"summary": "No quiz attempts found. Take a quiz first to identify weak areas."}
+        """Analyze quiz performance incrementally, starting from the session's last analysis checkpoint"""
+        checkpoint = self.storage.get_analysis_checkpoint(session_id) or {}
+        previous_summary = checkpoint.get("summary")
+        new_attempts, last_answer_id = self.storage.get_quiz_updates(
+            session_id, checkpoint.get("last_answer_id") or 0
+        )
+
+        if not new_attempts:
+            if previous_summary:
+                # Nothing was answered since the last analysis, so reuse it instead of calling the LLM
+                state["analysis"] = {"summary": previous_summary, "unchanged": True}
+            else:
+                state["analysis"] = {"summary": "No quiz attempts found. Take a quiz first to identify weak areas."}
             state["output"] = state["analysis"]
             return state
-        
-        # Build quiz performance summary for LLM
+
+        # Build a summary of the new attempts only; older ones are covered by the previous analysis
         quiz_summary_parts = []
-        for idx, attempt in enumerate(quiz_history[-5:], 1):
+        for idx, attempt in enumerate(new_attempts[-MAX_ANALYZED_ATTEMPTS:], 1):
             topic = attempt.get('topic', 'Unknown')
             correct = attempt.get('correct_count', 0)
             total = attempt.get('total_questions', 0)
             accuracy = (correct / total * 100) if total > 0 else 0
-            
+
             questions = attempt.get('questions', [])
-            incorrect_qs = [q for q in questions if q.get('user_answer', {}).get('is_correct') == False]
-            
+            incorrect_qs = [q for q in questions if q.get('answer') and not q['answer'].get('is_correct')]
+
             quiz_summary_parts.append(
                 f"Quiz {idx} - {topic}: {correct}/{total} correct ({accuracy:.0f}%)\n"
                 f"Incorrect questions: {len(incorrect_qs)}"
             )
-            
+
             for q in incorrect_qs[:3]:
                 quiz_summary_parts.append(f"  ❌ {q.get('question', '')[:80]}...")
-        
+
         quiz_text = "\n".join(quiz_summary_parts)
-        
+        previous_text = (
+            "Update the previous analysis below with the new quiz results.\n\n"
+            f"Previous Analysis:\n{previous_summary}\n\n"
+            if previous_summary
+            else ""
+        )
+
         prompt = (
             "Analyze the quiz performance below and identify the TOP 5 weakest areas.\n"
             "Return ONLY a numbered list with this exact format:\n"
             "1. Topic Name: Brief explanation of the weakness\n"
             "2. Topic Name: Brief explanation of the weakness\n"
             "Do NOT include introductory text or headers.\n\n"
+            f"{previous_text}"
             f"Quiz Performance Data:\n{quiz_text}\n\n"
             "TOP 5 WEAK AREAS:\n"
         )
-        
-        analysis = self.llm.generate(prompt)
+
+        analysis = self._generate(prompt)
+        self.storage.save_analysis_checkpoint(
+            session_id,
+            last_attempt_id=new_attempts[-1]["attempt_id"],
+            last_answer_id=last_answer_id,
+            summary=analysis[:MAX_SUMMARY_CHARS],
+        )
         state["analysis"] = {"summary": analysis}
         state["output"] = state["analysis"]
         return state
@@ -224,7 +308,7 @@ class StudyAgent:
             "TOP 5 WEAK AREAS:\n"
         )
         
-        analysis = self.llm.generate(prompt)
+        analysis = self._generate(prompt)
         state["analysis"] = {"summary": analysis}
         state["output"] = state["analysis"]
         return state
@@ -237,7 +321,7 @@ class StudyAgent:
             " Tailor to the learner's weaknesses if present.\n\n"
             f"Context:\n{ctx}\n\nFocus: {state.get('input','')}\n"
         )
-        plan = self.llm.generate(prompt)
+        plan = self._generate(prompt)
         state["roadmap"] = {"plan": plan}
         state["output"] = state["roadmap"]
         return state
@@ -273,7 +357,7 @@ class StudyAgent:
         g.add_edge("do_analyze", END)
         g.add_edge("do_roadmap", END)
         g.add_edge("do_questions", END)
-        return g.compile()
+        return g.compile(checkpointer=self.checkpointer)
 
     def run(
         self,
@@ -281,10 +365,25 @@ class StudyAgent:
         user_input: str,
         history: Optional[List[Dict[str, Any]]] = None,
         session_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> Dict[str, Any]:
+        """Run a task through the graph; ``on_token`` receives the LLM output as it is generated"""
         if self.storage:
+            # Only writes when the session is new; everything else is logged in one unit of work below
             session_id = self.storage.ensure_session(session_id)
-            self.storage.log_message(session_id, "user", user_input, task=task)
+
+        resumed = run_id is not None
+        run_id = run_id or str(uuid.uuid4())
+        config = None
+        if self.checkpointer:
+            thread_id = f"{session_id}:{run_id}" if session_id else run_id
+            config = {"configurable": {"thread_id": thread_id}}
+            with self.checkpointer.cursor() as cur:
+                cur.execute(
+                    "INSERT OR IGNORE INTO checkpoint_runs (thread_id, started_at) VALUES (?, ?)",
+                    (thread_id, time.time()),
+                )
 
         initial: State = {
             "task": task,  # type: ignore
@@ -292,56 +391,82 @@ class StudyAgent:
             "history": history or [],
             "session_id": session_id,
         }
+        stream_token = _token_stream.set(on_token)
         try:
-            final_state: State = self.graph.invoke(initial)
+            final_state = self._invoke(initial, config)
         except Exception as e:
             print(f"Graph execution error: {e}")
             import traceback
             traceback.print_exc()
-            # Return error response
+            if self.storage:
+                self._log_failed_input(session_id, run_id, user_input, task)
+            # Return error response; passing run_id back resumes the run
             return {
                 "task": task,
                 "output": {"error": str(e)},
-                "meta": {},
+                "meta": {"run_id": run_id},
                 "session_id": session_id,
             }
+        finally:
+            _token_stream.reset(stream_token)
         
         if final_state is None:
+            if self.storage:
+                self._log_failed_input(session_id, run_id, user_input, task)
             return {
                 "task": task,
                 "output": {"error": "Graph execution returned None"},
-                "meta": {},
+                "meta": {"run_id": run_id},
                 "session_id": session_id,
             }
         
         output = final_state.get("output", {})
+        if final_state.get("persisted"):
+            # Retry of a run that already finished and was logged: return the stored result as is
+            return {
+                "task": task,
+                "output": output,
+                "meta": final_state.get("meta", {}),
+                "session_id": session_id,
+            }
 
         response_meta: Dict[str, Any] = dict(final_state.get("meta") or {})
-        response_meta["retrieved"] = final_state.get("retrieved", [])
+        # Only ids and scores are stored; /api/citations resolves the texts from the memory
+        response_meta["retrieved"] = retrieval_refs(final_state.get("retrieved", []))
+        response_meta["run_id"] = run_id
         quiz_data = final_state.get("quiz")
         if self.storage and session_id:
-            attempt_id = None
-            if quiz_data:
-                attempt_questions = quiz_data.get("questions", [])
-                attempt_id, question_data = self.storage.log_quiz_attempt(
-                    session_id=session_id,
-                    topic=final_state.get("input", ""),
-                    raw_output=quiz_data.get("raw", ""),
-                    questions=attempt_questions,
-                    task=task,
-                    meta=response_meta,
-                )
-                # question_data is list of tuples: (id, sequence, question, options, correct_index, explanation)
-                for question_dict, q_data in zip(attempt_questions, question_data):
-                    question_dict["id"] = q_data[0]  # q_data[0] is the id
-                response_meta["quiz_attempt_id"] = attempt_id
-            assistant_text = self._format_output(output)
-            self.storage.log_message(session_id, "assistant", assistant_text, task=task, meta=response_meta)
-            analysis_data = final_state.get("analysis")
-            if analysis_data and isinstance(analysis_data, dict):
-                analysis_summary = analysis_data.get("summary")
-                if analysis_summary:
-                    self.storage.log_weak_topics(session_id, analysis_summary)
+            # The run is not persisted yet (checked above); only a failed earlier attempt of it may
+            # have logged the user message
+            input_logged = resumed and self.storage.has_run_message(session_id, run_id)
+            with self.storage.unit_of_work() as uow:
+                if not input_logged:
+                    uow.log_message(session_id, "user", user_input, task=task, meta={"run_id": run_id})
+                attempt_id = None
+                if quiz_data:
+                    attempt_questions = quiz_data.get("questions", [])
+                    attempt_id, question_data = uow.log_quiz_attempt(
+                        session_id=session_id,
+                        topic=final_state.get("input", ""),
+                        raw_output=quiz_data.get("raw", ""),
+                        questions=attempt_questions,
+                        task=task,
+                        meta=response_meta,
+                    )
+                    # question_data is list of tuples: (id, sequence, question, options, correct_index, explanation)
+                    for question_dict, q_data in zip(attempt_questions, question_data):
+                        question_dict["id"] = q_data[0]  # q_data[0] is the id
+                    response_meta["quiz_attempt_id"] = attempt_id
+                assistant_text = self._format_output(output)
+                uow.log_message(session_id, "assistant", assistant_text, task=task, meta=response_meta)
+                analysis_data = final_state.get("analysis")
+                if analysis_data and isinstance(analysis_data, dict) and not analysis_data.get("unchanged"):
+                    analysis_summary = analysis_data.get("summary")
+                    if analysis_summary:
+                        uow.log_weak_topics(session_id, analysis_summary)
+
+        if config:
+            self.graph.update_state(config, {"output": output, "meta": response_meta, "persisted": True})
 
         return {
             "task": task,
@@ -350,6 +475,25 @@ class StudyAgent:
             "session_id": session_id,
         }
 
+    def _log_failed_input(self, session_id: Optional[str], run_id: str, user_input: str, task: str) -> None:
+        # The question stays in the history even if the run is never retried; a retry with the
+        # same run id finds it by run id and does not log it again
+        if not self.storage.has_run_message(session_id, run_id):
+            self.storage.log_message(session_id, "user", user_input, task=task, meta={"run_id": run_id})
+
+    def _invoke(self, initial: State, config: Optional[Dict[str, Any]]) -> State:
+        """Run the graph, resuming from the checkpoint of an earlier attempt of the same run if there is one"""
+        if config is None:
+            return self.graph.invoke(initial)
+        snapshot = self.graph.get_state(config)
+        if snapshot.next:
+            # An earlier attempt of this run stopped part way; continue after the last completed node
+            return self.graph.invoke(None, config)
+        if snapshot.values:
+            # This run already finished; reuse its stored outputs instead of regenerating
+            return snapshot.values
+        return self.graph.invoke(initial, config)
+
     def _format_output(self, output: Any) -> str:
         if isinstance(output, dict):
             if "answer" in output:
@@ -0,0 +1,390 @@
+"""
+Analytics - cross-session concept and question difficulty, computed by a batch job
+
+``compute_difficulty`` streams quiz attempts, questions and answers in id-ordered chunks and
+accumulates per-group sums with NumPy. Memory grows with the number of attempts, questions and
+distinct questions (a few bytes each) but not with the number of answers or the largest id.
+
+Statistics (classical test theory):
+- p_correct / difficulty: share of answers that are correct, and 1 minus that
+- discrimination: point-biserial correlation between answering correctly and the learner's
+  score on the rest of the attempt; values near 0 or below flag a misleading question
+- distractors: per option, the share of answers choosing it and the mean rest score of those
+  learners; a working distractor attracts the weaker learners
+"""
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert
+
+from .storage import ConceptDifficulty, QuestionDifficulty, Storage
+
+CHUNK_SIZE = 100_000
+# Options beyond this index are left out of the distractor statistics
+MAX_OPTIONS = 8
+# LearnOrchestrator.generate_concept_quiz appends the weak areas to the concept with this
+FOCUS_SEPARATOR = " - Focus on:"
+
+
+def concept_of_topic(topic: Optional[str]) -> str:
+    """The concept a quiz attempt's topic is about"""
+    return (topic or "").split(FOCUS_SEPARATOR)[0].strip()
+
+
+class _Sums:
+    """Per-group sums for the share correct and the point-biserial correlation"""
+
+    def __init__(self, groups: int):
+        self.n = np.zeros(groups)
+        self.x = np.zeros(groups)
+        # Only answers whose attempt has other questions have a rest score
+        self.m = np.zeros(groups)
+        self.mx = np.zeros(groups)
+        self.my = np.zeros(groups)
+        self.mxy = np.zeros(groups)
+        self.myy = np.zeros(groups)
+
+    def add(self, group: np.ndarray, x: np.ndarray, y: np.ndarray, has_rest: np.ndarray) -> None:
+        size = len(self.n)
+        w = has_rest.astype(np.float64)
+        self.n += np.bincount(group, minlength=size)
+        self.x += np.bincount(group, weights=x, minlength=size)
+        self.m += np.bincount(group, weights=w, minlength=size)
+        self.mx += np.bincount(group, weights=x * w, minlength=size)
+        self.my += np.bincount(group, weights=y * w, minlength=size)
+        self.mxy += np.bincount(group, weights=x * y * w, minlength=size)
+        self.myy += np.bincount(group, weights=y * y * w, minlength=size)
+
+    def p_correct(self) -> np.ndarray:
+        return np.divide(self.x, self.n, out=np.zeros_like(self.x), where=self.n > 0)
+
+    def discrimination(self) -> np.ndarray:
+        # x is 0/1, so the sum of x squared is the sum of x
+        covariance = self.m * self.mxy - self.mx * self.my
+        spread = (self.m * self.mx - self.mx**2) * (self.m * self.myy - self.my**2)
+        defined = (self.m >= 2) & (spread > 0)
+        result = np.full(len(self.n), np.nan)
+        np.divide(covariance, np.sqrt(spread, where=defined, out=np.zeros_like(spread)), out=result, where=defined)
+        return result
+
+
+def _chunks(connection: Any, sql: str, chunk_size: int) -> Iterator[List[Tuple[Any, ...]]]:
+    """Rows of ``sql`` in id order; it selects the id first and takes :last_id and :limit.
+
+    Each chunk is its own short read on the raw sqlite3 connection, which returns plain
+    tuples that NumPy converts without per-row overhead.
+    """
+    last_id = 0
+    while True:
+        rows = connection.execute(sql, {"last_id": last_id, "limit": chunk_size}).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _float_or_none(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def _decode_options(raw: Optional[str]) -> List[str]:
+    try:
+        options = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return options if isinstance(options, list) else []
+
+
+def concept_key(concept: str) -> str:
+    """The case-insensitive key concepts are grouped and looked up by"""
+    return concept.strip().lower()
+
+
+def _positions(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Index of each of ``ids`` in ``sorted_ids``, or -1 where it is not there"""
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[positions] == ids, positions, -1)
+
+
+def compute_difficulty(storage: Storage, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """Recompute the concept_difficulty and question_difficulty tables from every live answer.
+
+    Concepts are grouped case-insensitively and questions across sessions by concept,
+    normalized text and options. Archived attempts no longer have answers and are left out.
+    """
+    started = time.perf_counter()
+    with storage.engine.connect() as sa_connection:
+        connection = sa_connection.connection.driver_connection
+
+        # Arrays hold one entry per attempt or question, in id order, and ids are found by binary
+        # search; rows added after these counts are left to the next run
+        attempt_count = connection.execute("SELECT COUNT(*) FROM quiz_attempts").fetchone()[0]
+        question_count = connection.execute("SELECT COUNT(*) FROM quiz_questions").fetchone()[0]
+
+        # Pass 1a: id, concept, learner, correct count and length of every attempt
+        attempt_ids = np.zeros(attempt_count, dtype=np.int64)
+        attempt_concept = np.zeros(attempt_count, dtype=np.int64)
+        attempt_session = np.zeros(attempt_count, dtype=np.int64)
+        attempt_correct = np.zeros(attempt_count)
+        attempt_total = np.zeros(attempt_count)
+        concept_codes: Dict[str, int] = {}
+        concept_names: List[str] = []
+        session_codes: Dict[str, int] = {}
+        filled = 0
+        for rows in _chunks(
+            connection,
+            "SELECT id, topic, session_id, COALESCE(correct_count, 0), COALESCE(total_questions, 0) "
+            "FROM quiz_attempts WHERE id > :last_id ORDER BY id LIMIT :limit",
+            chunk_size,
+        ):
+            rows = rows[: attempt_count - filled]
+            codes = []
+            for _, topic, _, _, _ in rows:
+                name = concept_of_topic(topic)
+                code = concept_codes.get(concept_key(name))
+                if code is None:
+                    code = concept_codes[concept_key(name)] = len(concept_names)
+                    concept_names.append(name)
+                codes.append(code)
+            end = filled + len(rows)
+            attempt_ids[filled:end] = [row[0] for row in rows]
+            attempt_concept[filled:end] = codes
+            attempt_session[filled:end] = [session_codes.setdefault(row[2], len(session_codes)) for row in rows]
+            attempt_correct[filled:end] = [row[3] for row in rows]
+            attempt_total[filled:end] = [row[4] for row in rows]
+            filled = end
+            if filled == attempt_count:
+                break
+        attempt_ids, attempt_concept = attempt_ids[:filled], attempt_concept[:filled]
+        attempt_session, attempt_correct, attempt_total = (
+            attempt_session[:filled], attempt_correct[:filled], attempt_total[:filled]
+        )
+        # Learners per concept: distinct (concept, session) pairs
+        sessions = max(len(session_codes), 1)
+        learner_counts = np.bincount(
+            np.unique(attempt_concept * sessions + attempt_session) // sessions, minlength=len(concept_names)
+        )
+        del attempt_session, session_codes
+
+        # Pass 1b: id and cross-session question group of every question with a known attempt
+        question_ids = np.zeros(question_count, dtype=np.int64)
+        question_group = np.zeros(question_count, dtype=np.int64)
+        group_codes: Dict[Tuple[int, str, str], int] = {}
+        groups: List[Tuple[int, str, str, Optional[int]]] = []
+        filled = seen = 0
+        for rows in _chunks(
+            connection,
+            "SELECT id, COALESCE(attempt_id, -1), question, options, correct_index "
+            "FROM quiz_questions WHERE id > :last_id ORDER BY id LIMIT :limit",
+            chunk_size,
+        ):
+            rows = rows[: question_count - seen]
+            seen += len(rows)
+            attempts = _positions(attempt_ids, np.array([row[1] for row in rows], dtype=np.int64))
+            concepts = np.where(attempts >= 0, attempt_concept[np.maximum(attempts, 0)], -1).tolist()
+            ids = []
+            codes = []
+            for (question_id, _, text, options, correct_index), concept in zip(rows, concepts):
+                if concept < 0:
+                    continue
+                key = (concept, " ".join((text or "").lower().split()), options or "")
+                group = group_codes.get(key)
+                if group is None:
+                    group = group_codes[key] = len(groups)
+                    groups.append((concept, text or "", options or "", correct_index))
+                ids.append(question_id)
+                codes.append(group)
+            question_ids[filled : filled + len(ids)] = ids
+            question_group[filled : filled + len(ids)] = codes
+            filled += len(ids)
+            if seen == question_count:
+                break
+        question_ids, question_group = question_ids[:filled], question_group[:filled]
+        del group_codes
+
+        # Pass 2: stream the answers as integer arrays into the per-group sums
+        group_concept = np.array([group[0] for group in groups], dtype=np.int64)
+        question_sums = _Sums(len(groups))
+        concept_sums = _Sums(len(concept_names))
+        option_answers = np.zeros(len(groups) * MAX_OPTIONS)
+        option_rest = np.zeros(len(groups) * MAX_OPTIONS)
+        option_rest_answers = np.zeros(len(groups) * MAX_OPTIONS)
+        for rows in _chunks(
+            connection,
+            "SELECT id, question_id, COALESCE(attempt_id, -1), COALESCE(selected_index, -1), COALESCE(is_correct, 0) "
+            "FROM quiz_answers WHERE id > :last_id AND question_id IS NOT NULL ORDER BY id LIMIT :limit",
+            chunk_size,
+        ):
+            answers = np.array(rows, dtype=np.int64)
+            question = _positions(question_ids, answers[:, 1])
+            attempt = _positions(attempt_ids, answers[:, 2])
+            known = (question >= 0) & (attempt >= 0)
+            group, attempt, selected = question_group[question[known]], attempt[known], answers[known, 3]
+            correct = answers[known, 4].astype(np.float64)
+            if not len(group):
+                continue
+            total = attempt_total[attempt]
+            has_rest = total > 1
+            rest = np.clip((attempt_correct[attempt] - correct) / np.maximum(total - 1, 1), 0.0, 1.0)
+            rest = np.where(has_rest, rest, 0.0)
+            question_sums.add(group, correct, rest, has_rest)
+            concept_sums.add(group_concept[group], correct, rest, has_rest)
+            chose = (selected >= 0) & (selected < MAX_OPTIONS)
+            slot = group[chose] * MAX_OPTIONS + selected[chose]
+            size = len(option_answers)
+            option_answers += np.bincount(slot, minlength=size)
+            option_rest += np.bincount(slot, weights=rest[chose] * has_rest[chose], minlength=size)
+            option_rest_answers += np.bincount(slot, weights=has_rest[chose].astype(np.float64), minlength=size)
+
+    computed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    concept_rows = _concept_rows(concept_names, concept_sums, group_concept, learner_counts, computed_at)
+    question_rows = _question_rows(
+        concept_names, groups, question_sums, option_answers, option_rest, option_rest_answers, computed_at
+    )
+    with storage.Session() as session:
+        # Replace the previous run's results in one transaction, so readers see one or the other
+        session.execute(delete(QuestionDifficulty))
+        session.execute(delete(ConceptDifficulty))
+        if concept_rows:
+            session.execute(insert(ConceptDifficulty), concept_rows)
+        if question_rows:
+            session.execute(insert(QuestionDifficulty), question_rows)
+        session.commit()
+    return {
+        "answers": int(concept_sums.n.sum()),
+        "concepts": len(concept_rows),
+        "questions": len(question_rows),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _concept_rows(
+    concept_names: List[str],
+    sums: _Sums,
+    group_concept: np.ndarray,
+    learner_counts: np.ndarray,
+    computed_at: datetime,
+) -> List[Dict[str, Any]]:
+    p_correct = sums.p_correct()
+    discrimination = sums.discrimination()
+    questions = np.bincount(group_concept, minlength=len(concept_names)) if len(group_concept) else None
+    rows = []
+    for code in np.flatnonzero(sums.n):
+        rows.append(
+            {
+                "concept": concept_names[code],
+                "answers": int(sums.n[code]),
+                "learners": int(learner_counts[code]),
+                "questions": int(questions[code]) if questions is not None else 0,
+                "p_correct": round(float(p_correct[code]), 4),
+                "difficulty": round(1.0 - float(p_correct[code]), 4),
+                "discrimination": _float_or_none(discrimination[code]),
+                "computed_at": computed_at,
+            }
+        )
+    return rows
+
+
+def _question_rows(
+    concept_names: List[str],
+    groups: List[Tuple[int, str, str, Optional[int]]],
+    sums: _Sums,
+    option_answers: np.ndarray,
+    option_rest: np.ndarray,
+    option_rest_answers: np.ndarray,
+    computed_at: datetime,
+) -> List[Dict[str, Any]]:
+    p_correct = sums.p_correct()
+    discrimination = sums.discrimination()
+    shares = option_answers.reshape(-1, MAX_OPTIONS)
+    mean_rest = np.divide(
+        option_rest, option_rest_answers, out=np.full_like(option_rest, np.nan), where=option_rest_answers > 0
+    ).reshape(-1, MAX_OPTIONS)
+    rows = []
+    for group in np.flatnonzero(sums.n):
+        concept, text, options, correct_index = groups[group]
+        choices = _decode_options(options)
+        chosen = shares[group].sum()
+        distractors = [
+            {
+                "option": index,
+                "text": choices[index] if index < len(choices) else None,
+                "correct": index == correct_index,
+                "share": round(float(shares[group, index] / chosen), 4) if chosen else 0.0,
+                "mean_rest_score": _float_or_none(mean_rest[group, index]),
+            }
+            for index in range(min(max(len(choices), 1), MAX_OPTIONS))
+        ]
+        rows.append(
+            {
+                "concept": concept_key(concept_names[concept]),
+                "question": text,
+                "options": options,
+                "correct_index": correct_index,
+                "answers": int(sums.n[group]),
+                "p_correct": round(float(p_correct[group]), 4),
+                "difficulty": round(1.0 - float(p_correct[group]), 4),
+                "discrimination": _float_or_none(discrimination[group]),
+                "distractors": json.dumps(distractors),
+                "computed_at": computed_at,
+            }
+        )
+    return rows
+
+
+def get_concept_difficulty(storage: Storage, limit: int = 20, min_answers: int = 1) -> List[Dict[str, Any]]:
+    """Concepts from the last compute_difficulty run, hardest first"""
+    with storage.Session() as session:
+        rows = (
+            session.query(ConceptDifficulty)
+            .filter(ConceptDifficulty.answers >= min_answers)
+            .order_by(ConceptDifficulty.difficulty.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            {
+                "concept": row.concept,
+                "answers": row.answers,
+                "learners": row.learners,
+                "questions": row.questions,
+                "p_correct": row.p_correct,
+                "difficulty": row.difficulty,
+                "discrimination": row.discrimination,
+                "computed_at": row.computed_at.isoformat() if row.computed_at else None,
+            }
+            for row in rows
+        ]
+
+
+def get_question_difficulty(
+    storage: Storage, concept: str, limit: int = 20, min_answers: int = 1
+) -> List[Dict[str, Any]]:
+    """Questions of a concept from the last compute_difficulty run, hardest first"""
+    with storage.Session() as session:
+        rows = (
+            session.query(QuestionDifficulty)
+            .filter(QuestionDifficulty.concept == concept_key(concept), QuestionDifficulty.answers >= min_answers)
+            .order_by(QuestionDifficulty.difficulty.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            {
+                "question": row.question,
+                "options": _decode_options(row.options),
+                "correct_index": row.correct_index,
+                "answers": row.answers,
+                "p_correct": row.p_correct,
+                "difficulty": row.difficulty,
+                "discrimination": row.discrimination,
+                "distractors": json.loads(row.distractors or "[]"),
+                "computed_at": row.computed_at.isoformat() if row.computed_at else None,
+            }
+            for row in rows
+        ]
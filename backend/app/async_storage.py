@@ -0,0 +1,216 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from . import analytics, retention
+from .storage import BUSY_RETRY_BACKOFF, Storage, _is_busy_error, install_pragmas
+
+
+class AsyncStorage:
+    """Awaitable counterpart of ``Storage`` for the API, on SQLAlchemy's asyncio extension (aiosqlite).
+
+    It shares the database, schema and write-behind buffer of a sync ``Storage`` and runs the
+    same method bodies through ``AsyncSession.run_sync``, so both variants always behave the
+    same. The sync ``Storage`` stays the one to use in scripts and in the agent.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        settings = storage.settings
+        self.engine = create_async_engine(
+            storage.engine.url.set(drivername="sqlite+aiosqlite"),
+            connect_args={"check_same_thread": False, "timeout": settings["busy_timeout"]},
+            **storage.engine_options,
+        )
+        install_pragmas(self.engine.sync_engine, settings["pragmas"], settings["busy_timeout"])
+        self.Session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def _call(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a ``Storage`` method inside an async session, retrying busy transactions without blocking"""
+        attempt = 0
+        while True:
+            try:
+                async with self.Session() as session:
+                    return await session.run_sync(
+                        lambda sync_session: method(self.storage.bind(sync_session), *args, **kwargs)
+                    )
+            except OperationalError as exc:
+                if attempt >= self.storage.busy_retries or not _is_busy_error(exc):
+                    raise
+                attempt += 1
+                await asyncio.sleep(BUSY_RETRY_BACKOFF * attempt)
+
+    async def _read_your_writes(self) -> None:
+        buffer = self.storage._message_buffer
+        if buffer is not None and buffer.pending:
+            await asyncio.to_thread(buffer.flush)
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        # In-memory counters only, no database access
+        return self.storage.cache_stats()
+
+    async def data_version(self, session_id: str, names: Sequence[str]) -> str:
+        await self._read_your_writes()
+        return await self._call(Storage._etag, session_id, names)
+
+    async def flush_messages(self) -> None:
+        await asyncio.to_thread(self.storage.flush_messages)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.storage.close)
+        await self.engine.dispose()
+
+    async def session_exists(self, session_id: str) -> bool:
+        return await self._call(Storage.session_exists, session_id)
+
+    async def ensure_session(self, session_id: Optional[str]) -> str:
+        return await self._call(Storage.ensure_session, session_id)
+
+    async def log_message(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        await self._call(Storage.log_message, session_id, role, content, task=task, meta=meta)
+
+    async def log_quiz_attempt(
+        self,
+        session_id: str,
+        topic: str,
+        raw_output: str,
+        questions: Optional[List[Dict[str, Any]]] = None,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
+        return await self._call(
+            Storage.log_quiz_attempt, session_id, topic, raw_output, questions=questions, task=task, meta=meta
+        )
+
+    async def record_quiz_answer(
+        self,
+        session_id: str,
+        attempt_id: int,
+        question_id: Optional[int],
+        selected_index: Optional[int],
+        selected_option: Optional[str],
+        is_correct: bool,
+        note: Optional[str] = None,
+        confidence: Optional[float] = None,
+    ) -> bool:
+        return await self._call(
+            Storage.record_quiz_answer,
+            session_id,
+            attempt_id,
+            question_id,
+            selected_index,
+            selected_option,
+            is_correct,
+            note=note,
+            confidence=confidence,
+        )
+
+    async def record_quiz_answers(
+        self, session_id: str, attempt_id: int, answers: List[Dict[str, Any]]
+    ) -> Optional[int]:
+        return await self._call(Storage.record_quiz_answers, session_id, attempt_id, answers)
+
+    async def get_learning_state(self, session_id: str, weak_topic_limit: int = 5) -> Dict[str, Any]:
+        return await self._call(Storage.get_learning_state, session_id, weak_topic_limit=weak_topic_limit)
+
+    async def get_session_stats(self, session_id: str, include_topics: bool = False) -> Optional[Dict[str, Any]]:
+        return await self._call(Storage.get_session_stats, session_id, include_topics=include_topics)
+
+    async def rebuild_aggregates(self, session_id: Optional[str] = None) -> None:
+        await self._call(Storage.rebuild_aggregates, session_id)
+
+    async def get_quiz_history(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        include_questions: bool = True,
+    ) -> List[Dict[str, Any]]:
+        return await self._call(
+            Storage.get_quiz_history, session_id, limit=limit, before_id=before_id, include_questions=include_questions
+        )
+
+    async def get_quiz_attempt(self, session_id: str, attempt_id: int) -> Optional[Dict[str, Any]]:
+        return await self._call(Storage.get_quiz_attempt, session_id, attempt_id)
+
+    async def get_quiz_attempts(self, attempt_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        return await self._call(Storage.get_quiz_attempts, attempt_ids)
+
+    async def get_quiz_updates(self, session_id: str, after_answer_id: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        return await self._call(Storage.get_quiz_updates, session_id, after_answer_id=after_answer_id)
+
+    async def get_analysis_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self._call(Storage.get_analysis_checkpoint, session_id)
+
+    async def save_analysis_checkpoint(
+        self, session_id: str, last_attempt_id: int, last_answer_id: int, summary: str
+    ) -> None:
+        await self._call(Storage.save_analysis_checkpoint, session_id, last_attempt_id, last_answer_id, summary)
+
+    async def log_weak_topics(self, session_id: str, summary: str) -> None:
+        await self._call(Storage.log_weak_topics, session_id, summary)
+
+    async def get_history(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        await self._read_your_writes()
+        return await self._call(Storage.get_history, session_id, limit=limit, before_id=before_id, after_id=after_id)
+
+    async def get_latest_message(
+        self, session_id: str, task: str, role: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        await self._read_your_writes()
+        return await self._call(Storage.get_latest_message, session_id, task, role=role)
+
+    async def get_message(self, session_id: str, message_id: int) -> Optional[Dict[str, Any]]:
+        await self._read_your_writes()
+        return await self._call(Storage.get_message, session_id, message_id)
+
+    async def get_session_dashboard(
+        self, session_id: str, sections: Sequence[str], history_limit: int = 50
+    ) -> Dict[str, Any]:
+        await self._read_your_writes()
+        return await self._call(Storage.get_session_dashboard, session_id, sections, history_limit=history_limit)
+
+    async def get_weak_topics(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        return await self._call(Storage.get_weak_topics, session_id, limit=limit)
+
+    async def get_roadmap_tasks(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._call(Storage.get_roadmap_tasks, session_id)
+
+    async def update_task_status(self, session_id: str, task_id: int, status: str) -> bool:
+        return await self._call(Storage.update_task_status, session_id, task_id, status)
+
+    async def update_concept_mastery(self, session_id: str, concept: str, correct: int, total: int) -> Dict[str, Any]:
+        return await self._call(Storage.update_concept_mastery, session_id, concept, correct, total)
+
+    async def get_concept_mastery(self, session_id: str, concept: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._call(Storage.get_concept_mastery, session_id, concept)
+
+    async def get_due_reviews(self, session_id: str, limit: int = 20) -> Dict[str, Any]:
+        return await self._call(Storage.get_due_reviews, session_id, limit=limit)
+
+    async def list_archives(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._call(retention.list_archives, session_id)
+
+    async def rehydrate_archive(self, session_id: str, chunk_id: Optional[int] = None) -> Dict[str, int]:
+        return await self._call(retention.rehydrate, session_id, chunk_id=chunk_id)
+
+    async def get_concept_difficulty(self, limit: int = 20, min_answers: int = 1) -> List[Dict[str, Any]]:
+        return await self._call(analytics.get_concept_difficulty, limit=limit, min_answers=min_answers)
+
+    async def get_question_difficulty(self, concept: str, limit: int = 20, min_answers: int = 1) -> List[Dict[str, Any]]:
+        return await self._call(analytics.get_question_difficulty, concept, limit=limit, min_answers=min_answers)
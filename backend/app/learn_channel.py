@@ -0,0 +1,231 @@
+"""
+Learn Channel - runs the Learn -> Quiz -> Analyze loop of LearnOrchestrator over one WebSocket
+
+Client messages:
+    {"type": "start", "concept": "...", "session_id": "..."}     teach a concept (session_id optional)
+    {"type": "quiz", "focus_weak_areas": false}                  quiz on the current concept
+    {"type": "answer", "question_id": 1, "selected_index": 0}    grade and record one answer
+    {"type": "analyze"}                                          analyze the quiz now; otherwise this
+                                                                 runs once every question is answered
+Server messages:
+    {"type": "session", "session_id": "..."}
+    {"type": "phase", "phase": "learn" | "quiz" | "analyze"}     a phase has started
+    {"type": "token", "phase": "...", "text": "..."}             LLM output as it is generated (learn, analyze)
+    {"type": "progress", "phase": "quiz", "tokens": 50}          generation progress of the quiz, whose raw
+                                                                 output contains the answer key
+    {"type": "lesson", ...}                                      result of the learn phase
+    {"type": "quiz", "attempt_id": 1, "questions": [...]}        questions without their answers
+    {"type": "answer", "question_id": 1, "is_correct": true, "correct_index": 0, "explanation": "...",
+     "answered": 1, "total": 5}
+    {"type": "analysis", ...} followed by {"type": "mastery", "concept": "...", "mastery": {...}}
+    {"type": "error", "detail": "..."}                           the connection stays usable; rejections
+                                                                 by admission control add "retry_after"
+"""
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .admission import AdmissionController, AdmissionRejected, task_cost
+from .async_storage import AsyncStorage
+from .learn_orchestrator import LearnOrchestrator
+
+# Phases whose LLM output is streamed to the client; the others only report progress
+STREAMED_PHASES = ("learn", "analyze")
+# A progress message is sent every this many tokens
+PROGRESS_EVERY = 25
+
+
+class LearnChannel:
+    """State of one learning session connection.
+
+    Client messages are handled one at a time; the orchestrator phases run in a worker
+    thread and everything sent to the client goes through one queue, so tokens, results and
+    errors always arrive in order.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        orchestrator: LearnOrchestrator,
+        storage: AsyncStorage,
+        admission: Optional[AdmissionController] = None,
+    ):
+        self.websocket = websocket
+        self.orchestrator = orchestrator
+        self.storage = storage
+        self.admission = admission
+        self.session_id: Optional[str] = None
+        # Admission bucket of this connection's calls: the session when the client named an
+        # existing one, otherwise the client address (new sessions must not get a fresh burst)
+        self.admission_key: Optional[str] = None
+        self.concept: Optional[str] = None
+        self.attempt_id: Optional[int] = None
+        self.questions: Dict[int, Dict[str, Any]] = {}
+        self.answered: Set[int] = set()
+        self._outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    async def run(self) -> None:
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    await self._send({"type": "error", "detail": "Messages must be JSON objects"})
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+    async def _send_loop(self) -> None:
+        try:
+            while True:
+                await self.websocket.send_json(await self._outbox.get())
+        except (WebSocketDisconnect, RuntimeError):
+            # The client went away; the receive loop notices and ends the channel
+            return
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        await self._outbox.put(message)
+
+    async def _handle(self, message: Any) -> None:
+        handlers = {"start": self._start, "quiz": self._quiz, "answer": self._answer, "analyze": self._analyze}
+        handler = handlers.get(message.get("type")) if isinstance(message, dict) else None
+        if handler is None:
+            await self._send({"type": "error", "detail": f"Unknown message type, expected one of {sorted(handlers)}"})
+            return
+        try:
+            await handler(message)
+        except AdmissionRejected as e:
+            await self._send({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            await self._send({"type": "error", "detail": str(e)})
+
+    async def _run_phase(
+        self, phase: str, method: Callable[..., Dict[str, Any]], *args: Any, **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Run an orchestrator phase off the event loop, pushing its tokens as they arrive"""
+        if self.admission is not None:
+            # The analyze phase is priced like an analyze task, the others like a tutor call
+            async with self.admission.slot(self.admission_key, task_cost(phase)):
+                return await self._run_phase_now(phase, method, *args, **kwargs)
+        return await self._run_phase_now(phase, method, *args, **kwargs)
+
+    async def _run_phase_now(
+        self, phase: str, method: Callable[..., Dict[str, Any]], *args: Any, **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._send({"type": "phase", "phase": phase})
+        loop = asyncio.get_running_loop()
+
+        def on_token(text: str) -> None:
+            loop.call_soon_threadsafe(self._outbox.put_nowait, {"type": "token", "phase": phase, "text": text})
+
+        tokens = 0
+
+        def on_progress(text: str) -> None:
+            nonlocal tokens
+            tokens += 1
+            if tokens % PROGRESS_EVERY == 0:
+                loop.call_soon_threadsafe(self._outbox.put_nowait, {"type": "progress", "phase": phase, "tokens": tokens})
+
+        callback = on_token if phase in STREAMED_PHASES else on_progress
+        return await asyncio.to_thread(method, *args, on_token=callback, **kwargs)
+
+    async def _start(self, message: Dict[str, Any]) -> None:
+        concept = message.get("concept")
+        if not concept:
+            raise ValueError("concept is required")
+        requested = message.get("session_id") or self.session_id
+        if requested and await self.storage.session_exists(requested):
+            self.admission_key = requested
+        elif self.admission_key is None:
+            client = self.websocket.client
+            self.admission_key = f"client:{client.host if client else 'unknown'}"
+        self.session_id = await self.storage.ensure_session(requested)
+        self.concept = concept
+        self.attempt_id = None
+        await self._send({"type": "session", "session_id": self.session_id})
+        result = await self._run_phase("learn", self.orchestrator.start_learning, self.session_id, concept)
+        await self._send({"type": "lesson", **result})
+
+    async def _quiz(self, message: Dict[str, Any]) -> None:
+        if self.session_id is None or self.concept is None:
+            raise ValueError("Send a start message first")
+        result = await self._run_phase(
+            "quiz",
+            self.orchestrator.generate_concept_quiz,
+            self.session_id,
+            self.concept,
+            focus_weak_areas=bool(message.get("focus_weak_areas")),
+        )
+        questions = [question for question in result.get("questions", []) if question.get("id") is not None]
+        if result.get("attempt_id") is None or not questions:
+            raise ValueError("Quiz generation failed")
+        self.attempt_id = result["attempt_id"]
+        self.questions = {question["id"]: question for question in questions}
+        self.answered = set()
+        # Answers are graded here, so the client only gets them with each graded answer
+        hidden = ("correct_index", "explanation")
+        await self._send(
+            {
+                "type": "quiz",
+                "attempt_id": self.attempt_id,
+                "concept": self.concept,
+                "questions": [{k: v for k, v in question.items() if k not in hidden} for question in questions],
+            }
+        )
+
+    async def _answer(self, message: Dict[str, Any]) -> None:
+        if self.attempt_id is None:
+            raise ValueError("There is no open quiz")
+        question = self.questions.get(message.get("question_id"))
+        if question is None:
+            raise ValueError("Unknown question_id")
+        selected_index = message.get("selected_index")
+        options = question.get("options") or []
+        if not isinstance(selected_index, int) or not 0 <= selected_index < len(options):
+            raise ValueError("selected_index is out of range")
+        is_correct = selected_index == question.get("correct_index")
+        recorded = await self.storage.record_quiz_answer(
+            self.session_id,
+            self.attempt_id,
+            question["id"],
+            selected_index,
+            options[selected_index],
+            is_correct,
+            confidence=message.get("confidence"),
+        )
+        if not recorded:
+            raise ValueError("Failed to record answer")
+        self.answered.add(question["id"])
+        await self._send(
+            {
+                "type": "answer",
+                "question_id": question["id"],
+                "is_correct": is_correct,
+                "correct_index": question.get("correct_index"),
+                "explanation": question.get("explanation"),
+                "answered": len(self.answered),
+                "total": len(self.questions),
+            }
+        )
+        if len(self.answered) == len(self.questions):
+            await self._analyze({})
+
+    async def _analyze(self, message: Dict[str, Any]) -> None:
+        if self.attempt_id is None:
+            raise ValueError("There is no open quiz")
+        result = await self._run_phase(
+            "analyze", self.orchestrator.analyze_quiz_results, self.session_id, self.attempt_id, self.concept
+        )
+        if "error" in result:
+            raise ValueError(result["error"])
+        # Mastery is updated once per attempt
+        self.attempt_id = None
+        await self._send({"type": "analysis", **result})
+        await self._send({"type": "mastery", "concept": self.concept, "mastery": result["mastery"]})
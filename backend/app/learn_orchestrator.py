@@ -1,12 +1,30 @@
 """
 Learn Orchestrator - Manages the Learn -> Quiz -> Analyze -> Re-quiz flow for concept mastery
 """
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from .agent import StudyAgent
 from .storage import Storage
 from .memory import FAISSMemory
 
 
+# Largest number of items scored by one score_quiz_batch call
+MAX_BATCH_ITEMS = 500
+
+
+def _wrong_questions(attempt: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The answered questions of an attempt that were answered incorrectly"""
+    wrong_questions = []
+    for q in attempt.get("questions", []):
+        answer = q.get("answer")
+        if answer and not answer.get("is_correct"):
+            wrong_questions.append({
+                "question": q.get("question"),
+                "correct_answer": q.get("options", [])[q.get("correct_index", 0)] if q.get("correct_index") is not None else "Unknown",
+                "user_answer": answer.get("selected_option", "No answer"),
+            })
+    return wrong_questions
+
+
 class LearnOrchestrator:
     """Orchestrates the complete learning journey for a specific concept"""
     
@@ -15,10 +33,13 @@ class LearnOrchestrator:
         self.storage = storage
         self.memory = memory
     
-    def start_learning(self, session_id: str, concept: str) -> Dict[str, Any]:
+    def start_learning(
+        self, session_id: str, concept: str, on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Phase 1: Learn
         Automatically prompt the tutor to teach the concept
+        ``on_token`` receives the lesson text as it is generated (all phases take it)
         """
         # Ensure session exists
         session_id = self.storage.ensure_session(session_id)
@@ -31,7 +52,8 @@ class LearnOrchestrator:
             task="tutor",
             user_input=teaching_prompt,
             history=[],
-            session_id=session_id
+            session_id=session_id,
+            on_token=on_token
         )
         
         return {
@@ -43,7 +65,13 @@ class LearnOrchestrator:
             "message": f"✅ Learned about {concept}. Ready to test your knowledge?"
         }
     
-    def generate_concept_quiz(self, session_id: str, concept: str, focus_weak_areas: bool = False) -> Dict[str, Any]:
+    def generate_concept_quiz(
+        self,
+        session_id: str,
+        concept: str,
+        focus_weak_areas: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
         """
         Phase 2: Quiz
         Generate quiz questions for the concept
@@ -64,7 +92,8 @@ class LearnOrchestrator:
             task="quiz",
             user_input=quiz_prompt,
             history=[],
-            session_id=session_id
+            session_id=session_id,
+            on_token=on_token
         )
         
         quiz_output = result.get("output", {})
@@ -81,14 +110,21 @@ class LearnOrchestrator:
             "message": f"📝 Quiz generated for {concept}. Answer the questions to assess your understanding."
         }
     
-    def analyze_quiz_results(self, session_id: str, attempt_id: int, concept: str) -> Dict[str, Any]:
+    def analyze_quiz_results(
+        self,
+        session_id: str,
+        attempt_id: int,
+        concept: str,
+        run_id: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
         """
         Phase 3: Analyze
         Analyze the quiz results, identify weak areas in this concept
+        Passing the run_id of a failed call resumes its analysis instead of regenerating it
         """
-        # Get quiz history for this attempt
-        quiz_history = self.storage.get_quiz_history(session_id)
-        current_attempt = next((q for q in quiz_history if q.get("attempt_id") == attempt_id), None)
+        # Load just this attempt, with its questions and answers
+        current_attempt = self.storage.get_quiz_attempt(session_id, attempt_id)
         
         if not current_attempt:
             return {"error": "Quiz attempt not found"}
@@ -105,16 +141,7 @@ class LearnOrchestrator:
         )
         
         # Get the questions and analyze wrong answers
-        questions = current_attempt.get("questions", [])
-        wrong_questions = []
-        for q in questions:
-            answer = q.get("answer")
-            if answer and not answer.get("is_correct"):
-                wrong_questions.append({
-                    "question": q.get("question"),
-                    "correct_answer": q.get("options", [])[q.get("correct_index", 0)] if q.get("correct_index") is not None else "Unknown",
-                    "user_answer": answer.get("selected_option", "No answer"),
-                })
+        wrong_questions = _wrong_questions(current_attempt)
         
         # Use LLM to analyze weak areas
         if wrong_questions:
@@ -133,7 +160,9 @@ Format as bullet points with brief explanations."""
                 task="analyze",
                 user_input=analysis_prompt,
                 history=[],
-                session_id=session_id
+                session_id=session_id,
+                run_id=run_id,
+                on_token=on_token
             )
             
             analysis_summary = result.get("output", {}).get("summary", "Review the incorrect answers")
@@ -152,9 +181,65 @@ Format as bullet points with brief explanations."""
             "wrong_questions": wrong_questions,
             "needs_practice": needs_practice,
             "next_action": "focused_quiz" if needs_practice else "complete",
+            "run_id": result.get("meta", {}).get("run_id") if wrong_questions else None,
             "message": f"📊 Analysis complete. Mastery: {mastery_data['mastery_score']:.1f}%"
         }
     
+    def score_quiz_batch(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Batch scoring, e.g. a teacher grading a whole class.
+        Each item has session_id and concept plus either attempt_id (scored from the stored
+        answers) or correct/total. Attempts load in three queries and all mastery updates
+        commit in one transaction; no LLM analysis is run.
+        """
+        attempts = self.storage.get_quiz_attempts([item["attempt_id"] for item in items if item.get("attempt_id")])
+        results = []
+        # Several grades of a concept in one batch count as a single spaced-repetition review
+        reviews: Dict[Tuple[str, str], List[Any]] = {}
+        with self.storage.unit_of_work() as uow:
+            for item in items:
+                session_id, concept, attempt_id = item["session_id"], item["concept"], item.get("attempt_id")
+                result: Dict[str, Any] = {"session_id": session_id, "concept": concept, "attempt_id": attempt_id}
+                if attempt_id:
+                    attempt = attempts.get(attempt_id)
+                    if not attempt or attempt["session_id"] != session_id:
+                        results.append({**result, "error": "Quiz attempt not found"})
+                        continue
+                    correct, total = attempt.get("correct_count", 0), attempt.get("total_questions", 0)
+                    result["wrong_questions"] = _wrong_questions(attempt)
+                elif item.get("total"):
+                    correct, total = item.get("correct") or 0, item["total"]
+                else:
+                    results.append({**result, "error": "attempt_id or total is required"})
+                    continue
+                mastery = uow.update_concept_mastery(session_id, concept, correct, total, review=False)
+                review = reviews.setdefault((session_id, concept), [0, 0, []])
+                review[0] += correct
+                review[1] += total
+                review[2].append(mastery)
+                results.append({
+                    **result,
+                    "correct": correct,
+                    "total": total,
+                    "mastery": mastery,
+                    "needs_practice": mastery["mastery_score"] < 80.0,
+                })
+            for (session_id, concept), (correct, total, masteries) in reviews.items():
+                if not total:
+                    continue
+                next_review = uow.schedule_review(session_id, concept, correct, total)
+                for mastery in masteries:
+                    mastery["next_review"] = next_review
+        scored = [r for r in results if "error" not in r]
+        return {
+            "results": results,
+            "scored": len(scored),
+            "failed": len(results) - len(scored),
+            "average_accuracy": (
+                sum(r["correct"] / max(r["total"], 1) for r in scored) / len(scored) if scored else 0
+            ),
+        }
+    
     def get_learning_progress(self, session_id: str, concept: Optional[str] = None) -> Dict[str, Any]:
         """Get complete learning progress for a concept or all concepts"""
         masteries = self.storage.get_concept_mastery(session_id, concept)
@@ -192,11 +277,12 @@ Format as bullet points with brief explanations."""
                 "message": message
             }
         else:
-            # Get overview of all concepts
+            # Get overview of all concepts; the bucket counts are maintained on write
+            stats = self.storage.get_session_stats(session_id) or {}
             return {
                 "concepts": masteries,
-                "total_concepts": len(masteries),
-                "mastered": len([m for m in masteries if m["mastery_score"] >= 90]),
-                "in_progress": len([m for m in masteries if 50 <= m["mastery_score"] < 90]),
-                "needs_work": len([m for m in masteries if m["mastery_score"] < 50]),
+                "total_concepts": stats.get("total_concepts", 0),
+                "mastered": stats.get("mastered_concepts", 0),
+                "in_progress": stats.get("in_progress_concepts", 0),
+                "needs_work": stats.get("needs_work_concepts", 0),
             }
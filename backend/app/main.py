@@ -1,22 +1,66 @@
+import asyncio
+import math
 import os
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 import uvicorn
 
+from .admission import AdmissionController, AdmissionRejected, task_cost
 from .memory import FAISSMemory
 from .agent import StudyAgent
-from .models import AgentRequest, AgentResponse, QuizAnswerSubmission, TaskStatusUpdate
-from .storage import Storage
-from .orchestrator import AgenticOrchestrator
-from .learn_orchestrator import LearnOrchestrator
+from .models import (
+    AgentRequest,
+    AgentResponse,
+    ArchiveRehydrateRequest,
+    QuizBatchRequest,
+    QuizAnswerSubmission,
+    QuizAnswersSubmission,
+    TaskStatusUpdate,
+)
+from .storage import DASHBOARD_SECTIONS, Storage
+from .async_storage import AsyncStorage
+from .responses import FastJSONResponse
+from .orchestrator import AgenticOrchestrator, recommend_next_action, summarize_quiz_performance
+from .learn_orchestrator import MAX_BATCH_ITEMS, LearnOrchestrator
+from .learn_channel import LearnChannel
 
 ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 CHAT_DB = os.path.join(DATA_DIR, "chat.db")
+CHECKPOINT_DB = os.path.join(DATA_DIR, "checkpoints.db")
 OLLAMA_MODEL = "llama3.2"
+# Number of uvicorn worker processes (uvicorn reads the same variable). With more than one
+# worker the FAISS memory files are shared through file locks and reloaded on change.
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# SQLite engine profile from storage.ENGINE_PROFILES ("production" enables WAL and tuned pragmas)
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "production")
+# Per-session read cache entries; each entry is checked against the read's version in the
+# database, so writes of other workers and scripts invalidate it as well
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", "1000"))
+# ETag / If-None-Match on the history, roadmap, weak-topic and mastery reads, versioned by
+# the same read_versions rows as the cache
+CONDITIONAL_GETS = os.environ.get("CONDITIONAL_GETS", "1") == "1"
+# Responses at least this large (bytes) are gzip-compressed for clients that accept it
+GZIP_MINIMUM_SIZE = int(os.environ.get("GZIP_MINIMUM_SIZE", "1024"))
+# Admission control of agent (LLM) calls, per worker process: concurrent calls the Ollama
+# backend serves, per-session rate (bucket tokens per minute, roadmaps cost 3 and analyses 2),
+# burst, in-flight calls per session, and how many admitted calls may wait for a slot
+AGENT_CONCURRENCY = int(os.environ.get("AGENT_CONCURRENCY", "2"))
+AGENT_RATE_PER_MINUTE = float(os.environ.get("AGENT_RATE_PER_MINUTE", "30"))
+AGENT_BURST = int(os.environ.get("AGENT_BURST", "10"))
+AGENT_MAX_IN_FLIGHT_PER_SESSION = int(os.environ.get("AGENT_MAX_IN_FLIGHT_PER_SESSION", "2"))
+AGENT_MAX_QUEUE = int(os.environ.get("AGENT_MAX_QUEUE", "100"))
+AGENT_QUEUE_TIMEOUT = float(os.environ.get("AGENT_QUEUE_TIMEOUT", "60"))
+# Queue chat messages and insert them in batches off the request path ("1" to enable)
+MESSAGE_WRITE_BEHIND = os.environ.get("MESSAGE_WRITE_BEHIND", "0") == "1"
+MESSAGE_FLUSH_INTERVAL = float(os.environ.get("MESSAGE_FLUSH_INTERVAL", "0.5"))
+# "batched" or "fsync" (every flushed batch is synced to disk)
+MESSAGE_DURABILITY = os.environ.get("MESSAGE_DURABILITY", "batched")
 
 app = FastAPI(title="Agentic Study Buddy", version="0.1.0")
 
@@ -28,12 +72,82 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-memory = FAISSMemory(data_dir=DATA_DIR, embed_model=OLLAMA_MODEL)
-storage = Storage(f"sqlite:///{CHAT_DB}")
-agent = StudyAgent(memory=memory, model=OLLAMA_MODEL, storage=storage)
+# Level 6 keeps most of the size reduction of 9 at a fraction of the CPU time
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=6)
+
+memory = FAISSMemory(data_dir=DATA_DIR, embed_model=OLLAMA_MODEL, shared=WORKERS > 1)
+storage = Storage(
+    f"sqlite:///{CHAT_DB}",
+    profile=STORAGE_PROFILE,
+    write_behind=MESSAGE_WRITE_BEHIND,
+    flush_interval=MESSAGE_FLUSH_INTERVAL,
+    durability=MESSAGE_DURABILITY,
+    cache_size=READ_CACHE_SIZE,
+)
+agent = StudyAgent(memory=memory, model=OLLAMA_MODEL, storage=storage, checkpoint_path=CHECKPOINT_DB)
 orchestrator = AgenticOrchestrator(agent=agent, storage=storage, memory=memory)
 learn_orchestrator = LearnOrchestrator(agent=agent, storage=storage, memory=memory)
+# Request handlers await this so database reads never block the event loop; the agent and
+# orchestrators keep the sync storage
+async_storage = AsyncStorage(storage)
+admission = AdmissionController(
+    capacity=AGENT_CONCURRENCY,
+    rate_per_minute=AGENT_RATE_PER_MINUTE,
+    burst=AGENT_BURST,
+    max_in_flight_per_session=AGENT_MAX_IN_FLIGHT_PER_SESSION,
+    max_queue=AGENT_MAX_QUEUE,
+    queue_timeout=AGENT_QUEUE_TIMEOUT,
+)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    retry_after = math.ceil(exc.retry_after)
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail, "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def _admission_key(request: Request, session_id: Optional[str]) -> str:
+    # Only existing sessions get their own bucket: unknown ids start a new session, so keying
+    # by them would hand out a fresh burst per call. Those calls are limited per client address.
+    if session_id and await async_storage.session_exists(session_id):
+        return session_id
+    return f"client:{request.client.host if request.client else 'unknown'}"
+
+
+@app.on_event("shutdown")
+async def flush_storage():
+    # Write any messages still queued by write-behind mode before the process exits
+    await async_storage.close()
+
+
+def _fast_json(content: dict, response: Optional[Response] = None) -> FastJSONResponse:
+    """Serialize ``content`` straight to JSON with orjson, keeping the headers set on ``response``.
+
+    For large payloads built by Storage, which are already plain JSON types: returning a
+    response skips FastAPI's jsonable_encoder pass and any response model validation.
+    """
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
+
+async def _not_modified(request: Request, response: Response, session_id: str, *reads: str) -> Optional[Response]:
+    """A 304 response when the client's ETag still matches these reads of the session.
+
+    Otherwise the current ETag is set on ``response`` and None is returned; the version is
+    taken before the handler loads the data, so the ETag can only be older than the body.
+    """
+    if not CONDITIONAL_GETS:
+        return None
+    etag = await async_storage.data_version(session_id, reads)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 
 @app.get("/api/health")
@@ -51,31 +165,57 @@ async def ingest_memory(texts: Optional[List[str]] = Form(default=None), file: O
         payload_texts.append(content)
     if not payload_texts:
         return {"added": 0, "ids": []}
-    ids = memory.add_texts(payload_texts)
+    # Embedding calls Ollama; keep it off the event loop
+    ids = await asyncio.to_thread(memory.add_texts, payload_texts)
     return {"added": len(ids), "ids": ids}
 
 
 @app.post("/api/agent", response_model=AgentResponse)
-async def run_agent(req: AgentRequest):
+async def run_agent(req: AgentRequest, request: Request):
     history = [m.dict() for m in (req.history or [])]
-    result = agent.run(task=req.task, user_input=req.input, history=history, session_id=req.session_id)
+    async with admission.slot(await _admission_key(request, req.session_id), task_cost(req.task)):
+        # The agent blocks on the LLM; run it off the event loop
+        result = await asyncio.to_thread(
+            agent.run,
+            task=req.task,
+            user_input=req.input,
+            history=history,
+            session_id=req.session_id,
+            run_id=req.run_id,
+        )
     response = AgentResponse(task=req.task, output=result["output"], meta=result.get("meta", {}))
     response.session_id = result.get("session_id")
     return response
 
 
-@app.get("/api/history")
-async def read_history(session_id: str):
+@app.get("/api/history", response_class=FastJSONResponse)
+async def read_history(
+    request: Request,
+    response: Response,
+    session_id: str,
+    limit: Optional[int] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
-    return {"session_id": session_id, "messages": storage.get_history(session_id)}
+    not_modified = await _not_modified(request, response, session_id, "get_history")
+    if not_modified is not None:
+        return not_modified
+    messages = await async_storage.get_history(session_id, limit=limit, before_id=before_id, after_id=after_id)
+    # Cursor for loading the page of older messages
+    next_before_id = messages[0]["id"] if limit and after_id is None and len(messages) == limit else None
+    return _fast_json({"session_id": session_id, "messages": messages, "next_before_id": next_before_id}, response)
 
 
 @app.get("/api/weak-topics")
-async def read_weak_topics(session_id: str):
+async def read_weak_topics(request: Request, response: Response, session_id: str):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
-    return {"session_id": session_id, "weak_topics": storage.get_weak_topics(session_id)}
+    not_modified = await _not_modified(request, response, session_id, "get_weak_topics")
+    if not_modified is not None:
+        return not_modified
+    return {"session_id": session_id, "weak_topics": await async_storage.get_weak_topics(session_id)}
 
 
 @app.get("/api/analysis")
@@ -84,37 +224,62 @@ async def get_analysis(session_id: str):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
     # Get the most recent analysis message
-    history = storage.get_history(session_id)
-    for msg in reversed(history):
-        if msg.get("task") == "analyze" and msg.get("role") == "assistant":
-            return {"session_id": session_id, "summary": msg.get("content", ""), "timestamp": msg.get("timestamp")}
+    msg = await async_storage.get_latest_message(session_id, task="analyze", role="assistant")
+    if msg:
+        return {"session_id": session_id, "summary": msg.get("content", ""), "timestamp": msg.get("created_at")}
     return {"session_id": session_id, "summary": None}
 
 
-@app.get("/api/quiz-history")
-async def read_quiz_history(session_id: str):
+@app.get("/api/citations")
+async def read_citations(session_id: str, message_id: Optional[int] = None, attempt_id: Optional[int] = None):
+    """Resolve the retrieved sources of a message or quiz attempt into texts and metadata"""
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
-    return {"session_id": session_id, "quiz_history": storage.get_quiz_history(session_id)}
+    if (message_id is None) == (attempt_id is None):
+        raise HTTPException(status_code=400, detail="Exactly one of message_id or attempt_id is required")
+    if message_id is not None:
+        record = await async_storage.get_message(session_id, message_id)
+    else:
+        record = await async_storage.get_quiz_attempt(session_id, attempt_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Message or quiz attempt not found")
+    refs = record["meta"].get("retrieved", [])
+    return {"session_id": session_id, "citations": await asyncio.to_thread(memory.resolve_refs, refs)}
+
+
+@app.get("/api/quiz-history", response_class=FastJSONResponse)
+async def read_quiz_history(
+    session_id: str, limit: Optional[int] = None, before_id: Optional[int] = None, summary: bool = False
+):
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    history = await async_storage.get_quiz_history(
+        session_id, limit=limit, before_id=before_id, include_questions=not summary
+    )
+    next_before_id = history[-1]["attempt_id"] if limit and len(history) == limit else None
+    return _fast_json({"session_id": session_id, "quiz_history": history, "next_before_id": next_before_id})
 
 
 @app.get("/api/roadmap")
-async def read_roadmap(session_id: str):
+async def read_roadmap(request: Request, response: Response, session_id: str):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
-    return {"session_id": session_id, "tasks": storage.get_roadmap_tasks(session_id)}
+    not_modified = await _not_modified(request, response, session_id, "get_roadmap_tasks")
+    if not_modified is not None:
+        return not_modified
+    return {"session_id": session_id, "tasks": await async_storage.get_roadmap_tasks(session_id)}
 
 
 @app.post("/api/roadmap/task-status")
 async def update_task_status(payload: TaskStatusUpdate):
-    if not storage.update_task_status(payload.session_id, payload.task_id, payload.status):
+    if not await async_storage.update_task_status(payload.session_id, payload.task_id, payload.status):
         raise HTTPException(status_code=400, detail="Task not found or invalid status")
     return {"status": "ok"}
 
 
 @app.post("/api/quiz-answer")
 async def submit_quiz_answer(payload: QuizAnswerSubmission):
-    if not storage.record_quiz_answer(
+    if not await async_storage.record_quiz_answer(
         payload.session_id,
         payload.attempt_id,
         payload.question_id,
@@ -128,14 +293,32 @@ async def submit_quiz_answer(payload: QuizAnswerSubmission):
     return {"status": "ok"}
 
 
+@app.post("/api/quiz-answers")
+async def submit_quiz_answers(payload: QuizAnswersSubmission):
+    """Record all answers of a quiz in one request; resubmitted questions replace earlier answers"""
+    correct_count = await async_storage.record_quiz_answers(
+        payload.session_id, payload.attempt_id, [answer.dict() for answer in payload.answers]
+    )
+    if correct_count is None:
+        raise HTTPException(status_code=400, detail="Failed to record answers")
+    return {"status": "ok", "recorded": len(payload.answers), "correct_count": correct_count}
+
+
 @app.get("/api/recommendations")
 async def get_recommendations(session_id: str):
     """Get AI-powered learning recommendations based on progress"""
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
     try:
-        next_action = orchestrator.get_next_recommended_action(session_id)
-        performance = orchestrator.analyze_quiz_performance(session_id)
+        state = await async_storage.get_learning_state(session_id)
+        stats = await async_storage.get_session_stats(session_id)
+        next_action = recommend_next_action(
+            state["message_count"],
+            state["quiz_attempts"],
+            state["weak_topics"],
+            state["last_analysis_id"] is not None,
+        )
+        performance = summarize_quiz_performance(stats["recent_attempts"] if stats else [])
         return {
             "session_id": session_id,
             "next_action": next_action,
@@ -145,22 +328,45 @@ async def get_recommendations(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/session-dashboard", response_class=FastJSONResponse)
+async def read_session_dashboard(session_id: str, include: Optional[str] = None, history_limit: int = 50):
+    """Everything a page needs in one request; ``include`` is a comma-separated list of sections"""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    sections = [name.strip() for name in include.split(",") if name.strip()] if include else list(DASHBOARD_SECTIONS)
+    unknown = set(sections) - set(DASHBOARD_SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}")
+    data = await async_storage.get_session_dashboard(session_id, sections, history_limit=history_limit)
+    inputs = data.pop("recommendation_inputs", None)
+    if inputs is not None:
+        data["recommendations"] = {
+            "next_action": recommend_next_action(
+                inputs["message_count"], inputs["quiz_attempts"], inputs["weak_topics"], inputs["has_analysis"]
+            ),
+            "performance": summarize_quiz_performance(inputs["recent_attempts"]),
+        }
+    return _fast_json({"session_id": session_id, **data})
+
+
 @app.post("/api/learn/start")
-async def start_learning_concept(payload: dict):
+async def start_learning_concept(payload: dict, request: Request):
     """Start learning a concept - Phase 1: Teaching"""
     session_id = payload.get("session_id")
     concept = payload.get("concept")
     if not session_id or not concept:
         raise HTTPException(status_code=400, detail="session_id and concept are required")
     try:
-        result = learn_orchestrator.start_learning(session_id, concept)
-        return result
+        async with admission.slot(await _admission_key(request, session_id), task_cost("tutor")):
+            return await asyncio.to_thread(learn_orchestrator.start_learning, session_id, concept)
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/learn/quiz")
-async def generate_learning_quiz(payload: dict):
+async def generate_learning_quiz(payload: dict, request: Request):
     """Generate quiz for concept - Phase 2: Quiz"""
     session_id = payload.get("session_id")
     concept = payload.get("concept")
@@ -168,14 +374,16 @@ async def generate_learning_quiz(payload: dict):
     if not session_id or not concept:
         raise HTTPException(status_code=400, detail="session_id and concept are required")
     try:
-        result = learn_orchestrator.generate_concept_quiz(session_id, concept, focus_weak)
-        return result
+        async with admission.slot(await _admission_key(request, session_id), task_cost("quiz")):
+            return await asyncio.to_thread(learn_orchestrator.generate_concept_quiz, session_id, concept, focus_weak)
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/learn/analyze")
-async def analyze_learning_quiz(payload: dict):
+async def analyze_learning_quiz(payload: dict, request: Request):
     """Analyze quiz results - Phase 3: Analysis"""
     session_id = payload.get("session_id")
     attempt_id = payload.get("attempt_id")
@@ -183,8 +391,33 @@ async def analyze_learning_quiz(payload: dict):
     if not session_id or not attempt_id or not concept:
         raise HTTPException(status_code=400, detail="session_id, attempt_id, and concept are required")
     try:
-        result = learn_orchestrator.analyze_quiz_results(session_id, attempt_id, concept)
-        return result
+        async with admission.slot(await _admission_key(request, session_id), task_cost("analyze")):
+            return await asyncio.to_thread(
+                learn_orchestrator.analyze_quiz_results, session_id, attempt_id, concept, run_id=payload.get("run_id")
+            )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.websocket("/ws/learn")
+async def learn_socket(websocket: WebSocket):
+    """Learn -> Quiz -> Analyze over one connection, with pushed tokens, questions and mastery
+    (protocol in app/learn_channel.py)"""
+    await websocket.accept()
+    await LearnChannel(websocket, learn_orchestrator, async_storage, admission=admission).run()
+
+
+@app.post("/api/learn/analyze-batch")
+async def analyze_learning_quiz_batch(payload: QuizBatchRequest):
+    """Score many quiz attempts or grades at once and update concept mastery (no LLM analysis)"""
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(payload.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+    try:
+        return await asyncio.to_thread(learn_orchestrator.score_quiz_batch, [item.dict() for item in payload.items])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -195,19 +428,70 @@ async def get_learning_progress(session_id: str, concept: Optional[str] = None):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
     try:
-        result = learn_orchestrator.get_learning_progress(session_id, concept)
-        return result
+        return await asyncio.to_thread(learn_orchestrator.get_learning_progress, session_id, concept)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/reviews/due")
+async def read_due_reviews(session_id: str, limit: int = 20):
+    """Concepts due for spaced-repetition review, most overdue first"""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    return {"session_id": session_id, **await async_storage.get_due_reviews(session_id, limit=limit)}
+
+
+@app.get("/api/analytics/difficulty")
+async def read_difficulty(concept: Optional[str] = None, limit: int = 20, min_answers: int = 1):
+    """Hardest concepts across all sessions, or the hardest questions of one concept.
+
+    Reads the results of the last scripts/compute_difficulty.py run.
+    """
+    if concept:
+        questions = await async_storage.get_question_difficulty(concept, limit=limit, min_answers=min_answers)
+        return {"concept": concept, "questions": questions}
+    return {"concepts": await async_storage.get_concept_difficulty(limit=limit, min_answers=min_answers)}
+
+
+@app.get("/api/cache-stats")
+async def read_cache_stats():
+    """Hit-rate metrics of the storage read cache"""
+    stats = async_storage.cache_stats()
+    return {"enabled": stats is not None, **(stats or {})}
+
+
+@app.get("/api/admission-stats")
+async def read_admission_stats():
+    """Agent capacity in use and per-session admission counters of this worker"""
+    return admission.stats()
+
+
+@app.get("/api/archives")
+async def read_archives(session_id: str):
+    """List the archived message and quiz chunks of a session"""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    return {"session_id": session_id, "archives": await async_storage.list_archives(session_id)}
+
+
+@app.post("/api/archives/rehydrate")
+async def rehydrate_archives(payload: ArchiveRehydrateRequest):
+    """Move archived messages and quiz details back into the live tables"""
+    restored = await async_storage.rehydrate_archive(payload.session_id, chunk_id=payload.chunk_id)
+    return {"status": "ok", "session_id": payload.session_id, "restored": restored}
+
+
 @app.get("/api/mastery")
-async def get_concept_mastery(session_id: str):
+async def get_concept_mastery(request: Request, response: Response, session_id: str):
     """Get all concept mastery data"""
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
-    return {"session_id": session_id, "masteries": storage.get_concept_mastery(session_id)}
+    not_modified = await _not_modified(request, response, session_id, "get_concept_mastery")
+    if not_modified is not None:
+        return not_modified
+    return {"session_id": session_id, "masteries": await async_storage.get_concept_mastery(session_id)}
 
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="127.0.0.1", port=8001, reload=True)
+    # Auto-reload only works with a single worker process
+    uvicorn.run("app.main:app", host="127.0.0.1", port=8001, reload=WORKERS == 1, workers=WORKERS)
@@ -1,7 +1,10 @@
 import os
 import json
 import uuid
-from typing import List, Dict, Any, Tuple, Optional
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Optional, NamedTuple
 
 import faiss  # type: ignore
 import numpy as np
@@ -9,39 +12,125 @@ import numpy as np
 from .utils.ollama_client import OllamaClient
 
 
+def retrieval_refs(retrieved: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact form of retrieved chunks for message and attempt meta: doc id and score only.
+
+    The texts stay in the memory and are resolved with ``FAISSMemory.resolve_refs`` when a
+    client asks for citations. Entries without a doc id (logged before refs) are kept whole.
+    """
+    return [
+        {"doc_id": item["doc_id"], "score": round(float(item["score"]), 4)} if item.get("doc_id") else item
+        for item in retrieved
+    ]
+
+
+class _Snapshot(NamedTuple):
+    """Immutable view of the index; readers grab one reference and never see partial writes"""
+
+    index: Any
+    ids: List[str]
+    metadata: Dict[str, Dict[str, Any]]
+
+
+class _PendingWrite:
+    __slots__ = ("vectors", "entries", "done", "error")
+
+    def __init__(self, vectors: np.ndarray, entries: Dict[str, Dict[str, Any]]):
+        self.vectors = vectors
+        self.entries = entries
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
 class FAISSMemory:
-    def __init__(self, data_dir: str, embed_model: str = "llama3"):
+    """FAISS-backed vector memory persisted to ``data_dir``.
+
+    Searches run lock-free against the current immutable snapshot, so many threads can
+    search at once (FAISS releases the GIL inside ``search``). Writers queue their vectors;
+    whichever writer holds the write lock applies every queued batch to a copy of the
+    index, saves it, and swaps the new snapshot in with a single assignment.
+
+    With ``shared=True`` several processes (e.g. uvicorn workers) can use the same
+    files: writes take an exclusive file lock and re-read the on-disk state before
+    appending, and every process reloads when another one has saved a newer version.
+    """
+
+    def __init__(self, data_dir: str, embed_model: str = "llama3", shared: bool = False):
         os.makedirs(data_dir, exist_ok=True)
         self.index_path = os.path.join(data_dir, "memory.index")
         self.meta_path = os.path.join(data_dir, "memory_meta.json")
+        self.lock_path = os.path.join(data_dir, "memory.lock")
         self.client = OllamaClient(model=embed_model)
-        self.dimension = None
-        self.index = None
-        self.metadata: Dict[str, Dict[str, Any]] = {}
-        self._load()
+        self.shared = shared
+        self._snapshot = _Snapshot(None, [], {})
+        self._loaded_stamp: Optional[Tuple[int, int, int]] = None
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: List[_PendingWrite] = []
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @property
+    def metadata(self) -> Dict[str, Dict[str, Any]]:
+        return self._snapshot.metadata
+
+    @property
+    def dimension(self) -> Optional[int]:
+        index = self._snapshot.index
+        return index.d if index is not None else None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if not self.shared:
+            yield
+            return
+        with open(self.lock_path, "a") as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _disk_stamp(self) -> Optional[Tuple[int, int, int]]:
+        # Saves replace the metadata file, so a new inode/mtime means another process wrote
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _refresh_if_stale(self) -> None:
+        """Reload from disk when another process has saved since our last load (caller holds the lock)"""
+        if self.shared and self._disk_stamp() != self._loaded_stamp:
+            self._load()
 
     def _load(self) -> None:
+        stamp = self._disk_stamp()
+        metadata: Dict[str, Dict[str, Any]] = {}
+        index = None
         if os.path.exists(self.meta_path):
             with open(self.meta_path, "r") as f:
-                self.metadata = json.load(f)
+                metadata = json.load(f)
         if os.path.exists(self.index_path):
-            self.index = faiss.read_index(self.index_path)
-            # Infer dimension
-            self.dimension = self.index.d
-        else:
-            self.index = None
-
-    def _save(self) -> None:
-        if self.index is not None:
-            faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "w") as f:
-            json.dump(self.metadata, f)
-
-    def _ensure_index(self, dim: int) -> None:
-        if self.index is None:
-            self.dimension = dim
-            # Using cosine similarity via inner product with normalized vectors
-            self.index = faiss.IndexFlatIP(dim)
+            index = faiss.read_index(self.index_path)
+        # faiss index stores in insertion order; metadata keys keep the same order
+        self._snapshot = _Snapshot(index, list(metadata.keys()), metadata)
+        self._loaded_stamp = stamp
+
+    def _save(self, snapshot: _Snapshot) -> None:
+        # Write to temporary files and rename so readers never see a partially written file;
+        # the index goes first because the metadata file is the change signal for other workers
+        if snapshot.index is not None:
+            faiss.write_index(snapshot.index, self.index_path + ".tmp")
+            os.replace(self.index_path + ".tmp", self.index_path)
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump(snapshot.metadata, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        self._loaded_stamp = self._disk_stamp()
 
     def _embed(self, text: str) -> np.ndarray:
         vec = np.array(self.client.embeddings(text), dtype=np.float32)
@@ -51,36 +140,111 @@ class FAISSMemory:
         faiss.normalize_L2(vec)
         return vec
 
+    def _apply_pending(self) -> None:
+        """Apply every queued write as one new snapshot (caller holds the write lock)"""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with self._file_lock(exclusive=True):
+                # Append on top of whatever other workers have saved in the meantime
+                self._refresh_if_stale()
+                current = self._snapshot
+                vectors = np.vstack([write.vectors for write in batch])
+                if current.index is None:
+                    # Using cosine similarity via inner product with normalized vectors
+                    index = faiss.IndexFlatIP(vectors.shape[1])
+                else:
+                    # Readers may still be searching the current index, so add to a copy
+                    index = faiss.clone_index(current.index)
+                index.add(vectors)
+                metadata = dict(current.metadata)
+                ids = list(current.ids)
+                for write in batch:
+                    metadata.update(write.entries)
+                    ids.extend(write.entries.keys())
+                snapshot = _Snapshot(index, ids, metadata)
+                self._save(snapshot)
+                self._snapshot = snapshot
+        except BaseException as exc:
+            for write in batch:
+                write.error = exc
+            raise
+        finally:
+            for write in batch:
+                write.done = True
+
     def add_texts(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> List[str]:
         ids: List[str] = []
         vectors = []
         metas = metadatas or [{} for _ in texts]
+        entries: Dict[str, Dict[str, Any]] = {}
         for text, meta in zip(texts, metas):
             v = self._embed(text)
             vectors.append(v)
             doc_id = str(uuid.uuid4())
             ids.append(doc_id)
-            self.metadata[doc_id] = {"text": text, "meta": meta}
+            entries[doc_id] = {"text": text, "meta": meta}
         if not vectors:
             return []
-        vecs = np.vstack(vectors)
-        self._ensure_index(vecs.shape[1])
-        self.index.add(vecs)
-        self._save()
+        write = _PendingWrite(np.vstack(vectors), entries)
+        with self._pending_lock:
+            self._pending.append(write)
+        with self._write_lock:
+            # A concurrent writer may already have applied this batch together with its own
+            if not write.done:
+                self._apply_pending()
+        if write.error is not None:
+            raise write.error
         return ids
 
+    def _current_snapshot(self) -> _Snapshot:
+        if self.shared and self._disk_stamp() != self._loaded_stamp:
+            with self._write_lock, self._file_lock(exclusive=False):
+                self._refresh_if_stale()
+        return self._snapshot
+
+    def get_documents(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored text and metadata of the given documents; unknown ids are left out"""
+        metadata = self._current_snapshot().metadata
+        return {doc_id: metadata[doc_id] for doc_id in doc_ids if doc_id in metadata}
+
+    def resolve_refs(self, refs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Expand ``retrieval_refs`` entries into citations with text and metadata.
+
+        Entries that still carry their text are returned as they are; a ref whose document
+        is no longer in the memory comes back with ``found`` set to False.
+        """
+        documents = self.get_documents([ref["doc_id"] for ref in refs if "text" not in ref and ref.get("doc_id")])
+        citations = []
+        for ref in refs:
+            if "text" in ref:
+                citations.append({"doc_id": ref.get("doc_id"), "found": True, **ref})
+                continue
+            document = documents.get(ref.get("doc_id"))
+            citations.append(
+                {
+                    "doc_id": ref.get("doc_id"),
+                    "score": ref.get("score"),
+                    "text": document["text"] if document else None,
+                    "meta": document.get("meta", {}) if document else {},
+                    "found": document is not None,
+                }
+            )
+        return citations
+
     def similarity_search(self, query: str, k: int = 5) -> List[Tuple[str, float, Dict[str, Any]]]:
-        if self.index is None or len(self.metadata) == 0:
+        snapshot = self._current_snapshot()
+        if snapshot.index is None or len(snapshot.ids) == 0:
             return []
         q = self._embed(query)
-        D, I = self.index.search(q, k)
+        D, I = snapshot.index.search(q, k)
         results: List[Tuple[str, float, Dict[str, Any]]] = []
-        # faiss index stores in insertion order; align ids by list order
-        all_ids = list(self.metadata.keys())
         for idx, score in zip(I[0], D[0]):
-            if idx < 0 or idx >= len(all_ids):
+            if idx < 0 or idx >= len(snapshot.ids):
                 continue
-            doc_id = all_ids[idx]
-            md = self.metadata.get(doc_id, {})
+            doc_id = snapshot.ids[idx]
+            md = snapshot.metadata.get(doc_id, {})
             results.append((doc_id, float(score), md))
         return results
@@ -16,6 +16,8 @@ class AgentRequest(BaseModel):
     history: Optional[List[Message]] = None
     options: Optional[Dict[str, Any]] = None
     session_id: Optional[str] = None
+    # Reuse the run_id of a failed request to resume it from its last completed step
+    run_id: Optional[str] = None
 
 
 class AgentResponse(BaseModel):
@@ -67,3 +69,37 @@ class QuizAnswerSubmission(BaseModel):
     is_correct: bool
     note: Optional[str] = None
     confidence: Optional[float] = None
+
+
+class QuizAnswerItem(BaseModel):
+    question_id: Optional[int]
+    selected_index: Optional[int]
+    selected_option: Optional[str] = None
+    is_correct: bool
+    note: Optional[str] = None
+    confidence: Optional[float] = None
+
+
+class QuizAnswersSubmission(BaseModel):
+    session_id: str
+    attempt_id: int
+    answers: List[QuizAnswerItem]
+
+
+class QuizBatchItem(BaseModel):
+    session_id: str
+    concept: str
+    # Score a stored attempt, or give the grade directly with correct/total
+    attempt_id: Optional[int] = None
+    correct: Optional[int] = None
+    total: Optional[int] = None
+
+
+class QuizBatchRequest(BaseModel):
+    items: List[QuizBatchItem]
+
+
+class ArchiveRehydrateRequest(BaseModel):
+    session_id: str
+    # Restore a single chunk; all archived data of the session when omitted
+    chunk_id: Optional[int] = None
@@ -7,6 +7,93 @@ from .storage import Storage
 from .memory import FAISSMemory
 
 
+def summarize_quiz_performance(recent_attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-topic accuracy, weak areas and recommendations from recent quiz attempt summaries"""
+    if not recent_attempts:
+        return {"weak_areas": [], "recommendations": []}
+    
+    # Calculate per-topic accuracy
+    topic_accuracy = {}
+    for attempt in recent_attempts:
+        topic = attempt.get("topic", "unknown")
+        correct = attempt.get("correct_count", 0)
+        total = attempt.get("total_questions", 1)
+        accuracy = correct / max(total, 1)
+        
+        if topic not in topic_accuracy:
+            topic_accuracy[topic] = []
+        topic_accuracy[topic].append(accuracy)
+    
+    # Identify weak areas (< 70% accuracy)
+    weak_areas = []
+    for topic, accuracies in topic_accuracy.items():
+        avg_accuracy = sum(accuracies) / len(accuracies)
+        if avg_accuracy < 0.7:
+            weak_areas.append({
+                "topic": topic,
+                "accuracy": avg_accuracy,
+                "attempts": len(accuracies)
+            })
+    
+    # Generate recommendations
+    recommendations = []
+    if weak_areas:
+        recommendations.append("Take focused quizzes on weak areas")
+        recommendations.append("Review study materials for struggling topics")
+        recommendations.append("Check roadmap for targeted practice tasks")
+    
+    return {
+        "weak_areas": weak_areas,
+        "recommendations": recommendations,
+        "overall_accuracy": sum([sum(accs) / len(accs) for accs in topic_accuracy.values()]) / len(topic_accuracy) if topic_accuracy else 0
+    }
+
+
+def recommend_next_action(
+    message_count: int, quiz_attempts: int, weak_topics: List[Dict[str, Any]], has_analysis: bool
+) -> Dict[str, Any]:
+    """
+    Decide the next learning step from already-loaded state; no storage access.
+    ``message_count`` only needs to be exact below three.
+    """
+    if message_count < 3:
+        return {
+            "action": "tutor",
+            "reason": "Start by learning foundational concepts",
+            "suggestion": "Ask questions to understand key topics"
+        }
+    
+    if quiz_attempts < 2:
+        return {
+            "action": "quiz",
+            "reason": "Test your understanding with a quiz",
+            "suggestion": "Generate a quiz on what you've learned"
+        }
+    
+    if weak_topics:
+        return {
+            "action": "quiz",
+            "reason": "Focus on identified weak areas",
+            "suggestion": f"Take a targeted quiz on: {', '.join([wt['title'] for wt in weak_topics[:3]])}",
+            "focused": True,
+            "weak_topics": weak_topics
+        }
+    
+    # Check if analysis needed
+    if quiz_attempts >= 3 and not has_analysis:
+        return {
+            "action": "analyze",
+            "reason": "Analyze your learning progress",
+            "suggestion": "Review weak areas and get personalized recommendations"
+        }
+    
+    return {
+        "action": "roadmap",
+        "reason": "Create a study plan",
+        "suggestion": "Generate a personalized learning roadmap"
+    }
+
+
 class AgenticOrchestrator:
     """
     Orchestrates multi-agent workflows with intelligent task routing and context sharing.
@@ -30,49 +117,9 @@ class AgenticOrchestrator:
         Analyze recent quiz performance and identify patterns.
         Returns weak areas and recommendations.
         """
-        # Get quiz history
-        quiz_history = self.storage.get_quiz_history(session_id)
-        if not quiz_history:
-            return {"weak_areas": [], "recommendations": []}
-        
-        # Get recent quiz attempts
-        recent_attempts = quiz_history[-3:] if len(quiz_history) > 3 else quiz_history
-        
-        # Calculate per-topic accuracy
-        topic_accuracy = {}
-        for attempt in recent_attempts:
-            topic = attempt.get("topic", "unknown")
-            correct = attempt.get("correct_count", 0)
-            total = attempt.get("total_questions", 1)
-            accuracy = correct / max(total, 1)
-            
-            if topic not in topic_accuracy:
-                topic_accuracy[topic] = []
-            topic_accuracy[topic].append(accuracy)
-        
-        # Identify weak areas (< 70% accuracy)
-        weak_areas = []
-        for topic, accuracies in topic_accuracy.items():
-            avg_accuracy = sum(accuracies) / len(accuracies)
-            if avg_accuracy < 0.7:
-                weak_areas.append({
-                    "topic": topic,
-                    "accuracy": avg_accuracy,
-                    "attempts": len(accuracies)
-                })
-        
-        # Generate recommendations
-        recommendations = []
-        if weak_areas:
-            recommendations.append("Take focused quizzes on weak areas")
-            recommendations.append("Review study materials for struggling topics")
-            recommendations.append("Check roadmap for targeted practice tasks")
-        
-        return {
-            "weak_areas": weak_areas,
-            "recommendations": recommendations,
-            "overall_accuracy": sum([sum(accs) / len(accs) for accs in topic_accuracy.values()]) / len(topic_accuracy) if topic_accuracy else 0
-        }
+        # The three most recent quiz attempts are kept in the session aggregates (newest first)
+        stats = self.storage.get_session_stats(session_id)
+        return summarize_quiz_performance(stats["recent_attempts"] if stats else [])
     
     def should_trigger_analysis(self, session_id: str) -> bool:
         """
@@ -81,12 +128,12 @@ class AgenticOrchestrator:
         - 3+ quiz attempts
         - Low performance on recent quiz (< 60%)
         """
-        quiz_history = self.storage.get_quiz_history(session_id)
-        if not quiz_history or len(quiz_history) < 3:
+        stats = self.storage.get_session_stats(session_id)
+        if not stats or stats["quiz_attempts"] < 3:
             return False
         
-        # Check most recent quiz
-        last_attempt = quiz_history[-1]
+        # Check most recent quiz (the window is newest first)
+        last_attempt = stats["recent_attempts"][0]
         correct = last_attempt.get("correct_count", 0)
         total = last_attempt.get("total_questions", 1)
         accuracy = correct / max(total, 1)
@@ -98,59 +145,14 @@ class AgenticOrchestrator:
         Recommend the next action based on user's learning state.
         Uses FAISS memory and weak topics to determine optimal next step.
         """
-        # Get weak topics
-        weak_topics = self.storage.get_weak_topics(session_id)
-        
-        # Get quiz history
-        quiz_history = self.storage.get_quiz_history(session_id)
-        
-        # Get conversation history
-        history = self.storage.get_history(session_id)
-        
-        # Decision logic
-        if not history or len(history) < 3:
-            return {
-                "action": "tutor",
-                "reason": "Start by learning foundational concepts",
-                "suggestion": "Ask questions to understand key topics"
-            }
-        
-        if not quiz_history or len(quiz_history) < 2:
-            return {
-                "action": "quiz",
-                "reason": "Test your understanding with a quiz",
-                "suggestion": "Generate a quiz on what you've learned"
-            }
-        
-        if weak_topics and len(weak_topics) > 0:
-            return {
-                "action": "quiz",
-                "reason": "Focus on identified weak areas",
-                "suggestion": f"Take a targeted quiz on: {', '.join([wt['title'] for wt in weak_topics[:3]])}",
-                "focused": True,
-                "weak_topics": weak_topics
-            }
-        
-        # Check if analysis needed
-        if len(quiz_history) >= 3:
-            last_analysis = None
-            for msg in reversed(history):
-                if msg.get("task") == "analyze":
-                    last_analysis = msg
-                    break
-            
-            if not last_analysis:
-                return {
-                    "action": "analyze",
-                    "reason": "Analyze your learning progress",
-                    "suggestion": "Review weak areas and get personalized recommendations"
-                }
-        
-        return {
-            "action": "roadmap",
-            "reason": "Create a study plan",
-            "suggestion": "Generate a personalized learning roadmap"
-        }
+        # Counts, last analysis and weak topics, independent of how long the history is
+        state = self.storage.get_learning_state(session_id)
+        return recommend_next_action(
+            state["message_count"],
+            state["quiz_attempts"],
+            state["weak_topics"],
+            state["last_analysis_id"] is not None,
+        )
     
     def orchestrate_learning_cycle(self, session_id: str, current_task: str) -> Dict[str, Any]:
         """
@@ -159,12 +161,12 @@ class AgenticOrchestrator:
         """
         # Get current learning state
         weak_topics = self.storage.get_weak_topics(session_id)
-        quiz_history = self.storage.get_quiz_history(session_id)
+        stats = self.storage.get_session_stats(session_id)
         
         # Build context for agents
         context = {
             "weak_topics": weak_topics,
-            "quiz_history_count": len(quiz_history) if quiz_history else 0,
+            "quiz_history_count": stats["quiz_attempts"] if stats else 0,
             "should_focus": len(weak_topics) > 0 if weak_topics else False,
         }
         
@@ -0,0 +1,12 @@
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, several times faster than the standard library on
+    large nested payloads. Content must already be plain JSON types (str keys, no models)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
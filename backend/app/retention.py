@@ -0,0 +1,331 @@
+"""
+Retention - moves old messages and quiz attempt details out of the hot tables into
+gzip-compressed NDJSON archive chunks, restores them on demand and reclaims free pages.
+"""
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import DateTime
+
+from .storage import ArchiveChunk, ChatSession, Message, QuizAnswer, QuizAttempt, QuizQuestion, Storage
+
+KIND_MESSAGES = "messages"
+KIND_QUIZ_ATTEMPTS = "quiz_attempts"
+
+
+class RetentionPolicy:
+    """Which rows stay hot; a row matching any of the limits is archived.
+
+    ``max_age_days`` archives rows older than that many days, ``keep_messages`` and
+    ``keep_attempts`` keep only the newest N messages/attempts of each session. Archived
+    attempts keep their summary row (topic, totals, correct count) for analytics.
+    """
+
+    def __init__(
+        self,
+        max_age_days: Optional[float] = None,
+        keep_messages: Optional[int] = None,
+        keep_attempts: Optional[int] = None,
+        chunk_size: int = 500,
+    ):
+        self.max_age_days = max_age_days
+        self.keep_messages = keep_messages
+        self.keep_attempts = keep_attempts
+        self.chunk_size = chunk_size
+
+
+def _to_row(obj: Any) -> Dict[str, Any]:
+    row = {}
+    for column in obj.__table__.columns:
+        value = getattr(obj, column.name)
+        row[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return row
+
+
+def _from_row(model: Any, row: Dict[str, Any]) -> Dict[str, Any]:
+    values = dict(row)
+    for column in model.__table__.columns:
+        if isinstance(column.type, DateTime) and values.get(column.name):
+            values[column.name] = datetime.fromisoformat(values[column.name])
+    return values
+
+
+def _encode(records: List[Dict[str, Any]]) -> bytes:
+    return gzip.compress("\n".join(json.dumps(record) for record in records).encode("utf-8"))
+
+
+def _decode(payload: bytes) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in gzip.decompress(payload).decode("utf-8").splitlines() if line]
+
+
+def _archive_filter(session, model, session_id: str, keep: Optional[int], cutoff: Optional[datetime]):
+    """SQL condition for rows of ``model`` in this session that fall outside the policy, or None"""
+    conditions = []
+    if keep is not None:
+        # Everything older than the keep-th newest row
+        boundary = (
+            session.query(model.id)
+            .filter(model.session_id == session_id)
+            .order_by(model.id.desc())
+            .offset(keep)
+            .limit(1)
+            .scalar()
+        )
+        if boundary is not None:
+            conditions.append(model.id <= boundary)
+    if cutoff is not None:
+        conditions.append(model.created_at < cutoff)
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else (conditions[0] | conditions[1])
+
+
+def _archive_messages(storage: Storage, session_id: str, policy: RetentionPolicy, cutoff: Optional[datetime]) -> int:
+    archived = 0
+    while True:
+        # One transaction per chunk keeps the write lock short
+        with storage.Session() as session:
+            condition = _archive_filter(session, Message, session_id, policy.keep_messages, cutoff)
+            if condition is None:
+                return archived
+            messages = (
+                session.query(Message)
+                .filter(Message.session_id == session_id, condition)
+                .order_by(Message.id)
+                .limit(policy.chunk_size)
+                .all()
+            )
+            if not messages:
+                return archived
+            session.add(
+                ArchiveChunk(
+                    session_id=session_id,
+                    kind=KIND_MESSAGES,
+                    first_id=messages[0].id,
+                    last_id=messages[-1].id,
+                    row_count=len(messages),
+                    oldest_at=messages[0].created_at,
+                    newest_at=messages[-1].created_at,
+                    payload=_encode([_to_row(message) for message in messages]),
+                )
+            )
+            session.query(Message).filter(Message.id.in_([message.id for message in messages])).delete(
+                synchronize_session=False
+            )
+            session.commit()
+            storage.invalidate_session(session_id, ("get_history",))
+            archived += len(messages)
+
+
+def _archive_attempts(storage: Storage, session_id: str, policy: RetentionPolicy, cutoff: Optional[datetime]) -> int:
+    archived = 0
+    while True:
+        with storage.Session() as session:
+            condition = _archive_filter(session, QuizAttempt, session_id, policy.keep_attempts, cutoff)
+            if condition is None:
+                return archived
+            attempts = (
+                session.query(QuizAttempt)
+                .filter(QuizAttempt.session_id == session_id, QuizAttempt.archived_at.is_(None), condition)
+                .order_by(QuizAttempt.id)
+                .limit(policy.chunk_size)
+                .all()
+            )
+            if not attempts:
+                return archived
+            attempt_ids = [attempt.id for attempt in attempts]
+            questions: Dict[int, List[QuizQuestion]] = {}
+            for question in session.query(QuizQuestion).filter(QuizQuestion.attempt_id.in_(attempt_ids)):
+                questions.setdefault(question.attempt_id, []).append(question)
+            answers: Dict[int, List[QuizAnswer]] = {}
+            for answer in session.query(QuizAnswer).filter(QuizAnswer.attempt_id.in_(attempt_ids)):
+                answers.setdefault(answer.attempt_id, []).append(answer)
+            records = [
+                {
+                    "attempt": {"id": attempt.id, "raw_output": attempt.raw_output, "meta": attempt.meta},
+                    "questions": [_to_row(question) for question in questions.get(attempt.id, [])],
+                    "answers": [_to_row(answer) for answer in answers.get(attempt.id, [])],
+                }
+                for attempt in attempts
+            ]
+            session.add(
+                ArchiveChunk(
+                    session_id=session_id,
+                    kind=KIND_QUIZ_ATTEMPTS,
+                    first_id=attempts[0].id,
+                    last_id=attempts[-1].id,
+                    row_count=len(attempts),
+                    oldest_at=attempts[0].created_at,
+                    newest_at=attempts[-1].created_at,
+                    payload=_encode(records),
+                )
+            )
+            # The attempt row stays as a summary; the bulky parts live in the chunk
+            archived_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            for attempt in attempts:
+                attempt.answered_count = len(answers.get(attempt.id, []))
+                attempt.raw_output = ""
+                attempt.meta = None
+                attempt.archived_at = archived_at
+            session.query(QuizAnswer).filter(QuizAnswer.attempt_id.in_(attempt_ids)).delete(synchronize_session=False)
+            session.query(QuizQuestion).filter(QuizQuestion.attempt_id.in_(attempt_ids)).delete(
+                synchronize_session=False
+            )
+            session.commit()
+            archived += len(attempts)
+
+
+def archive(storage: Storage, policy: RetentionPolicy, session_id: Optional[str] = None) -> Dict[str, int]:
+    """Archive every row outside ``policy``, for one session or all of them"""
+    # Queued write-behind messages must be in the table before deciding what is old
+    storage.flush_messages()
+    cutoff = None
+    if policy.max_age_days is not None:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=policy.max_age_days)
+    if session_id is not None:
+        session_ids = [session_id]
+    else:
+        with storage.Session() as session:
+            session_ids = [row[0] for row in session.query(ChatSession.id)]
+    counts = {KIND_MESSAGES: 0, KIND_QUIZ_ATTEMPTS: 0}
+    for owner in session_ids:
+        counts[KIND_MESSAGES] += _archive_messages(storage, owner, policy, cutoff)
+        counts[KIND_QUIZ_ATTEMPTS] += _archive_attempts(storage, owner, policy, cutoff)
+    return counts
+
+
+def list_archives(storage: Storage, session_id: str) -> List[Dict[str, Any]]:
+    """Describe the archive chunks of a session, oldest first (without their payload)"""
+    with storage.Session() as session:
+        chunks = (
+            session.query(
+                ArchiveChunk.id,
+                ArchiveChunk.kind,
+                ArchiveChunk.first_id,
+                ArchiveChunk.last_id,
+                ArchiveChunk.row_count,
+                ArchiveChunk.oldest_at,
+                ArchiveChunk.newest_at,
+            )
+            .filter(ArchiveChunk.session_id == session_id)
+            .order_by(ArchiveChunk.id)
+            .all()
+        )
+        return [
+            {
+                "chunk_id": chunk.id,
+                "kind": chunk.kind,
+                "first_id": chunk.first_id,
+                "last_id": chunk.last_id,
+                "row_count": chunk.row_count,
+                "oldest_at": chunk.oldest_at.isoformat() if chunk.oldest_at else None,
+                "newest_at": chunk.newest_at.isoformat() if chunk.newest_at else None,
+            }
+            for chunk in chunks
+        ]
+
+
+def _restore_messages(session, records: List[Dict[str, Any]]) -> None:
+    ids = [record["id"] for record in records]
+    taken = {row[0] for row in session.query(Message.id).filter(Message.id.in_(ids))}
+    for record in records:
+        values = _from_row(Message, record)
+        if values["id"] in taken:
+            # SQLite may have reused the id after the row was archived; take a new one
+            values.pop("id")
+        session.add(Message(**values))
+
+
+def _restore_attempts(session, records: List[Dict[str, Any]]) -> None:
+    for record in records:
+        attempt = session.get(QuizAttempt, record["attempt"]["id"])
+        if attempt is None:
+            continue
+        attempt.raw_output = record["attempt"]["raw_output"]
+        attempt.meta = record["attempt"]["meta"]
+        attempt.archived_at = None
+        attempt.answered_count = None
+        question_ids: Dict[int, int] = {}
+        for row in record["questions"]:
+            values = _from_row(QuizQuestion, row)
+            old_id = values.pop("id")
+            question = QuizQuestion(**values)
+            if session.get(QuizQuestion, old_id) is None:
+                question.id = old_id
+            session.add(question)
+            session.flush()
+            question_ids[old_id] = question.id
+        for row in record["answers"]:
+            values = _from_row(QuizAnswer, row)
+            old_id = values.pop("id")
+            if values.get("question_id") is not None:
+                values["question_id"] = question_ids.get(values["question_id"])
+            answer = QuizAnswer(**values)
+            if session.get(QuizAnswer, old_id) is None:
+                answer.id = old_id
+            session.add(answer)
+
+
+def rehydrate(storage: Storage, session_id: str, chunk_id: Optional[int] = None) -> Dict[str, int]:
+    """Move archived rows of a session (or a single chunk) back into the hot tables"""
+    counts = {KIND_MESSAGES: 0, KIND_QUIZ_ATTEMPTS: 0}
+    with storage.Session() as session:
+        query = session.query(ArchiveChunk).filter(ArchiveChunk.session_id == session_id)
+        if chunk_id is not None:
+            query = query.filter(ArchiveChunk.id == chunk_id)
+        for chunk in query.order_by(ArchiveChunk.id).all():
+            records = _decode(chunk.payload)
+            if chunk.kind == KIND_MESSAGES:
+                _restore_messages(session, records)
+            else:
+                _restore_attempts(session, records)
+            counts[chunk.kind] += chunk.row_count
+            session.delete(chunk)
+        session.commit()
+    storage.invalidate_session(session_id)
+    return counts
+
+
+def checkpoint_wal(storage: Storage) -> None:
+    """Copy the write-ahead log into the database file and truncate it (a no-op without WAL).
+
+    In WAL mode recent writes, and pages freed by them, only reach the database file at a
+    checkpoint, so free page counts and the file size are only current after one.
+    """
+    with storage.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def compact(storage: Storage, max_pages: Optional[int] = None, full_vacuum: bool = False) -> Dict[str, int]:
+    """Return free pages to the file system with incremental VACUUM.
+
+    Incremental VACUUM needs ``auto_vacuum=INCREMENTAL``, and switching an existing database to
+    it takes one full VACUUM. That rewrites the whole file under an exclusive lock, stalling every
+    reader and writer until it finishes, so it only runs with ``full_vacuum`` (best while the
+    server is stopped); otherwise nothing is freed and ``full_vacuum_needed`` is 1. Afterwards
+    each run only frees up to ``max_pages`` pages.
+    """
+    checkpoint_wal(storage)
+    with storage.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        freed = connection.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        incremental = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+        if incremental:
+            pages = "" if max_pages is None else f"({int(max_pages)})"
+            # The pragma frees one page per step; executescript() steps it to completion
+            connection.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum{pages}")
+        elif full_vacuum:
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+        remaining = connection.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        page_count = connection.exec_driver_sql("PRAGMA page_count").scalar()
+        page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+    # The vacuumed pages are written to the WAL first
+    checkpoint_wal(storage)
+    return {
+        "freed_pages": freed - remaining,
+        "page_count": page_count,
+        "size_bytes": page_count * page_size,
+        "full_vacuum_needed": int(not incremental and not full_vacuum),
+    }
@@ -0,0 +1,121 @@
+"""
+Reviews - overnight planning of the spaced-repetition queues kept in review_schedule
+
+``Storage.update_concept_mastery`` grades each quiz result as an SM-2 review; only reviews
+at or after the due date move the schedule forward. ``plan_reviews`` prepares the next day
+for all sessions: it schedules concepts that were practised before the scheduler existed and
+caps each session's queue for the day, moving the least overdue concepts on to the following
+days.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, update
+
+from .storage import (
+    INITIAL_EASE,
+    ConceptMastery,
+    ReviewSchedule,
+    Storage,
+    _next_review,
+    _review_quality,
+)
+
+MAX_REVIEWS_PER_DAY = 50
+
+
+def _backfill(storage: Storage, batch_size: int) -> int:
+    """Schedule concepts with mastery but no schedule, as if their totals were one review"""
+    created = 0
+    last_id = 0
+    while True:
+        with storage.Session() as session:
+            rows = (
+                session.query(ConceptMastery)
+                .outerjoin(
+                    ReviewSchedule,
+                    (ReviewSchedule.session_id == ConceptMastery.session_id)
+                    & (ReviewSchedule.concept == ConceptMastery.concept),
+                )
+                .filter(ConceptMastery.id > last_id, ReviewSchedule.id.is_(None))
+                .order_by(ConceptMastery.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return created
+            last_id = rows[-1].id
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            for mastery in rows:
+                if not mastery.total_questions:
+                    continue
+                quality = _review_quality(mastery.correct_answers, mastery.total_questions)
+                practiced = mastery.last_practiced or now
+                repetitions, interval_days, ease = _next_review(0, 0.0, INITIAL_EASE, quality)
+                session.add(
+                    ReviewSchedule(
+                        session_id=mastery.session_id,
+                        concept=mastery.concept,
+                        due_at=practiced + timedelta(days=interval_days),
+                        interval_days=interval_days,
+                        ease=ease,
+                        repetitions=repetitions,
+                        lapses=0,
+                        last_quality=quality,
+                        last_reviewed=practiced,
+                    )
+                )
+                created += 1
+            session.commit()
+
+
+def plan_reviews(
+    storage: Storage,
+    day: Optional[date] = None,
+    max_per_day: Optional[int] = MAX_REVIEWS_PER_DAY,
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """Prepare every session's review queue for ``day`` (UTC, default tomorrow).
+
+    A session with more than ``max_per_day`` concepts due by the end of the day keeps the most
+    overdue ones; the rest move to the start of the following days, ``max_per_day`` per day.
+    Each session is a range read of ix_review_schedule_session_due.
+    """
+    day = day or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    counts = {"backfilled": _backfill(storage, batch_size), "sessions": 0, "due": 0, "postponed": 0}
+    with storage.Session() as session:
+        session_ids = [row[0] for row in session.query(ReviewSchedule.session_id).distinct()]
+    for offset in range(0, len(session_ids), batch_size):
+        # One transaction per batch of sessions keeps the write lock short while the server runs
+        with storage.Session() as session:
+            changes = []
+            for session_id in session_ids[offset : offset + batch_size]:
+                due_ids = [
+                    row[0]
+                    for row in session.query(ReviewSchedule.id)
+                    .filter(ReviewSchedule.session_id == session_id, ReviewSchedule.due_at < end)
+                    .order_by(ReviewSchedule.due_at)
+                ]
+                if not due_ids:
+                    continue
+                counts["sessions"] += 1
+                if not max_per_day:
+                    counts["due"] += len(due_ids)
+                    continue
+                counts["due"] += min(len(due_ids), max_per_day)
+                for rank, schedule_id in enumerate(due_ids[max_per_day:], start=max_per_day):
+                    changes.append(
+                        {"schedule_id": schedule_id, "postponed_to": start + timedelta(days=rank // max_per_day)}
+                    )
+            if changes:
+                # A concept reviewed since the read has a new due date, which must not be overwritten
+                statement = (
+                    update(ReviewSchedule.__table__)
+                    .where(ReviewSchedule.id == bindparam("schedule_id"), ReviewSchedule.due_at < end)
+                    .values(due_at=bindparam("postponed_to"))
+                )
+                counts["postponed"] += session.execute(statement, changes).rowcount
+            session.commit()
+    return counts
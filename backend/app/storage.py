@@ -1,7 +1,15 @@
+import atexit
+import copy
+import functools
 import json
 import os
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 from sqlalchemy import (
     Boolean,
@@ -9,16 +17,60 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
+    case,
     create_engine,
+    event,
 )
-from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, declarative_base, joinedload, relationship, selectinload, sessionmaker
 from sqlalchemy.sql import func
 
 Base = declarative_base()
 
+# SQLite engine settings. "default" keeps SQLite's stock behaviour (rollback journal,
+# full fsync on every commit). "production" switches to WAL so readers never wait for
+# the writer, only fsyncs at checkpoints, enlarges the page cache and memory-maps the
+# file, and retries write transactions that still hit SQLITE_BUSY.
+ENGINE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {
+        "pragmas": {},
+        "busy_timeout": 5.0,
+        "busy_retries": 0,
+        "pool": {},
+    },
+    "production": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -65536,  # negative means KiB, i.e. 64 MiB per connection
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+        },
+        "busy_timeout": 30.0,
+        "busy_retries": 5,
+        "pool": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30},
+    },
+}
+BUSY_RETRY_BACKOFF = 0.05
+
+
+def install_pragmas(engine, pragmas: Dict[str, Any], busy_timeout: float) -> None:
+    """Apply the profile's PRAGMAs to every new connection of ``engine``"""
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 
 def _ensure_dir(db_url: str) -> None:
     path = db_url.replace("sqlite://", "")
@@ -27,6 +79,155 @@ def _ensure_dir(db_url: str) -> None:
         os.makedirs(directory, exist_ok=True)
 
 
+def _is_busy_error(exc: OperationalError) -> bool:
+    message = str(exc.orig).lower()
+    return "database is locked" in message or "busy" in message
+
+
+def _retry_when_busy(method):
+    """Re-run a write method whose transaction failed with SQLITE_BUSY, up to the profile's retry count.
+
+    Only for methods that open and commit their own session, so a retry starts a fresh transaction.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return method(self, *args, **kwargs)
+            except OperationalError as exc:
+                if attempt >= self.busy_retries or not _is_busy_error(exc):
+                    raise
+                attempt += 1
+                time.sleep(BUSY_RETRY_BACKOFF * attempt)
+
+    return wrapper
+
+
+def _cached_read(method):
+    """Serve a per-session read method from ``Storage``'s read cache when it is enabled"""
+
+    @functools.wraps(method)
+    def wrapper(self, session_id, *args, **kwargs):
+        if self._cache is None:
+            return method(self, session_id, *args, **kwargs)
+        # Queued messages must be in the table, and so in the version, before it is compared
+        self._read_your_writes()
+        (version,) = self._read_versions(session_id, (method.__name__,))
+        key_args = (args, tuple(sorted(kwargs.items())))
+        return self._cache.get_or_load(
+            session_id, method.__name__, key_args, version, lambda: method(self, session_id, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+class _ReadCache:
+    """Bounded LRU cache of per-session read results, tagged with the read's version.
+
+    An entry is only served while its version is still the one in read_versions, which
+    triggers bump on every write to the read's table by any connection or process, so
+    scripts and other workers invalidate it too. The version is read before loading, so a
+    result loaded while a write committed is at least as new as its tag and at worst
+    reloaded once. ``invalidate`` only drops entries early to free their memory.
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, Any], Tuple[int, Any]]" = OrderedDict()
+        self._session_keys: Dict[str, Set[Tuple[str, str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, session_id: str, name: str, args: Any, version: int, loader) -> Any:
+        key = (session_id, name, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            entry = self._entries.get(key)
+            # A concurrent reader may already have stored a newer version
+            if entry is None or entry[0] <= version:
+                self._entries[key] = (version, value)
+                self._entries.move_to_end(key)
+                self._session_keys.setdefault(session_id, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._forget(evicted)
+                    self.evictions += 1
+        return value
+
+    def _forget(self, key: Tuple[str, str, Any]) -> None:
+        keys = self._session_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._session_keys[key[0]]
+
+    def invalidate(self, session_id: str, names: Sequence[str]) -> None:
+        with self._lock:
+            for key in list(self._session_keys.get(session_id, ())):
+                if key[1] in names:
+                    self._entries.pop(key, None)
+                    self._forget(key)
+                    self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Sections served by Storage.get_session_dashboard
+DASHBOARD_SECTIONS = ("history", "weak_topics", "roadmap", "analysis", "mastery", "recommendations")
+
+# Cached (and ETag-versioned) read methods; a write to a session invalidates the reads it can change
+CACHED_READS = ("get_history", "get_weak_topics", "get_roadmap_tasks", "get_concept_mastery")
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_buffered_messages(session: Session) -> None:
+    # Write-behind rows of a transaction are only queued once it commits; registered before the
+    # cache invalidation below, so the history is invalidated after its rows are queued
+    for buffer, row in session.info.pop("buffered_messages", []):
+        buffer.add(row, flush_when_full=False)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_buffered_messages(session: Session) -> None:
+    session.info.pop("buffered_messages", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_cache_invalidations(session: Session) -> None:
+    # Once the write is visible the entries it changed are outdated; drop them to free the memory
+    for storage, session_id, names in session.info.pop("cache_invalidations", []):
+        storage.invalidate_session(session_id, names)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_cache_invalidations(session: Session) -> None:
+    session.info.pop("cache_invalidations", None)
+
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
 
@@ -36,6 +237,10 @@ class ChatSession(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Latest message for a task/role, e.g. the last analysis shown by /api/analysis
+        Index("ix_messages_session_task_role", "session_id", "task", "role"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String, ForeignKey("chat_sessions.id"), index=True)
@@ -48,6 +253,7 @@ class Message(Base):
 
 class WeakTopic(Base):
     __tablename__ = "weak_topics"
+    __table_args__ = (Index("ix_weak_topics_session_created", "session_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String, ForeignKey("chat_sessions.id"), index=True)
@@ -70,13 +276,20 @@ class QuizAttempt(Base):
     correct_count = Column(Integer, default=0)
     meta = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set when raw_output, meta, questions and answers were moved to the archive; the row
+    # itself stays as a summary and answered_count keeps the number of answers it had
+    archived_at = Column(DateTime(timezone=True), nullable=True)
+    answered_count = Column(Integer, nullable=True)
+
+    questions = relationship("QuizQuestion", order_by="QuizQuestion.sequence")
+    answers = relationship("QuizAnswer", order_by="[QuizAnswer.created_at, QuizAnswer.id]")
 
 
 class QuizQuestion(Base):
     __tablename__ = "quiz_questions"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    attempt_id = Column(Integer, ForeignKey("quiz_attempts.id", ondelete="CASCADE"))
+    attempt_id = Column(Integer, ForeignKey("quiz_attempts.id", ondelete="CASCADE"), index=True)
     sequence = Column(Integer)
     question = Column(Text)
     options = Column(Text)
@@ -86,9 +299,13 @@ class QuizQuestion(Base):
 
 class QuizAnswer(Base):
     __tablename__ = "quiz_answers"
+    __table_args__ = (
+        # One answer per question; NULL question ids are distinct so unlinked answers are unaffected
+        Index("uq_quiz_answers_attempt_question", "attempt_id", "question_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    attempt_id = Column(Integer, ForeignKey("quiz_attempts.id", ondelete="CASCADE"))
+    attempt_id = Column(Integer, ForeignKey("quiz_attempts.id", ondelete="CASCADE"), index=True)
     question_id = Column(Integer, ForeignKey("quiz_questions.id", ondelete="SET NULL"), nullable=True)
     selected_index = Column(Integer, nullable=True)
     selected_option = Column(Text, nullable=True)
@@ -100,6 +317,10 @@ class QuizAnswer(Base):
 
 class RoadmapTask(Base):
     __tablename__ = "roadmap_tasks"
+    __table_args__ = (
+        # Matches the get_roadmap_tasks ordering so the sort is read straight from the index
+        Index("ix_roadmap_tasks_session_order", "session_id", "status", "priority", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String, ForeignKey("chat_sessions.id"), index=True)
@@ -114,6 +335,11 @@ class RoadmapTask(Base):
 
 class ConceptMastery(Base):
     __tablename__ = "concept_mastery"
+    __table_args__ = (
+        # Target of the ON CONFLICT upsert in update_concept_mastery
+        Index("uq_concept_mastery_session_concept", "session_id", "concept", unique=True),
+        Index("ix_concept_mastery_session_score", "session_id", "mastery_score"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String, ForeignKey("chat_sessions.id"), index=True)
@@ -126,28 +352,619 @@ class ConceptMastery(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class AnalysisCheckpoint(Base):
+    __tablename__ = "analysis_checkpoints"
+
+    session_id = Column(String, ForeignKey("chat_sessions.id"), primary_key=True)
+    last_attempt_id = Column(Integer, default=0)
+    last_answer_id = Column(Integer, default=0)
+    summary = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class SessionStats(Base):
+    """Per-session totals kept up to date by the write paths so analytics reads are one lookup"""
+
+    __tablename__ = "session_stats"
+
+    session_id = Column(String, ForeignKey("chat_sessions.id"), primary_key=True)
+    quiz_attempts = Column(Integer, default=0)
+    answered_questions = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    # JSON list of the last RECENT_ATTEMPTS_WINDOW attempts, newest first
+    recent_attempts = Column(Text, nullable=True)
+    total_concepts = Column(Integer, default=0)
+    mastered_concepts = Column(Integer, default=0)
+    in_progress_concepts = Column(Integer, default=0)
+    needs_work_concepts = Column(Integer, default=0)
+    # Messages ever logged (archived ones included) and the newest "analyze" message
+    message_count = Column(Integer, default=0)
+    last_analysis_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TopicStats(Base):
+    __tablename__ = "topic_stats"
+    __table_args__ = (Index("uq_topic_stats_session_topic", "session_id", "topic", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id"))
+    topic = Column(String)
+    quiz_attempts = Column(Integer, default=0)
+    answered_questions = Column(Integer, default=0)
+    correct_answers = Column(Integer, default=0)
+    accuracy = Column(Float, default=0.0)
+    # JSON list of the topic's last RECENT_ATTEMPTS_WINDOW attempts, newest first
+    recent_attempts = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ArchiveChunk(Base):
+    """A batch of archived rows of one session, stored as gzip-compressed NDJSON"""
+
+    __tablename__ = "archive_chunks"
+    __table_args__ = (Index("ix_archive_chunks_session_kind", "session_id", "kind"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id"))
+    # "messages" or "quiz_attempts"
+    kind = Column(String)
+    first_id = Column(Integer)
+    last_id = Column(Integer)
+    row_count = Column(Integer)
+    oldest_at = Column(DateTime(timezone=True), nullable=True)
+    newest_at = Column(DateTime(timezone=True), nullable=True)
+    payload = Column(LargeBinary)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ConceptDifficulty(Base):
+    """Cross-session difficulty of a concept; rewritten by each analytics.compute_difficulty run"""
+
+    __tablename__ = "concept_difficulty"
+
+    concept = Column(String, primary_key=True)
+    answers = Column(Integer, default=0)
+    learners = Column(Integer, default=0)
+    questions = Column(Integer, default=0)
+    p_correct = Column(Float, default=0.0)
+    difficulty = Column(Float, default=0.0)
+    # Point-biserial correlation of answering correctly with the rest of the attempt's score
+    discrimination = Column(Float, nullable=True)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class QuestionDifficulty(Base):
+    """Cross-session statistics of one question (same concept, text and options)"""
+
+    __tablename__ = "question_difficulty"
+    __table_args__ = (Index("ix_question_difficulty_concept_difficulty", "concept", "difficulty"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # analytics.concept_key of the concept, so lookups do not depend on its casing
+    concept = Column(String)
+    question = Column(Text)
+    options = Column(Text)
+    correct_index = Column(Integer, nullable=True)
+    answers = Column(Integer, default=0)
+    p_correct = Column(Float, default=0.0)
+    difficulty = Column(Float, default=0.0)
+    discrimination = Column(Float, nullable=True)
+    # JSON list with the share and mean rest score of the learners choosing each option
+    distractors = Column(Text, nullable=True)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ReviewSchedule(Base):
+    """Spaced-repetition state of a concept for one session (SM-2), updated with its mastery"""
+
+    __tablename__ = "review_schedule"
+    __table_args__ = (
+        Index("uq_review_schedule_session_concept", "session_id", "concept", unique=True),
+        # get_due_reviews reads a range of this index, whatever the number of concepts
+        Index("ix_review_schedule_session_due", "session_id", "due_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id"))
+    concept = Column(String)
+    due_at = Column(DateTime(timezone=True))
+    interval_days = Column(Float, default=0.0)
+    ease = Column(Float, default=2.5)
+    repetitions = Column(Integer, default=0)
+    lapses = Column(Integer, default=0)
+    last_quality = Column(Integer, nullable=True)
+    last_reviewed = Column(DateTime(timezone=True), nullable=True)
+
+
+class ReadVersion(Base):
+    """Version of one cached read of a session, bumped by a trigger on every write to its table.
+
+    Triggers see the writes of every connection, including scripts and other processes, so the
+    read cache compares these versions instead of relying on its own process's writes.
+    """
+
+    __tablename__ = "read_versions"
+
+    session_id = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
+
+
+# Table read by each of the CACHED_READS
+CACHED_READ_TABLES = {
+    "get_history": "messages",
+    "get_weak_topics": "weak_topics",
+    "get_roadmap_tasks": "roadmap_tasks",
+    "get_concept_mastery": "concept_mastery",
+}
+
+
+def _read_version_triggers() -> List[str]:
+    statements = []
+    for name, table in CACHED_READ_TABLES.items():
+        for operation, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS tr_{table}_{operation.lower()}_read_version "
+                f"AFTER {operation} ON {table} BEGIN "
+                f"INSERT INTO read_versions (session_id, name, version) VALUES ({row}.session_id, '{name}', 1) "
+                "ON CONFLICT (session_id, name) DO UPDATE SET version = version + 1; END"
+            )
+    return statements
+
+
+RECENT_ATTEMPTS_WINDOW = 3
+# Mastery score buckets used for the per-session concept counts
+MASTERED_SCORE = 90
+IN_PROGRESS_SCORE = 50
+
+
+def _mastery_bucket(score: Optional[float]) -> Optional[str]:
+    if score is None:
+        return None
+    if score >= MASTERED_SCORE:
+        return "mastered_concepts"
+    if score >= IN_PROGRESS_SCORE:
+        return "in_progress_concepts"
+    return "needs_work_concepts"
+
+
+def _new_session_stats(session_id: str) -> SessionStats:
+    return SessionStats(
+        session_id=session_id,
+        quiz_attempts=0,
+        answered_questions=0,
+        correct_answers=0,
+        recent_attempts="[]",
+        total_concepts=0,
+        mastered_concepts=0,
+        in_progress_concepts=0,
+        needs_work_concepts=0,
+        message_count=0,
+    )
+
+
+def _new_topic_stats(session_id: str, topic: str) -> TopicStats:
+    return TopicStats(
+        session_id=session_id,
+        topic=topic,
+        quiz_attempts=0,
+        answered_questions=0,
+        correct_answers=0,
+        accuracy=0.0,
+        recent_attempts="[]",
+    )
+
+
+def _push_recent(raw: Optional[str], entry: Dict[str, Any]) -> str:
+    window = json.loads(raw or "[]")
+    return json.dumps([entry] + window[: RECENT_ATTEMPTS_WINDOW - 1])
+
+
+def _set_recent_correct(raw: Optional[str], attempt_id: int, correct_count: int) -> str:
+    window = json.loads(raw or "[]")
+    for entry in window:
+        if entry["attempt_id"] == attempt_id:
+            entry["correct_count"] = correct_count
+    return json.dumps(window)
+
+
+def _rebuild_aggregates(session: Session, session_id: Optional[str] = None) -> None:
+    """Recompute session and topic stats from the source tables (all sessions when session_id is None)"""
+    stats_query = session.query(SessionStats)
+    topics_query = session.query(TopicStats)
+    attempts_query = session.query(
+        QuizAttempt.id,
+        QuizAttempt.session_id,
+        QuizAttempt.topic,
+        QuizAttempt.total_questions,
+        QuizAttempt.correct_count,
+        QuizAttempt.answered_count,
+    )
+    answers_query = session.query(QuizAnswer.attempt_id, func.count(QuizAnswer.id)).join(
+        QuizAttempt, QuizAttempt.id == QuizAnswer.attempt_id
+    )
+    mastery_query = session.query(ConceptMastery.session_id, ConceptMastery.mastery_score)
+    messages_query = session.query(
+        Message.session_id, func.count(Message.id), func.max(case((Message.task == "analyze", Message.id)))
+    )
+    archived_query = session.query(ArchiveChunk.session_id, func.sum(ArchiveChunk.row_count)).filter(
+        ArchiveChunk.kind == "messages"
+    )
+    if session_id is not None:
+        stats_query = stats_query.filter(SessionStats.session_id == session_id)
+        topics_query = topics_query.filter(TopicStats.session_id == session_id)
+        attempts_query = attempts_query.filter(QuizAttempt.session_id == session_id)
+        answers_query = answers_query.filter(QuizAttempt.session_id == session_id)
+        mastery_query = mastery_query.filter(ConceptMastery.session_id == session_id)
+        messages_query = messages_query.filter(Message.session_id == session_id)
+        archived_query = archived_query.filter(ArchiveChunk.session_id == session_id)
+    stats_query.delete(synchronize_session=False)
+    topics_query.delete(synchronize_session=False)
+
+    answered = dict(answers_query.group_by(QuizAnswer.attempt_id).all())
+    sessions: Dict[str, SessionStats] = {}
+    topics: Dict[Tuple[str, str], TopicStats] = {}
+    for attempt_id, owner, topic, total, correct, archived_answers in attempts_query.order_by(QuizAttempt.id):
+        entry = {"attempt_id": attempt_id, "topic": topic, "correct_count": correct or 0, "total_questions": total or 0}
+        for stats in (
+            sessions.setdefault(owner, _new_session_stats(owner)),
+            topics.setdefault((owner, topic), _new_topic_stats(owner, topic)),
+        ):
+            stats.quiz_attempts += 1
+            # Archived attempts have no answer rows left and remember their count instead
+            stats.answered_questions += answered.get(attempt_id, archived_answers or 0)
+            stats.correct_answers += correct or 0
+            stats.recent_attempts = _push_recent(stats.recent_attempts, entry)
+    for owner, score in mastery_query:
+        stats = sessions.setdefault(owner, _new_session_stats(owner))
+        stats.total_concepts += 1
+        bucket = _mastery_bucket(score)
+        setattr(stats, bucket, getattr(stats, bucket) + 1)
+    archived = dict(archived_query.group_by(ArchiveChunk.session_id).all())
+    for owner, count, last_analysis_id in messages_query.group_by(Message.session_id):
+        stats = sessions.setdefault(owner, _new_session_stats(owner))
+        stats.message_count = count + (archived.pop(owner, 0) or 0)
+        stats.last_analysis_id = last_analysis_id
+    for owner, count in archived.items():
+        # Every message of these sessions is archived
+        sessions.setdefault(owner, _new_session_stats(owner)).message_count = count or 0
+    for stats in topics.values():
+        stats.accuracy = stats.correct_answers / stats.answered_questions if stats.answered_questions else 0.0
+    session.add_all(list(sessions.values()) + list(topics.values()))
+    session.flush()
+
+
+def _merge_duplicate_mastery(connection) -> None:
+    """Fold duplicate (session_id, concept) mastery rows into the oldest one before the unique index exists"""
+    groups = connection.exec_driver_sql(
+        "SELECT session_id, concept, MIN(id), SUM(total_questions), SUM(correct_answers), SUM(quiz_attempts) "
+        "FROM concept_mastery GROUP BY session_id, concept HAVING COUNT(*) > 1"
+    ).fetchall()
+    for session_id, concept, keep_id, total, correct, attempts in groups:
+        score = _mastery_score(correct, total, attempts)
+        connection.exec_driver_sql(
+            "UPDATE concept_mastery SET total_questions = ?, correct_answers = ?, quiz_attempts = ?, mastery_score = ? "
+            "WHERE id = ?",
+            (total, correct, attempts, score, keep_id),
+        )
+        connection.exec_driver_sql(
+            "DELETE FROM concept_mastery WHERE session_id = ? AND concept = ? AND id != ?",
+            (session_id, concept, keep_id),
+        )
+
+
+def _dedupe_quiz_answers(connection) -> None:
+    """Keep only the latest answer per question and recount correct answers for every attempt"""
+    connection.exec_driver_sql(
+        "DELETE FROM quiz_answers WHERE question_id IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM quiz_answers WHERE question_id IS NOT NULL GROUP BY attempt_id, question_id)"
+    )
+    connection.exec_driver_sql(
+        "UPDATE quiz_attempts SET correct_count = "
+        "(SELECT COUNT(*) FROM quiz_answers WHERE quiz_answers.attempt_id = quiz_attempts.id AND is_correct = 1)"
+    )
+
+
+def _add_missing_columns(connection) -> None:
+    """Add columns introduced since the database was created (create_all() only adds tables)"""
+    for table in Base.metadata.sorted_tables:
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+def _backfill_aggregates(connection) -> None:
+    with Session(bind=connection) as session:
+        _rebuild_aggregates(session)
+
+
+# Data migrations for databases created by older versions as (user_version after the step,
+# step), applied in order to databases below that version. Missing columns are added before
+# and missing indexes after them. Versions 3 to 5 each filled the stats tables (the last one
+# for the message counts); a single rebuild now covers them.
+MIGRATIONS = [
+    (1, _merge_duplicate_mastery),
+    (2, _dedupe_quiz_answers),
+    (5, _backfill_aggregates),
+]
+
+
+def _mastery_score(correct: int, total: int, attempts: int) -> float:
+    """Accuracy (0-100) weighted by attempts; more attempts make the score more reliable"""
+    if not total:
+        return 0.0
+    return (correct / total) * 100 * min(attempts / 5, 1.0)
+
+
+# SM-2 parameters: answers graded below PASSING_QUALITY (0-5) start the concept over
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_QUALITY = 3
+FIRST_INTERVALS_DAYS = (1.0, 6.0)
+
+
+def _review_quality(correct: int, total: int) -> int:
+    """SM-2 response quality (0-5) of a quiz result, rounding halves up"""
+    return int(5 * correct / total + 0.5)
+
+
+def _next_review(
+    repetitions: int, interval_days: float, ease: float, quality: int
+) -> Tuple[int, float, float]:
+    """SM-2 step: the repetitions, interval in days and ease after a review of ``quality``"""
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < PASSING_QUALITY:
+        return 0, FIRST_INTERVALS_DAYS[0], ease
+    repetitions += 1
+    if repetitions <= len(FIRST_INTERVALS_DAYS):
+        return repetitions, FIRST_INTERVALS_DAYS[repetitions - 1], ease
+    return repetitions, round(interval_days * ease, 2), ease
+
+
 TASK_STATUS_PENDING = "pending"
 TASK_STATUS_COMPLETE = "complete"
 
+# Write-behind durability modes: "batched" commits with the profile's synchronous setting,
+# "fsync" forces synchronous=FULL for every flushed batch
+DURABILITY_BATCHED = "batched"
+DURABILITY_FSYNC = "fsync"
+
+
+class _MessageBuffer:
+    """Bounded in-memory queue of message rows flushed by a background thread in multi-row inserts.
+
+    Rows are flushed every ``flush_interval`` seconds, when the queue reaches ``max_pending``
+    (by the caller that filled it), on ``close()`` and at interpreter exit. A crash can lose
+    at most the rows queued since the last flush.
+    """
+
+    def __init__(self, storage: "Storage", flush_interval: float, max_pending: int, durability: str):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # Held for a whole flush so batches are inserted in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="message-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: Dict[str, Any], flush_when_full: bool = True) -> None:
+        if self._closed:
+            self.storage._insert_messages([row], self.durability)
+            return
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_pending
+        if full:
+            if not flush_when_full:
+                self._wake.set()
+                return
+            # Back-pressure: the caller that fills the queue pays for the flush
+            try:
+                self.flush()
+            except Exception as e:
+                # The row is queued either way; raising would make a retrying caller queue it again,
+                # so leave the batch to the flush thread
+                print(f"Warning: Could not flush buffered messages: {e}")
+                self._wake.set()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                self.storage._insert_messages(rows, self.durability)
+            except BaseException:
+                # Put the batch back in front so a later flush retries it in order
+                with self._lock:
+                    self._rows[:0] = rows
+                raise
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: Could not flush buffered messages: {e}")
+
+    def close(self) -> None:
+        """Stop the flush thread and write everything still queued"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
 
 class Storage:
-    def __init__(self, db_url: str):
+    def __init__(
+        self,
+        db_url: str,
+        profile: str = "default",
+        write_behind: bool = False,
+        flush_interval: float = 0.5,
+        max_pending: int = 1000,
+        durability: str = DURABILITY_BATCHED,
+        cache_size: int = 0,
+    ):
         _ensure_dir(db_url)
-        self.engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        settings = ENGINE_PROFILES[profile]
+        self.profile = profile
+        self.settings = settings
+        self.busy_retries = settings["busy_retries"]
+        self._synchronous = settings["pragmas"].get("synchronous", "FULL")
+        self.engine_options: Dict[str, Any] = {}
+        if ":memory:" not in db_url and db_url.rstrip("/") != "sqlite:":
+            # In-memory databases use a single-connection pool that takes no sizing options
+            self.engine_options.update(settings["pool"])
+        self.engine = create_engine(
+            db_url,
+            connect_args={"check_same_thread": False, "timeout": settings["busy_timeout"]},
+            **self.engine_options,
+        )
+        install_pragmas(self.engine, settings["pragmas"], settings["busy_timeout"])
         Base.metadata.create_all(self.engine)
+        self._migrate()
         self.Session = sessionmaker(bind=self.engine)
+        self._cache: Optional[_ReadCache] = _ReadCache(cache_size) if cache_size > 0 else None
+        self._message_buffer: Optional[_MessageBuffer] = None
+        if write_behind:
+            # Messages are queued and inserted in batches off the request path
+            self._message_buffer = _MessageBuffer(self, flush_interval, max_pending, durability)
+
+    def flush_messages(self) -> None:
+        """Write any messages still queued by write-behind mode"""
+        if self._message_buffer is not None:
+            self._message_buffer.flush()
+
+    def close(self) -> None:
+        """Flush queued writes and stop the write-behind thread"""
+        if self._message_buffer is not None:
+            self._message_buffer.close()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit-rate metrics of the read cache, or None when it is disabled"""
+        return self._cache.stats() if self._cache is not None else None
+
+    def invalidate_session(self, session_id: str, names: Sequence[str] = CACHED_READS) -> None:
+        """Drop cached reads of a session early; the triggers on their tables already keep
+        outdated entries from being served"""
+        if self._cache is not None:
+            self._cache.invalidate(session_id, names)
+
+    def _invalidate_on_commit(self, session: Session, session_id: str, *names: str) -> None:
+        session.info.setdefault("cache_invalidations", []).append((self, session_id, names))
+
+    def _read_versions(self, session_id: str, names: Sequence[str]) -> List[int]:
+        with self.Session() as session:
+            versions = dict(
+                session.query(ReadVersion.name, ReadVersion.version).filter(
+                    ReadVersion.session_id == session_id, ReadVersion.name.in_(names)
+                )
+            )
+        return [versions.get(name, 0) for name in names]
+
+    def data_version(self, session_id: str, names: Sequence[str] = CACHED_READS) -> str:
+        """ETag of the current state of the given reads of a session, from their read_versions.
+
+        Read it before loading the data: a write that commits in between then only costs the
+        client one more full response, never a stale one.
+        """
+        self._read_your_writes()
+        return self._etag(session_id, names)
+
+    def _etag(self, session_id: str, names: Sequence[str]) -> str:
+        # The versions are bumped by triggers, so any writer's commit changes the ETag
+        return 'W/"%s"' % "-".join(str(version) for version in self._read_versions(session_id, names))
+
+    def _read_your_writes(self) -> None:
+        # Readers in this process must see messages that are still queued
+        if self._message_buffer is not None and self._message_buffer.pending:
+            self._message_buffer.flush()
+
+    @_retry_when_busy
+    def _insert_messages(self, rows: List[Dict[str, Any]], durability: str) -> None:
+        with self.engine.connect() as connection:
+            if durability == DURABILITY_FSYNC:
+                connection.exec_driver_sql("PRAGMA synchronous=FULL")
+            try:
+                with Session(bind=connection) as session:
+                    session.execute(Message.__table__.insert(), rows)
+                    self._track_message_batch(session, rows)
+                    # Commits the batch, unless the fsync pragma already began the connection's
+                    # transaction; the session only joined that one, so it is committed below
+                    session.commit()
+                connection.commit()
+                # Queuing already invalidated the history; do it again now that the rows are
+                # visible, so a read that ran before this commit cannot keep the old one
+                for session_id in {row["session_id"] for row in rows}:
+                    self.invalidate_session(session_id, ("get_history",))
+            finally:
+                if durability == DURABILITY_FSYNC:
+                    connection.exec_driver_sql(f"PRAGMA synchronous={self._synchronous}")
+
+    def bind(self, session: Session) -> "Storage":
+        """A view of this storage whose methods all run inside ``session`` (used by AsyncStorage).
+
+        Commits inside the methods commit that session; busy retries are left to the caller,
+        which owns the session and has to start a fresh one to retry.
+        """
+        bound = copy.copy(self)
+        bound.Session = lambda: nullcontext(session)
+        bound.busy_retries = 0
+        return bound
+
+    def _migrate(self) -> None:
+        """Bring a database created by an older version up to the current schema"""
+        with self.engine.begin() as connection:
+            # The ORM queries of the steps select every mapped column
+            _add_missing_columns(connection)
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar() or 0
+            for target, migration in MIGRATIONS:
+                if version < target:
+                    migration(connection)
+                    connection.exec_driver_sql(f"PRAGMA user_version = {target}")
+        self._create_missing_indexes()
+        with self.engine.begin() as connection:
+            for statement in _read_version_triggers():
+                connection.exec_driver_sql(statement)
+
+    def _create_missing_indexes(self) -> None:
+        # create_all() skips tables that already exist, so add indexes introduced since the database was created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
 
+    @_retry_when_busy
+    def session_exists(self, session_id: str) -> bool:
+        with self.Session() as session:
+            return session.get(ChatSession, session_id) is not None
+
+    @_retry_when_busy
     def ensure_session(self, session_id: Optional[str]) -> str:
         with self.Session() as session:
-            if session_id:
-                existing = session.get(ChatSession, session_id)
-                if existing:
-                    return session_id
-            new_id = str(uuid.uuid4())
-            session.add(ChatSession(id=new_id))
+            session_id = self._ensure_session(session, session_id)
             session.commit()
-            return new_id
+            return session_id
 
+    @_retry_when_busy
     def log_message(
         self,
         session_id: str,
@@ -156,19 +973,16 @@ class Storage:
         task: Optional[str] = None,
         meta: Optional[Dict[str, Any]] = None,
     ) -> None:
-        payload = json.dumps(meta or {})
+        if self._message_buffer is not None:
+            self._message_buffer.add(self._message_row(session_id, role, content, task, meta))
+            # Reads flush the queue first, so the cached history is stale as soon as the row is queued
+            self.invalidate_session(session_id, ("get_history",))
+            return
         with self.Session() as session:
-            session.add(
-                Message(
-                    session_id=session_id,
-                    role=role,
-                    content=content,
-                    task=task,
-                    meta=payload,
-                )
-            )
+            self._add_message(session, session_id, role, content, task=task, meta=meta)
             session.commit()
 
+    @_retry_when_busy
     def log_quiz_attempt(
         self,
         session_id: str,
@@ -177,39 +991,120 @@ class Storage:
         questions: Optional[List[Dict[str, Any]]] = None,
         task: Optional[str] = None,
         meta: Optional[Dict[str, Any]] = None,
-    ) -> Tuple[int, List[QuizQuestion]]:
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
         with self.Session() as session:
-            attempt = QuizAttempt(
-                session_id=session_id,
-                task=task,
-                topic=topic,
-                raw_output=raw_output,
-                total_questions=len(questions or []),
-                meta=json.dumps(meta or {}),
+            result = self._add_quiz_attempt(
+                session, session_id, topic, raw_output, questions=questions, task=task, meta=meta
             )
-            session.add(attempt)
-            session.flush()
-            created_questions: List[QuizQuestion] = []
-            if questions:
-                for sequence, payload in enumerate(questions, start=1):
-                    question = QuizQuestion(
-                        attempt_id=attempt.id,
-                        sequence=sequence,
-                        question=payload.get("question", ""),
-                        options=json.dumps(payload.get("options", [])),
-                        correct_index=payload.get("correct_index"),
-                        explanation=payload.get("explanation"),
-                    )
-                    session.add(question)
-                    created_questions.append(question)
             session.commit()
-            # Extract IDs before session closes to avoid DetachedInstanceError
-            session.refresh(attempt)
-            for q in created_questions:
-                session.refresh(q)
-            question_data = [(q.id, q.sequence, q.question, q.options, q.correct_index, q.explanation) for q in created_questions]
-            return attempt.id, question_data
+            return result
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator["UnitOfWork"]:
+        """Group several writes into one transaction, committed when the block exits without error"""
+        with self.Session() as session:
+            yield UnitOfWork(self, session)
+            session.commit()
+
+    def _ensure_session(self, session: Session, session_id: Optional[str]) -> str:
+        if session_id:
+            existing = session.get(ChatSession, session_id)
+            if existing:
+                return session_id
+        new_id = str(uuid.uuid4())
+        session.add(ChatSession(id=new_id))
+        session.flush()
+        return new_id
+
+    def _add_message(
+        self,
+        session: Session,
+        session_id: str,
+        role: str,
+        content: str,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if self._message_buffer is not None:
+            # Queued rows are written outside this transaction, so they are held until it commits
+            # and dropped if it rolls back; the queue is never flushed inline because the
+            # transaction may still hold the SQLite write lock
+            row = self._message_row(session_id, role, content, task, meta)
+            session.info.setdefault("buffered_messages", []).append((self._message_buffer, row))
+            self._invalidate_on_commit(session, session_id, "get_history")
+            return
+        self._invalidate_on_commit(session, session_id, "get_history")
+        message = Message(
+            session_id=session_id,
+            role=role,
+            content=content,
+            task=task,
+            meta=json.dumps(meta or {}),
+        )
+        session.add(message)
+        stats = self._session_stats(session, session_id)
+        stats.message_count += 1
+        if task == "analyze":
+            session.flush()
+            stats.last_analysis_id = message.id
+
+    def _message_row(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        task: Optional[str],
+        meta: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "task": task,
+            "meta": json.dumps(meta or {}),
+            # Stamped when queued, not when the batch is flushed
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+
+    def _add_quiz_attempt(
+        self,
+        session: Session,
+        session_id: str,
+        topic: str,
+        raw_output: str,
+        questions: Optional[List[Dict[str, Any]]] = None,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
+        attempt = QuizAttempt(
+            session_id=session_id,
+            task=task,
+            topic=topic,
+            raw_output=raw_output,
+            total_questions=len(questions or []),
+            meta=json.dumps(meta or {}),
+        )
+        session.add(attempt)
+        session.flush()
+        created_questions = [
+            QuizQuestion(
+                attempt_id=attempt.id,
+                sequence=sequence,
+                question=payload.get("question", ""),
+                options=json.dumps(payload.get("options", [])),
+                correct_index=payload.get("correct_index"),
+                explanation=payload.get("explanation"),
+            )
+            for sequence, payload in enumerate(questions or [], start=1)
+        ]
+        # One multi-row INSERT; primary keys come back from the flush, so no refresh round trips
+        session.add_all(created_questions)
+        self._track_attempt(session, session_id, attempt.id, topic, len(created_questions))
+        session.flush()
+        question_data = [(q.id, q.sequence, q.question, q.options, q.correct_index, q.explanation) for q in created_questions]
+        return attempt.id, question_data
 
+    @_retry_when_busy
     def record_quiz_answer(
         self,
         session_id: str,
@@ -221,108 +1116,445 @@ class Storage:
         note: Optional[str] = None,
         confidence: Optional[float] = None,
     ) -> bool:
+        answer = {
+            "question_id": question_id,
+            "selected_index": selected_index,
+            "selected_option": selected_option,
+            "is_correct": is_correct,
+            "note": note,
+            "confidence": confidence,
+        }
         with self.Session() as session:
-            attempt = session.get(QuizAttempt, attempt_id)
-            if not attempt or attempt.session_id != session_id:
-                return
-            if question_id:
-                question = session.get(QuizQuestion, question_id)
-                if question and question.attempt_id != attempt_id:
-                    question_id = None
-            answer = QuizAnswer(
-                attempt_id=attempt_id,
-                question_id=question_id,
-                selected_index=selected_index,
-                selected_option=selected_option,
-                is_correct=is_correct,
-                note=note,
-                confidence=confidence,
-            )
-            session.add(answer)
-            session.flush()
-            correct_answers = (
-                session.query(QuizAnswer)
-                .filter(QuizAnswer.attempt_id == attempt_id, QuizAnswer.is_correct.is_(True))
-                .count()
-            )
-            attempt.correct_count = correct_answers
+            if self._record_answers(session, session_id, attempt_id, [answer]) is None:
+                return False
             session.commit()
             return True
 
-    def get_quiz_history(self, session_id: str) -> List[Dict[str, Any]]:
+    @_retry_when_busy
+    def record_quiz_answers(
+        self, session_id: str, attempt_id: int, answers: List[Dict[str, Any]]
+    ) -> Optional[int]:
+        """Record a whole quiz's answers in one transaction; returns the attempt's new correct count"""
         with self.Session() as session:
-            attempts = (
-                session.query(QuizAttempt)
-                .filter(QuizAttempt.session_id == session_id)
-                .order_by(QuizAttempt.created_at.desc())
+            correct_count = self._record_answers(session, session_id, attempt_id, answers)
+            if correct_count is None:
+                return None
+            session.commit()
+            return correct_count
+
+    def _record_answers(
+        self, session: Session, session_id: str, attempt_id: int, answers: List[Dict[str, Any]]
+    ) -> Optional[int]:
+        """Store answers, replacing earlier answers to the same question, and keep correct_count in step.
+
+        Returns the attempt's correct count afterwards, or None if the attempt is not in this session.
+        """
+        attempt = session.get(QuizAttempt, attempt_id)
+        if not attempt or attempt.session_id != session_id:
+            return None
+        requested_ids = {answer.get("question_id") for answer in answers if answer.get("question_id")}
+        valid_ids = set()
+        if requested_ids:
+            valid_ids = {
+                question_id
+                for (question_id,) in session.query(QuizQuestion.id).filter(
+                    QuizQuestion.attempt_id == attempt_id, QuizQuestion.id.in_(requested_ids)
+                )
+            }
+        # Last submission per question wins; answers without a (valid) question are kept as they are
+        latest: Dict[Any, Dict[str, Any]] = {}
+        for index, answer in enumerate(answers):
+            question_id = answer.get("question_id") if answer.get("question_id") in valid_ids else None
+            latest[question_id if question_id is not None else ("unlinked", index)] = {**answer, "question_id": question_id}
+
+        delta = 0
+        replaced: List[Tuple[int, bool]] = []
+        if valid_ids:
+            replaced = (
+                session.query(QuizAnswer.id, QuizAnswer.is_correct)
+                .filter(QuizAnswer.attempt_id == attempt_id, QuizAnswer.question_id.in_(valid_ids))
                 .all()
             )
-            history: List[Dict[str, Any]] = []
-            for attempt in attempts:
-                questions = (
-                    session.query(QuizQuestion)
-                    .filter(QuizQuestion.attempt_id == attempt.id)
-                    .order_by(QuizQuestion.sequence)
-                    .all()
-                )
-                answers = (
-                    session.query(QuizAnswer)
-                    .filter(QuizAnswer.attempt_id == attempt.id)
-                    .order_by(QuizAnswer.created_at)
+            if replaced:
+                delta -= sum(1 for _, was_correct in replaced if was_correct)
+                # Delete first so the new rows get fresh ids (incremental analysis keys on them)
+                session.query(QuizAnswer).filter(
+                    QuizAnswer.id.in_([answer_id for answer_id, _ in replaced])
+                ).delete(synchronize_session=False)
+        new_answers = [
+            QuizAnswer(
+                attempt_id=attempt_id,
+                question_id=answer["question_id"],
+                selected_index=answer.get("selected_index"),
+                selected_option=answer.get("selected_option"),
+                is_correct=bool(answer.get("is_correct")),
+                note=answer.get("note"),
+                confidence=answer.get("confidence"),
+            )
+            for answer in latest.values()
+        ]
+        session.add_all(new_answers)
+        delta += sum(1 for answer in new_answers if answer.is_correct)
+        correct_count = (attempt.correct_count or 0) + delta
+        if delta:
+            attempt.correct_count = QuizAttempt.correct_count + delta
+        self._track_answers(session, attempt, len(new_answers) - len(replaced), delta, correct_count)
+        session.flush()
+        return correct_count
+
+    def _track_message_batch(self, session: Session, rows: List[Dict[str, Any]]) -> None:
+        counts: Dict[str, int] = {}
+        for row in rows:
+            counts[row["session_id"]] = counts.get(row["session_id"], 0) + 1
+        analyzed = {row["session_id"] for row in rows if row["task"] == "analyze"}
+        last_analysis: Dict[str, int] = {}
+        if analyzed:
+            # executemany() returns no ids; the session/task/role index answers this directly
+            last_analysis = dict(
+                session.query(Message.session_id, func.max(Message.id))
+                .filter(Message.session_id.in_(analyzed), Message.task == "analyze")
+                .group_by(Message.session_id)
+                .all()
+            )
+        for session_id, count in counts.items():
+            stats = self._session_stats(session, session_id)
+            stats.message_count += count
+            if session_id in last_analysis:
+                stats.last_analysis_id = last_analysis[session_id]
+
+    def _track_attempt(self, session: Session, session_id: str, attempt_id: int, topic: str, total: int) -> None:
+        entry = {"attempt_id": attempt_id, "topic": topic, "correct_count": 0, "total_questions": total}
+        for stats in (self._session_stats(session, session_id), self._topic_stats(session, session_id, topic)):
+            stats.quiz_attempts += 1
+            stats.recent_attempts = _push_recent(stats.recent_attempts, entry)
+
+    def _track_answers(
+        self, session: Session, attempt: QuizAttempt, answered_delta: int, correct_delta: int, correct_count: int
+    ) -> None:
+        topic_stats = self._topic_stats(session, attempt.session_id, attempt.topic)
+        for stats in (self._session_stats(session, attempt.session_id), topic_stats):
+            stats.answered_questions += answered_delta
+            stats.correct_answers += correct_delta
+            stats.recent_attempts = _set_recent_correct(stats.recent_attempts, attempt.id, correct_count)
+        if topic_stats.answered_questions:
+            topic_stats.accuracy = topic_stats.correct_answers / topic_stats.answered_questions
+
+    def _track_mastery(
+        self, session: Session, session_id: str, old_score: Optional[float], new_score: float
+    ) -> None:
+        stats = self._session_stats(session, session_id)
+        if old_score is None:
+            stats.total_concepts += 1
+        old_bucket, new_bucket = _mastery_bucket(old_score), _mastery_bucket(new_score)
+        if old_bucket != new_bucket:
+            if old_bucket:
+                setattr(stats, old_bucket, getattr(stats, old_bucket) - 1)
+            setattr(stats, new_bucket, getattr(stats, new_bucket) + 1)
+
+    def _session_stats(self, session: Session, session_id: str) -> SessionStats:
+        stats = session.get(SessionStats, session_id)
+        if stats is None:
+            stats = _new_session_stats(session_id)
+            session.add(stats)
+        return stats
+
+    def _topic_stats(self, session: Session, session_id: str, topic: str) -> TopicStats:
+        stats = (
+            session.query(TopicStats)
+            .filter(TopicStats.session_id == session_id, TopicStats.topic == topic)
+            .one_or_none()
+        )
+        if stats is None:
+            stats = _new_topic_stats(session_id, topic)
+            session.add(stats)
+        return stats
+
+    def get_learning_state(self, session_id: str, weak_topic_limit: int = 5) -> Dict[str, Any]:
+        """Counts and flags the recommendation needs, read from the aggregates in constant time"""
+        with self.Session() as session:
+            row = (
+                session.query(SessionStats.message_count, SessionStats.quiz_attempts, SessionStats.last_analysis_id)
+                .filter(SessionStats.session_id == session_id)
+                .one_or_none()
+            )
+        message_count, quiz_attempts, last_analysis_id = row or (0, 0, None)
+        return {
+            "message_count": message_count or 0,
+            "quiz_attempts": quiz_attempts or 0,
+            "last_analysis_id": last_analysis_id,
+            "weak_topics": self.get_weak_topics(session_id, limit=weak_topic_limit),
+        }
+
+    def get_session_stats(self, session_id: str, include_topics: bool = False) -> Optional[Dict[str, Any]]:
+        """Get the write-maintained analytics aggregates for a session"""
+        with self.Session() as session:
+            stats = session.get(SessionStats, session_id)
+            if stats is None:
+                return None
+            data = {
+                "quiz_attempts": stats.quiz_attempts,
+                "answered_questions": stats.answered_questions,
+                "correct_answers": stats.correct_answers,
+                "accuracy": stats.correct_answers / stats.answered_questions if stats.answered_questions else 0.0,
+                "recent_attempts": json.loads(stats.recent_attempts or "[]"),
+                "total_concepts": stats.total_concepts,
+                "mastered_concepts": stats.mastered_concepts,
+                "in_progress_concepts": stats.in_progress_concepts,
+                "needs_work_concepts": stats.needs_work_concepts,
+                "message_count": stats.message_count or 0,
+                "last_analysis_id": stats.last_analysis_id,
+            }
+            if include_topics:
+                topics = (
+                    session.query(TopicStats)
+                    .filter(TopicStats.session_id == session_id)
+                    .order_by(TopicStats.accuracy)
                     .all()
                 )
-                answer_map = {answer.question_id: answer for answer in answers}
-                history.append(
+                data["topics"] = [
                     {
-                        "attempt_id": attempt.id,
-                        "task": attempt.task,
-                        "topic": attempt.topic,
-                        "total_questions": attempt.total_questions,
-                        "correct_count": attempt.correct_count,
-                        "meta": json.loads(attempt.meta or "{}"),
-                        "created_at": attempt.created_at.isoformat(),
-                        "questions": [
-                            self._serialize_question(question, answer_map.get(question.id))
-                            for question in questions
-                        ],
+                        "topic": topic.topic,
+                        "quiz_attempts": topic.quiz_attempts,
+                        "answered_questions": topic.answered_questions,
+                        "correct_answers": topic.correct_answers,
+                        "accuracy": topic.accuracy,
+                        "recent_attempts": json.loads(topic.recent_attempts or "[]"),
                     }
-                )
-            return history
+                    for topic in topics
+                ]
+            return data
+
+    def rebuild_aggregates(self, session_id: Optional[str] = None) -> None:
+        """Recompute analytics aggregates from the source tables, e.g. after manual data fixes"""
+        with self.Session() as session:
+            _rebuild_aggregates(session, session_id)
+            session.commit()
+
+    def get_quiz_history(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        include_questions: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Get quiz attempts newest first.
+
+        ``before_id`` pages backwards from an earlier page's last ``attempt_id``. With
+        ``include_questions=False`` only attempt summaries are loaded (a single query);
+        otherwise questions and answers are eager-loaded, three queries in total.
+        """
+        with self.Session() as session:
+            query = session.query(QuizAttempt).filter(QuizAttempt.session_id == session_id)
+            if before_id is not None:
+                query = query.filter(QuizAttempt.id < before_id)
+            if include_questions:
+                query = query.options(selectinload(QuizAttempt.questions), selectinload(QuizAttempt.answers))
+            query = query.order_by(QuizAttempt.id.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            return [self._serialize_attempt(attempt, include_questions) for attempt in query.all()]
+
+    def get_quiz_attempt(self, session_id: str, attempt_id: int) -> Optional[Dict[str, Any]]:
+        """Get one attempt of a session with its questions and answers in a single joined query"""
+        with self.Session() as session:
+            attempt = (
+                session.query(QuizAttempt)
+                .options(joinedload(QuizAttempt.questions), joinedload(QuizAttempt.answers))
+                .filter(QuizAttempt.id == attempt_id, QuizAttempt.session_id == session_id)
+                .one_or_none()
+            )
+            return self._serialize_attempt(attempt) if attempt else None
+
+    def get_quiz_attempts(self, attempt_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        """Get many attempts (of any sessions) with questions and answers, keyed by attempt id.
+
+        Three queries however many attempts are requested; each attempt includes its session_id.
+        """
+        if not attempt_ids:
+            return {}
+        with self.Session() as session:
+            attempts = (
+                session.query(QuizAttempt)
+                .options(selectinload(QuizAttempt.questions), selectinload(QuizAttempt.answers))
+                .filter(QuizAttempt.id.in_(set(attempt_ids)))
+                .all()
+            )
+            return {
+                attempt.id: {**self._serialize_attempt(attempt), "session_id": attempt.session_id}
+                for attempt in attempts
+            }
+
+    def get_quiz_updates(self, session_id: str, after_answer_id: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Get attempts answered after ``after_answer_id`` (oldest first) and the newest answer id seen"""
+        with self.Session() as session:
+            rows = (
+                session.query(QuizAnswer.attempt_id, func.max(QuizAnswer.id))
+                .join(QuizAttempt, QuizAttempt.id == QuizAnswer.attempt_id)
+                .filter(QuizAttempt.session_id == session_id, QuizAnswer.id > after_answer_id)
+                .group_by(QuizAnswer.attempt_id)
+                .all()
+            )
+            if not rows:
+                return [], after_answer_id
+            attempts = (
+                session.query(QuizAttempt)
+                .filter(QuizAttempt.id.in_([attempt_id for attempt_id, _ in rows]))
+                .options(selectinload(QuizAttempt.questions), selectinload(QuizAttempt.answers))
+                .order_by(QuizAttempt.id)
+                .all()
+            )
+            last_answer_id = max(answer_id for _, answer_id in rows)
+            return [self._serialize_attempt(attempt) for attempt in attempts], last_answer_id
+
+    def get_analysis_checkpoint(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self.Session() as session:
+            checkpoint = session.get(AnalysisCheckpoint, session_id)
+            if not checkpoint:
+                return None
+            return {
+                "last_attempt_id": checkpoint.last_attempt_id,
+                "last_answer_id": checkpoint.last_answer_id,
+                "summary": checkpoint.summary,
+                "updated_at": checkpoint.updated_at.isoformat() if checkpoint.updated_at else None,
+            }
 
+    @_retry_when_busy
+    def save_analysis_checkpoint(
+        self, session_id: str, last_attempt_id: int, last_answer_id: int, summary: str
+    ) -> None:
+        with self.Session() as session:
+            checkpoint = session.get(AnalysisCheckpoint, session_id)
+            if not checkpoint:
+                checkpoint = AnalysisCheckpoint(session_id=session_id)
+                session.add(checkpoint)
+            checkpoint.last_attempt_id = last_attempt_id
+            checkpoint.last_answer_id = last_answer_id
+            checkpoint.summary = summary
+            session.commit()
+
+    @_retry_when_busy
     def log_weak_topics(self, session_id: str, summary: str) -> None:
+        with self.Session() as session:
+            self._add_weak_topics(session, session_id, summary)
+            session.commit()
+
+    def _add_weak_topics(self, session: Session, session_id: str, summary: str) -> None:
         entries = self._parse_summary(summary)
         if not entries:
             entries = [("analysis", summary.strip())]
+        created_topics = [WeakTopic(session_id=session_id, topic=topic, detail=detail) for topic, detail in entries]
+        self._invalidate_on_commit(session, session_id, "get_weak_topics", "get_roadmap_tasks")
+        session.add_all(created_topics)
+        session.flush()
+        if created_topics:
+            self._create_tasks_from_weak_topics(session, session_id, created_topics)
+
+    @_cached_read
+    def get_history(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get messages oldest first.
+
+        Without arguments the whole conversation is returned. ``after_id`` returns up to
+        ``limit`` messages following that id; otherwise ``limit``/``before_id`` return the
+        newest messages before ``before_id`` (or the newest overall), still oldest first.
+        """
+        self._read_your_writes()
         with self.Session() as session:
-            created_topics: List[WeakTopic] = []
-            for topic, detail in entries:
-                weak_topic = WeakTopic(session_id=session_id, topic=topic, detail=detail)
-                session.add(weak_topic)
-                created_topics.append(weak_topic)
-            session.flush()
-            if created_topics:
-                self._create_tasks_from_weak_topics(session, session_id, created_topics)
-            session.commit()
+            query = session.query(Message).filter(Message.session_id == session_id)
+            if after_id is not None:
+                query = query.filter(Message.id > after_id).order_by(Message.id)
+                if limit is not None:
+                    query = query.limit(limit)
+                records = query.all()
+            elif limit is not None or before_id is not None:
+                if before_id is not None:
+                    query = query.filter(Message.id < before_id)
+                query = query.order_by(Message.id.desc())
+                if limit is not None:
+                    query = query.limit(limit)
+                records = list(reversed(query.all()))
+            else:
+                records = query.order_by(Message.id).all()
+            return [self._serialize_message(message) for message in records]
+
+    def get_session_dashboard(
+        self, session_id: str, sections: Sequence[str], history_limit: int = 50
+    ) -> Dict[str, Any]:
+        """Load the requested DASHBOARD_SECTIONS of a session with one query per section.
+
+        With "recommendations" the inputs of the recommendation are returned under
+        ``recommendation_inputs``, taken from the write-maintained aggregates.
+        """
+        data: Dict[str, Any] = {}
+        if "history" in sections:
+            data["history"] = self.get_history(session_id, limit=history_limit)
+        if "weak_topics" in sections:
+            data["weak_topics"] = self.get_weak_topics(session_id)
+        if "roadmap" in sections:
+            data["roadmap"] = self.get_roadmap_tasks(session_id)
+        if "analysis" in sections:
+            analysis = self.get_latest_message(session_id, task="analyze", role="assistant")
+            data["analysis"] = (
+                {"summary": analysis["content"], "timestamp": analysis["created_at"]} if analysis else None
+            )
+        if "mastery" in sections:
+            data["mastery"] = self.get_concept_mastery(session_id)
+        if "recommendations" in sections:
+            # Weak topics come from the read cache when the section above loaded them
+            state = self.get_learning_state(session_id)
+            stats = self.get_session_stats(session_id) or {}
+            data["recommendation_inputs"] = {
+                "message_count": state["message_count"],
+                "quiz_attempts": state["quiz_attempts"],
+                "recent_attempts": stats.get("recent_attempts", []),
+                "weak_topics": state["weak_topics"],
+                "has_analysis": state["last_analysis_id"] is not None,
+            }
+        return data
+
+    def get_latest_message(
+        self, session_id: str, task: str, role: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get the newest message of a task (and role), served by the session/task/role index"""
+        self._read_your_writes()
+        with self.Session() as session:
+            query = session.query(Message).filter(Message.session_id == session_id, Message.task == task)
+            if role is not None:
+                query = query.filter(Message.role == role)
+            message = query.order_by(Message.id.desc()).first()
+            return self._serialize_message(message) if message else None
+
+    def get_message(self, session_id: str, message_id: int) -> Optional[Dict[str, Any]]:
+        """Get one message of a session by id"""
+        self._read_your_writes()
+        with self.Session() as session:
+            message = (
+                session.query(Message).filter(Message.id == message_id, Message.session_id == session_id).one_or_none()
+            )
+            return self._serialize_message(message) if message else None
 
-    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+    def has_run_message(self, session_id: str, run_id: str, role: str = "user") -> bool:
+        """Whether a message of ``role`` was already logged for the agent run ``run_id``, e.g. by a
+        failed attempt of it"""
+        self._read_your_writes()
         with self.Session() as session:
-            records = (
-                session.query(Message)
-                .filter(Message.session_id == session_id)
-                .order_by(Message.created_at)
+            metas = (
+                session.query(Message.meta)
+                .filter(
+                    Message.session_id == session_id,
+                    Message.role == role,
+                    Message.meta.contains(run_id, autoescape=True),
+                )
                 .all()
             )
-            return [
-                {
-                    "role": message.role,
-                    "content": message.content,
-                    "task": message.task,
-                    "meta": json.loads(message.meta or "{}"),
-                    "created_at": message.created_at.isoformat(),
-                }
-                for message in records
-            ]
+            return any(json.loads(meta or "{}").get("run_id") == run_id for (meta,) in metas)
 
+    @_cached_read
     def get_weak_topics(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Get weak topics for a session, limited to most recent (default 5)"""
         with self.Session() as session:
@@ -345,6 +1577,7 @@ class Storage:
                 for topic in topics
             ]
 
+    @_cached_read
     def get_roadmap_tasks(self, session_id: str) -> List[Dict[str, Any]]:
         with self.Session() as session:
             tasks = (
@@ -367,6 +1600,7 @@ class Storage:
                 for task in tasks
             ]
 
+    @_retry_when_busy
     def update_task_status(self, session_id: str, task_id: int, status: str) -> bool:
         if status not in {TASK_STATUS_PENDING, TASK_STATUS_COMPLETE}:
             return False
@@ -375,6 +1609,7 @@ class Storage:
             if not task or task.session_id != session_id:
                 return False
             task.status = status
+            self._invalidate_on_commit(session, session_id, "get_roadmap_tasks")
             session.commit()
             return True
 
@@ -468,6 +1703,36 @@ class Storage:
         
         return items[:5]  # Limit to top 5
 
+    def _serialize_message(self, message: Message) -> Dict[str, Any]:
+        return {
+            "id": message.id,
+            "role": message.role,
+            "content": message.content,
+            "task": message.task,
+            "meta": json.loads(message.meta or "{}"),
+            "created_at": message.created_at.isoformat(),
+        }
+
+    def _serialize_attempt(self, attempt: QuizAttempt, include_questions: bool = True) -> Dict[str, Any]:
+        data = {
+            "attempt_id": attempt.id,
+            "task": attempt.task,
+            "topic": attempt.topic,
+            "total_questions": attempt.total_questions,
+            "correct_count": attempt.correct_count,
+            "meta": json.loads(attempt.meta or "{}"),
+            "created_at": attempt.created_at.isoformat(),
+            "archived": attempt.archived_at is not None,
+        }
+        if include_questions:
+            # Later answers to the same question replace earlier ones
+            answer_map = {answer.question_id: answer for answer in attempt.answers}
+            data["questions"] = [
+                self._serialize_question(question, answer_map.get(question.id))
+                for question in attempt.questions
+            ]
+        return data
+
     def _serialize_question(self, question: QuizQuestion, answer: Optional[QuizAnswer]) -> Dict[str, Any]:
         return {
             "id": question.id,
@@ -499,47 +1764,180 @@ class Storage:
             "created_at": answer.created_at.isoformat() if answer.created_at else None,
         }
 
+    @_retry_when_busy
     def update_concept_mastery(self, session_id: str, concept: str, correct: int, total: int) -> Dict[str, Any]:
-        """Update or create mastery tracking for a concept"""
+        """Update or create mastery tracking for a concept with one atomic upsert"""
         with self.Session() as session:
-            mastery = session.query(ConceptMastery).filter(
-                ConceptMastery.session_id == session_id,
-                ConceptMastery.concept == concept
-            ).first()
-            
-            if mastery:
-                mastery.total_questions += total
-                mastery.correct_answers += correct
-                mastery.quiz_attempts += 1
-            else:
-                mastery = ConceptMastery(
-                    session_id=session_id,
-                    concept=concept,
-                    total_questions=total,
-                    correct_answers=correct,
-                    quiz_attempts=1
-                )
-                session.add(mastery)
-            
-            # Calculate mastery score (0-100)
-            if mastery.total_questions > 0:
-                accuracy = (mastery.correct_answers / mastery.total_questions) * 100
-                # Weight by number of attempts (more attempts = more reliable score)
-                confidence_factor = min(mastery.quiz_attempts / 5, 1.0)
-                mastery.mastery_score = accuracy * confidence_factor
-            
+            result = self._upsert_mastery(session, session_id, concept, correct, total)
             session.commit()
-            session.refresh(mastery)
-            
+            return result
+
+    def _upsert_mastery(
+        self, session: Session, session_id: str, concept: str, correct: int, total: int, review: bool = True
+    ) -> Dict[str, Any]:
+        statement = sqlite_insert(ConceptMastery).values(
+            session_id=session_id,
+            concept=concept,
+            total_questions=total,
+            correct_answers=correct,
+            quiz_attempts=1,
+            mastery_score=_mastery_score(correct, total, 1),
+        )
+        # SET expressions see the existing row, so these are the totals after this update
+        new_total = ConceptMastery.total_questions + statement.excluded.total_questions
+        new_correct = ConceptMastery.correct_answers + statement.excluded.correct_answers
+        new_attempts = ConceptMastery.quiz_attempts + 1
+        statement = statement.on_conflict_do_update(
+            index_elements=[ConceptMastery.session_id, ConceptMastery.concept],
+            set_={
+                "total_questions": new_total,
+                "correct_answers": new_correct,
+                "quiz_attempts": new_attempts,
+                # Same formula as _mastery_score: accuracy weighted by min(attempts / 5, 1)
+                "mastery_score": case(
+                    (new_total > 0, new_correct * 100.0 / new_total * func.min(new_attempts / 5.0, 1.0)),
+                    else_=ConceptMastery.mastery_score,
+                ),
+                "last_practiced": func.now(),
+            },
+        ).returning(
+            ConceptMastery.concept,
+            ConceptMastery.mastery_score,
+            ConceptMastery.total_questions,
+            ConceptMastery.correct_answers,
+            ConceptMastery.quiz_attempts,
+            ConceptMastery.last_practiced,
+        )
+        old_score = (
+            session.query(ConceptMastery.mastery_score)
+            .filter(ConceptMastery.session_id == session_id, ConceptMastery.concept == concept)
+            .scalar()
+        )
+        mastery = session.execute(statement).one()
+        self._invalidate_on_commit(session, session_id, "get_concept_mastery")
+        self._track_mastery(session, session_id, old_score, float(mastery.mastery_score))
+        result = {
+            "concept": mastery.concept,
+            "mastery_score": round(float(mastery.mastery_score), 2),
+            "total_questions": mastery.total_questions,
+            "correct_answers": mastery.correct_answers,
+            "quiz_attempts": mastery.quiz_attempts,
+            "last_practiced": mastery.last_practiced.isoformat(),
+        }
+        if review and total:
+            result["next_review"] = self._schedule_review(session, session_id, concept, correct, total)
+        return result
+
+    def _schedule_review(
+        self, session: Session, session_id: str, concept: str, correct: int, total: int
+    ) -> Dict[str, Any]:
+        """Grade a quiz result as one SM-2 review of the concept and move its schedule.
+
+        Only a review at or after ``due_at`` advances the repetitions, interval and ease, so
+        quizzing again before then does not stretch the interval. A failed early review
+        starts the concept over but keeps its ease.
+        """
+        quality = _review_quality(correct, total)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        current = (
+            session.query(
+                ReviewSchedule.repetitions, ReviewSchedule.interval_days, ReviewSchedule.ease, ReviewSchedule.due_at
+            )
+            .filter(ReviewSchedule.session_id == session_id, ReviewSchedule.concept == concept)
+            .one_or_none()
+        )
+        rescheduled = True
+        if current is None:
+            repetitions, interval_days, ease = _next_review(0, 0.0, INITIAL_EASE, quality)
+        elif current.due_at is None or current.due_at <= now:
+            repetitions, interval_days, ease = _next_review(
+                current.repetitions, current.interval_days, current.ease, quality
+            )
+        elif quality < PASSING_QUALITY:
+            repetitions, interval_days, ease = 0, FIRST_INTERVALS_DAYS[0], current.ease
+        else:
+            repetitions, interval_days, ease = current.repetitions, current.interval_days, current.ease
+            rescheduled = False
+        lapsed = current is not None and current.repetitions > 0 and quality < PASSING_QUALITY
+        values = {"last_quality": quality, "last_reviewed": now}
+        if rescheduled:
+            values.update(
+                repetitions=repetitions,
+                interval_days=interval_days,
+                ease=round(ease, 4),
+                due_at=now + timedelta(days=interval_days),
+            )
+        # An upsert, so two first quizzes on a concept racing each other cannot both insert
+        statement = sqlite_insert(ReviewSchedule).values(
+            session_id=session_id,
+            concept=concept,
+            repetitions=repetitions,
+            interval_days=interval_days,
+            ease=round(ease, 4),
+            due_at=now + timedelta(days=interval_days),
+            lapses=0,
+            last_quality=quality,
+            last_reviewed=now,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[ReviewSchedule.session_id, ReviewSchedule.concept],
+            set_={**values, "lapses": ReviewSchedule.lapses + (1 if lapsed else 0)},
+        ).returning(ReviewSchedule.due_at, ReviewSchedule.interval_days)
+        schedule = session.execute(statement).one()
+        return {
+            "due_at": schedule.due_at.isoformat(),
+            "interval_days": float(schedule.interval_days),
+            "quality": quality,
+            "rescheduled": rescheduled,
+        }
+
+    def get_due_reviews(
+        self, session_id: str, limit: int = 20, now: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Concepts due for review, most overdue first, and when the next one falls due.
+
+        Both are range reads of ix_review_schedule_session_due, so the cost depends on
+        ``limit`` and not on how many concepts the session has.
+        """
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        with self.Session() as session:
+            rows = (
+                session.query(ReviewSchedule, ConceptMastery.mastery_score)
+                .outerjoin(
+                    ConceptMastery,
+                    (ConceptMastery.session_id == ReviewSchedule.session_id)
+                    & (ConceptMastery.concept == ReviewSchedule.concept),
+                )
+                .filter(ReviewSchedule.session_id == session_id, ReviewSchedule.due_at <= now)
+                .order_by(ReviewSchedule.due_at)
+                .limit(limit)
+                .all()
+            )
+            next_due_at = (
+                session.query(ReviewSchedule.due_at)
+                .filter(ReviewSchedule.session_id == session_id, ReviewSchedule.due_at > now)
+                .order_by(ReviewSchedule.due_at)
+                .limit(1)
+                .scalar()
+            )
             return {
-                "concept": mastery.concept,
-                "mastery_score": round(mastery.mastery_score, 2),
-                "total_questions": mastery.total_questions,
-                "correct_answers": mastery.correct_answers,
-                "quiz_attempts": mastery.quiz_attempts,
-                "last_practiced": mastery.last_practiced.isoformat(),
+                "due": [
+                    {
+                        "concept": schedule.concept,
+                        "due_at": schedule.due_at.isoformat(),
+                        "overdue_days": round((now - schedule.due_at).total_seconds() / 86400, 2),
+                        "interval_days": schedule.interval_days,
+                        "ease": schedule.ease,
+                        "repetitions": schedule.repetitions,
+                        "lapses": schedule.lapses,
+                        "mastery_score": round(mastery_score, 2) if mastery_score is not None else None,
+                    }
+                    for schedule, mastery_score in rows
+                ],
+                "next_due_at": next_due_at.isoformat() if next_due_at else None,
             }
 
+    @_cached_read
     def get_concept_mastery(self, session_id: str, concept: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get mastery data for a specific concept or all concepts"""
         with self.Session() as session:
@@ -562,3 +1960,48 @@ class Storage:
                 }
                 for m in masteries
             ]
+
+
+class UnitOfWork:
+    """Storage writes that share one session and are committed together by ``Storage.unit_of_work``"""
+
+    def __init__(self, storage: Storage, session: Session):
+        self.storage = storage
+        self.session = session
+
+    def ensure_session(self, session_id: Optional[str]) -> str:
+        return self.storage._ensure_session(self.session, session_id)
+
+    def log_message(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.storage._add_message(self.session, session_id, role, content, task=task, meta=meta)
+
+    def log_quiz_attempt(
+        self,
+        session_id: str,
+        topic: str,
+        raw_output: str,
+        questions: Optional[List[Dict[str, Any]]] = None,
+        task: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
+        return self.storage._add_quiz_attempt(
+            self.session, session_id, topic, raw_output, questions=questions, task=task, meta=meta
+        )
+
+    def log_weak_topics(self, session_id: str, summary: str) -> None:
+        self.storage._add_weak_topics(self.session, session_id, summary)
+
+    def update_concept_mastery(
+        self, session_id: str, concept: str, correct: int, total: int, review: bool = True
+    ) -> Dict[str, Any]:
+        return self.storage._upsert_mastery(self.session, session_id, concept, correct, total, review=review)
+
+    def schedule_review(self, session_id: str, concept: str, correct: int, total: int) -> Dict[str, Any]:
+        return self.storage._schedule_review(self.session, session_id, concept, correct, total)
@@ -1,5 +1,6 @@
+import json
 import httpx
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 
 OLLAMA_BASE_URL = "http://127.0.0.1:11434"
 
@@ -10,11 +11,29 @@ class OllamaClient:
         self.model = model
         self._client = httpx.Client(timeout=60.0)
 
-    def generate(self, prompt: str, system: Optional[str] = None) -> str:
-        payload: Dict[str, Any] = {"model": self.model, "prompt": prompt, "stream": False}
+    def generate(
+        self, prompt: str, system: Optional[str] = None, on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Generate a completion; with ``on_token`` the response is streamed and every chunk is
+        passed to it as it arrives. The full text is returned either way."""
+        payload: Dict[str, Any] = {"model": self.model, "prompt": prompt, "stream": on_token is not None}
         if system:
             payload["system"] = system
 
+        if on_token is not None:
+            parts: List[str] = []
+            with self._client.stream("POST", f"{self.base_url}/api/generate", json=payload) as r:
+                r.raise_for_status()
+                # One JSON object per line, the last one has "done": true
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line).get("response", "")
+                    if chunk:
+                        parts.append(chunk)
+                        on_token(chunk)
+            return "".join(parts)
+
         r = self._client.post(f"{self.base_url}/api/generate", json=payload)
         r.raise_for_status()
         data = r.json()
@@ -0,0 +1,80 @@
+"""Measure serialization time and payload size of a large /api/history response.
+
+Seeds a session with chat messages whose meta carries full retrieved documents (as rows
+logged before retrieval refs still do) and compares FastAPI's default JSON path with the orjson response and gzip.
+
+Usage: python scripts/bench_serialization.py [--messages 5000] [--repeat 5]
+"""
+import argparse
+import gzip
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.responses import FastJSONResponse  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+RETRIEVED_DOCS = 4
+DOC_TEXT = "Photosynthesis converts light energy into chemical energy stored in glucose. " * 12
+
+
+def seed(storage: Storage, messages: int) -> str:
+    session_id = storage.ensure_session(None)
+    with storage.unit_of_work() as uow:
+        for i in range(messages // 2):
+            uow.log_message(session_id, "user", f"Question {i} about photosynthesis?", task="tutor")
+            meta = {
+                "retrieved": [
+                    {"score": 0.9 - doc / 10, "text": DOC_TEXT, "meta": {"source": f"notes-{doc}.md"}}
+                    for doc in range(RETRIEVED_DOCS)
+                ],
+                "run_id": f"run-{i}",
+            }
+            uow.log_message(session_id, "assistant", f"Answer {i}: " + DOC_TEXT[:300], task="tutor", meta=meta)
+    return session_id
+
+
+def timed(fn, repeat: int):
+    """Median wall time in milliseconds and the last result"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile="production")
+        session_id = seed(storage, args.messages)
+        load_ms, messages = timed(lambda: storage.get_history(session_id), args.repeat)
+        content = {"session_id": session_id, "messages": messages, "next_before_id": None}
+
+        default_ms, default_body = timed(lambda: JSONResponse(jsonable_encoder(content)).body, args.repeat)
+        orjson_ms, orjson_body = timed(lambda: FastJSONResponse(content).body, args.repeat)
+        gzip_ms, compressed = timed(lambda: gzip.compress(orjson_body, compresslevel=6), args.repeat)
+        storage.engine.dispose()
+
+    print(f"{len(messages)} messages, median of {args.repeat} runs")
+    print(f"  load from storage:           {load_ms:8.1f} ms")
+    print(f"  jsonable_encoder + json:     {default_ms:8.1f} ms  {len(default_body) / 1e6:6.2f} MB")
+    print(f"  orjson:                      {orjson_ms:8.1f} ms  {len(orjson_body) / 1e6:6.2f} MB")
+    print(f"  gzip level 6 (on the wire):  {gzip_ms:8.1f} ms  {len(compressed) / 1e6:6.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
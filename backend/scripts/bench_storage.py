@@ -0,0 +1,83 @@
+"""Compare SQLite engine profiles under concurrent readers and writers.
+
+Usage: python scripts/bench_storage.py [--clients 8] [--seconds 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import ENGINE_PROFILES, Storage  # noqa: E402
+
+SEED_MESSAGES = 2000
+
+
+def run_profile(profile: str, clients: int, seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile=profile)
+        session_id = storage.ensure_session(None)
+        with storage.unit_of_work() as uow:
+            for i in range(SEED_MESSAGES):
+                uow.log_message(session_id, "user", f"seed message {i}", task="tutor")
+
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def reader() -> None:
+            done = 0
+            while time.perf_counter() < deadline:
+                storage.get_history(session_id, limit=50)
+                storage.get_weak_topics(session_id)
+                done += 1
+            with lock:
+                counts["reads"] += done
+
+        def writer() -> None:
+            done = errors = 0
+            while time.perf_counter() < deadline:
+                try:
+                    storage.log_message(session_id, "assistant", "benchmark reply", task="tutor")
+                    done += 1
+                except Exception:
+                    errors += 1
+            with lock:
+                counts["writes"] += done
+                counts["errors"] += errors
+
+        # Half of the clients read, half write
+        threads = [threading.Thread(target=reader) for _ in range(max(clients // 2, 1))]
+        threads += [threading.Thread(target=writer) for _ in range(max(clients - len(threads), 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        storage.engine.dispose()
+        return {
+            "reads/s": counts["reads"] / seconds,
+            "writes/s": counts["writes"] / seconds,
+            "errors": counts["errors"],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.clients} concurrent clients, {args.seconds:.0f}s per profile")
+    for profile in ENGINE_PROFILES:
+        result = run_profile(profile, args.clients, args.seconds)
+        print(
+            f"{profile:>10}: {result['reads/s']:8.0f} reads/s  "
+            f"{result['writes/s']:8.0f} writes/s  {result['errors']} errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
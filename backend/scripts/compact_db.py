@@ -0,0 +1,71 @@
+"""Archive old messages and quiz details into compressed chunks and reclaim free space.
+
+Also drops agent run checkpoints that are too old to be resumed.
+
+Free pages are returned with incremental VACUUM. A database created without
+auto_vacuum=INCREMENTAL has to be switched once with --full-vacuum, which rewrites the whole
+file under an exclusive lock; run that while the server is stopped.
+
+Usage: python scripts/compact_db.py [--db path/to/chat.db] [--max-age-days 90]
+       [--keep-messages 500] [--keep-attempts 50] [--vacuum-pages N] [--no-vacuum] [--full-vacuum]
+       [--checkpoint-db path/to/checkpoints.db] [--checkpoint-max-age-hours 24]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agent import CHECKPOINT_MAX_AGE_HOURS, prune_checkpoints  # noqa: E402
+from app.retention import RetentionPolicy, archive, checkpoint_wal, compact  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_DB = os.path.join(DATA_DIR, "chat.db")
+DEFAULT_CHECKPOINT_DB = os.path.join(DATA_DIR, "checkpoints.db")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--max-age-days", type=float, default=None, help="archive rows older than this")
+    parser.add_argument("--keep-messages", type=int, default=None, help="newest messages kept per session")
+    parser.add_argument("--keep-attempts", type=int, default=None, help="newest quiz attempts kept per session")
+    parser.add_argument("--vacuum-pages", type=int, default=None, help="free at most this many pages")
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument(
+        "--full-vacuum", action="store_true", help="switch to incremental VACUUM (locks the database)"
+    )
+    parser.add_argument("--checkpoint-db", default=DEFAULT_CHECKPOINT_DB)
+    parser.add_argument(
+        "--checkpoint-max-age-hours",
+        type=float,
+        default=CHECKPOINT_MAX_AGE_HOURS,
+        help="drop checkpoints of agent runs started longer ago than this",
+    )
+    args = parser.parse_args()
+
+    storage = Storage(f"sqlite:///{args.db}")
+    checkpoint_wal(storage)
+    before = os.path.getsize(args.db)
+    policy = RetentionPolicy(
+        max_age_days=args.max_age_days, keep_messages=args.keep_messages, keep_attempts=args.keep_attempts
+    )
+    counts = archive(storage, policy)
+    print(f"Archived {counts['messages']} messages and {counts['quiz_attempts']} quiz attempts")
+    if not args.no_vacuum:
+        result = compact(storage, max_pages=args.vacuum_pages, full_vacuum=args.full_vacuum)
+        if result["full_vacuum_needed"]:
+            print("Not vacuumed: run once with --full-vacuum (while the server is stopped) first")
+        else:
+            print(f"Freed {result['freed_pages']} pages")
+    else:
+        checkpoint_wal(storage)
+    print(f"{args.db}: {before / 1024:.0f} KiB -> {os.path.getsize(args.db) / 1024:.0f} KiB")
+    if os.path.exists(args.checkpoint_db):
+        pruned = prune_checkpoints(args.checkpoint_db, args.checkpoint_max_age_hours)
+        print(f"Pruned the checkpoints of {pruned} agent runs from {args.checkpoint_db}")
+
+
+if __name__ == "__main__":
+    main()
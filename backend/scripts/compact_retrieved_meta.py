@@ -0,0 +1,125 @@
+"""Shrink message and quiz attempt meta logged before retrieval refs were introduced.
+
+Older rows carry the full text of every retrieved chunk in ``meta["retrieved"]``. Each
+entry whose text is still in the FAISS memory is replaced by its doc id and score, which
+/api/citations resolves on demand; entries that are no longer in the memory are kept.
+Archived rows are not touched (rehydrate them first to include them).
+
+Usage: python scripts/compact_retrieved_meta.py [--db path/to/chat.db] [--memory-dir path/to/data]
+       [--batch-size 500] [--dry-run] [--no-vacuum] [--full-vacuum]
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import update  # noqa: E402
+
+from app.memory import FAISSMemory  # noqa: E402
+from app.retention import checkpoint_wal, compact  # noqa: E402
+from app.storage import Message, QuizAttempt, Storage  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_DB = os.path.join(DATA_DIR, "chat.db")
+
+
+def shrink_meta(raw: str, doc_ids_by_text: Dict[str, str]) -> Tuple[Optional[str], int]:
+    """New meta JSON (None when nothing changed) and the number of entries left unresolved"""
+    meta = json.loads(raw)
+    retrieved = meta.get("retrieved")
+    if not isinstance(retrieved, list):
+        return None, 0
+    changed = False
+    unresolved = 0
+    refs = []
+    for item in retrieved:
+        if not isinstance(item, dict) or "text" not in item:
+            refs.append(item)
+            continue
+        doc_id = item.get("doc_id") or doc_ids_by_text.get(item["text"])
+        if doc_id is None:
+            unresolved += 1
+            refs.append(item)
+            continue
+        refs.append({"doc_id": doc_id, "score": round(float(item.get("score", 0.0)), 4)})
+        changed = True
+    if not changed:
+        return None, unresolved
+    meta["retrieved"] = refs
+    return json.dumps(meta), unresolved
+
+
+def shrink_table(
+    storage: Storage, model: Any, doc_ids_by_text: Dict[str, str], batch_size: int, dry_run: bool
+) -> Dict[str, int]:
+    counts = {"rows": 0, "unresolved": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    while True:
+        # One transaction per batch keeps the write lock short while the server is running
+        with storage.Session() as session:
+            rows = (
+                session.query(model.id, model.meta)
+                .filter(model.id > last_id, model.meta.like('%"retrieved"%'))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return counts
+            last_id = rows[-1].id
+            changes = []
+            for row in rows:
+                meta, unresolved = shrink_meta(row.meta, doc_ids_by_text)
+                counts["unresolved"] += unresolved
+                if meta is None:
+                    continue
+                changes.append({"id": row.id, "meta": meta})
+                counts["rows"] += 1
+                counts["bytes_before"] += len(row.meta.encode("utf-8"))
+                counts["bytes_after"] += len(meta.encode("utf-8"))
+            if changes and not dry_run:
+                session.execute(update(model), changes)
+                session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--memory-dir", default=DATA_DIR, help="directory of memory.index / memory_meta.json")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument(
+        "--full-vacuum", action="store_true", help="switch to incremental VACUUM (locks the database)"
+    )
+    args = parser.parse_args()
+
+    storage = Storage(f"sqlite:///{args.db}")
+    memory = FAISSMemory(data_dir=args.memory_dir)
+    doc_ids_by_text = {entry.get("text"): doc_id for doc_id, entry in memory.metadata.items()}
+    checkpoint_wal(storage)
+    before = os.path.getsize(args.db)
+    for name, model in (("messages", Message), ("quiz attempts", QuizAttempt)):
+        counts = shrink_table(storage, model, doc_ids_by_text, args.batch_size, args.dry_run)
+        print(
+            f"{name}: {counts['rows']} rows, meta {counts['bytes_before'] / 1024:.0f} KiB -> "
+            f"{counts['bytes_after'] / 1024:.0f} KiB, {counts['unresolved']} entries not in the memory"
+        )
+    if args.dry_run:
+        return
+    if not args.no_vacuum:
+        result = compact(storage, full_vacuum=args.full_vacuum)
+        if result["full_vacuum_needed"]:
+            print("Not vacuumed: run once with --full-vacuum (while the server is stopped) first")
+        else:
+            print(f"Freed {result['freed_pages']} pages")
+    else:
+        checkpoint_wal(storage)
+    print(f"{args.db}: {before / 1024:.0f} KiB -> {os.path.getsize(args.db) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
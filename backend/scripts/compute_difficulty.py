@@ -0,0 +1,42 @@
+"""Recompute cross-session concept and question difficulty from all quiz answers.
+
+Run it periodically (e.g. nightly from cron); /api/analytics/difficulty serves the results of
+the last run. Answers are streamed in chunks, so memory stays flat as the answer table grows.
+
+Usage: python scripts/compute_difficulty.py [--db path/to/chat.db] [--chunk-size 100000] [--top 10]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analytics import CHUNK_SIZE, compute_difficulty, get_concept_difficulty  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "chat.db")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows read per query")
+    parser.add_argument("--top", type=int, default=10, help="hardest concepts to print")
+    args = parser.parse_args()
+
+    storage = Storage(f"sqlite:///{args.db}")
+    result = compute_difficulty(storage, chunk_size=args.chunk_size)
+    print(
+        f"{result['answers']} answers, {result['concepts']} concepts, "
+        f"{result['questions']} questions in {result['seconds']:.1f}s"
+    )
+    for row in get_concept_difficulty(storage, limit=args.top):
+        discrimination = "-" if row["discrimination"] is None else f"{row['discrimination']:.2f}"
+        print(
+            f"  {row['concept'][:40]:40}  p={row['p_correct']:.2f}  discrimination={discrimination}  "
+            f"answers={row['answers']}  learners={row['learners']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Upgrade an existing chat database to the current schema (indexes, constraints, data fixes).
+
+Storage also does this on startup; run this to migrate ahead of a deploy.
+Usage: python scripts/migrate_db.py [path/to/chat.db]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect  # noqa: E402
+
+from app.storage import Storage  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "chat.db")
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB
+    storage = Storage(f"sqlite:///{path}")
+    with storage.engine.connect() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    inspector = inspect(storage.engine)
+    print(f"{path}: schema version {version}")
+    for table in inspector.get_table_names():
+        names = ", ".join(index["name"] for index in inspector.get_indexes(table)) or "-"
+        print(f"  {table}: {names}")
+
+
+if __name__ == "__main__":
+    main()
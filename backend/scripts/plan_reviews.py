@@ -0,0 +1,38 @@
+"""Prepare tomorrow's spaced-repetition review queues for all sessions.
+
+Run it nightly (e.g. from cron). Concepts practised before the scheduler existed get a
+schedule, and sessions with more than --max-per-day concepts due keep the most overdue ones;
+the rest move on to the following days.
+
+Usage: python scripts/plan_reviews.py [--db path/to/chat.db] [--day YYYY-MM-DD] [--max-per-day 50]
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.reviews import MAX_REVIEWS_PER_DAY, plan_reviews  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "chat.db")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--day", type=date.fromisoformat, default=None, help="UTC day to plan (default tomorrow)")
+    parser.add_argument("--max-per-day", type=int, default=MAX_REVIEWS_PER_DAY, help="0 disables the cap")
+    args = parser.parse_args()
+
+    storage = Storage(f"sqlite:///{args.db}")
+    counts = plan_reviews(storage, day=args.day, max_per_day=args.max_per_day)
+    print(
+        f"Scheduled {counts['backfilled']} unscheduled concepts; {counts['due']} reviews due in "
+        f"{counts['sessions']} sessions, {counts['postponed']} postponed"
+    )
+
+
+if __name__ == "__main__":
+    main()
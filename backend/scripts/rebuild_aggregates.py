@@ -0,0 +1,28 @@
+"""Recompute the write-maintained analytics aggregates from the source tables.
+
+Usage: python scripts/rebuild_aggregates.py [--db path/to/chat.db] [--session SESSION_ID]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import Storage  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "chat.db")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--session", default=None, help="only rebuild this session")
+    args = parser.parse_args()
+
+    storage = Storage(f"sqlite:///{args.db}")
+    storage.rebuild_aggregates(args.session)
+    print(f"Rebuilt aggregates for {args.session or 'all sessions'} in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Admission control tests; run with ``python -m pytest test_admission.py`` from backend/"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.admission import AdmissionController, AdmissionRejected, task_cost  # noqa: E402
+
+
+def test_waiting_sessions_are_served_round_robin():
+    async def scenario():
+        admission = AdmissionController(capacity=1, max_in_flight_per_session=10, burst=10)
+        order = []
+        gate = asyncio.Event()
+
+        async def call(key: str, number: int):
+            async with admission.slot(key):
+                order.append((key, number))
+                await gate.wait()
+
+        blocker = asyncio.create_task(call("busy", 0))
+        await asyncio.sleep(0)
+        # The busy session queues three calls before the quiet one asks for its first
+        tasks = [asyncio.create_task(call("busy", number)) for number in (1, 2, 3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("quiet", 1)))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 4
+        gate.set()
+        await asyncio.gather(blocker, *tasks)
+        return order, admission.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == [("busy", 0), ("busy", 1), ("quiet", 1), ("busy", 2), ("busy", 3)]
+    assert (stats["running"], stats["queued"], stats["admitted"]) == (0, 0, 5)
+
+
+def test_calls_over_the_limits_are_rejected_with_a_retry_hint():
+    async def scenario():
+        admission = AdmissionController(capacity=1, rate_per_minute=60, burst=4, max_in_flight_per_session=2)
+        await admission.acquire("s1", task_cost("roadmap"))
+        with pytest.raises(AdmissionRejected, match="rate limit") as rate_limited:
+            await admission.acquire("s1", task_cost("analyze"))
+        assert 1.0 <= rate_limited.value.retry_after <= 1.1
+
+        queued = asyncio.create_task(admission.acquire("s2"))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(admission.acquire("s2"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected, match="in flight"):
+            await admission.acquire("s2")
+
+        admission.release("s1")
+        await queued
+        admission.release("s2")
+        await waiting
+        admission.release("s2")
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 2
+    assert stats["sessions"]["s1"]["rejected"] == 1
+    assert stats["sessions"]["s2"]["completed"] == 2
+
+
+def test_a_timed_out_wait_gives_back_its_tokens():
+    async def scenario():
+        admission = AdmissionController(capacity=1, burst=2, queue_timeout=0.01)
+        await admission.acquire("s1")
+        with pytest.raises(AdmissionRejected, match="Timed out"):
+            await admission.acquire("s2", 2)
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queued"] == 0
+    assert stats["sessions"]["s2"]["tokens"] == 2
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Agent run logging tests with a stub LLM and memory; run with ``python -m pytest test_agent_runs.py``
+from backend/"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.agent import StudyAgent  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+
+class _Memory:
+    def similarity_search(self, query, k=5):
+        return [("doc-1", 0.9, {"text": "A stack is last in, first out.", "meta": {}})]
+
+
+class _LLM:
+    def __init__(self):
+        self.fail = False
+
+    def generate(self, prompt, system=None, on_token=None):
+        if self.fail:
+            raise RuntimeError("ollama is not reachable")
+        return "A stack is LIFO."
+
+
+@pytest.fixture(params=[False, True], ids=["no-checkpoints", "checkpoints"])
+def agent(request, tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'chat.db'}")
+    checkpoint_path = str(tmp_path / "checkpoints.db") if request.param else None
+    agent = StudyAgent(_Memory(), storage=storage, checkpoint_path=checkpoint_path)
+    agent.llm = _LLM()
+    return agent
+
+
+def _history(agent, session_id):
+    return [(m["role"], m["content"]) for m in agent.storage.get_history(session_id)]
+
+
+def test_failed_run_logs_the_user_message_once(agent):
+    session_id = agent.storage.ensure_session(None)
+    agent.llm.fail = True
+    failed = agent.run("tutor", "What is a stack?", session_id=session_id)
+    assert "error" in failed["output"]
+    assert _history(agent, session_id) == [("user", "What is a stack?")]
+
+    run_id = failed["meta"]["run_id"]
+    agent.run("tutor", "What is a stack?", session_id=session_id, run_id=run_id)
+    assert _history(agent, session_id) == [("user", "What is a stack?")]
+
+    agent.llm.fail = False
+    result = agent.run("tutor", "What is a stack?", session_id=session_id, run_id=run_id)
+    assert result["meta"]["run_id"] == run_id
+    assert _history(agent, session_id) == [("user", "What is a stack?"), ("assistant", "A stack is LIFO.")]
+
+
+def test_run_logs_the_user_message_with_the_answer(agent):
+    session_id = agent.storage.ensure_session(None)
+    agent.run("tutor", "What is a stack?", session_id=session_id)
+    agent.run("tutor", "What is a queue?", session_id=session_id)
+    assert [role for role, _ in _history(agent, session_id)] == ["user", "assistant", "user", "assistant"]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Difficulty analytics tests; run with ``python -m pytest test_analytics.py`` from backend/"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app import analytics  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+QUESTIONS = [
+    {"question": "Is a stack LIFO?", "options": ["yes", "no"], "correct_index": 0},
+    {"question": "Is a queue LIFO?", "options": ["yes", "no"], "correct_index": 1},
+]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return Storage(f"sqlite:///{tmp_path / 'chat.db'}")
+
+
+def _take_quiz(storage: Storage, session_id: str, topic: str, selected: list) -> None:
+    attempt_id, rows = storage.log_quiz_attempt(session_id, topic, "{}", questions=[dict(q) for q in QUESTIONS])
+    storage.record_quiz_answers(
+        session_id,
+        attempt_id,
+        [
+            {"question_id": row[0], "selected_index": index, "is_correct": index == question["correct_index"]}
+            for row, question, index in zip(rows, QUESTIONS, selected)
+        ],
+    )
+
+
+def test_concepts_are_grouped_and_looked_up_regardless_of_case(storage):
+    first, second = storage.ensure_session(None), storage.ensure_session(None)
+    _take_quiz(storage, first, "Data Structures", [0, 1])
+    _take_quiz(storage, first, "data structures - Focus on: queues", [0, 0])
+    _take_quiz(storage, second, "DATA STRUCTURES", [1, 0])
+
+    result = analytics.compute_difficulty(storage, chunk_size=2)
+    assert result == {"answers": 6, "concepts": 1, "questions": 2, "seconds": result["seconds"]}
+    (concept,) = analytics.get_concept_difficulty(storage)
+    assert (concept["concept"], concept["answers"], concept["learners"], concept["questions"]) == (
+        "Data Structures",
+        6,
+        2,
+        2,
+    )
+    assert concept["p_correct"] == pytest.approx(3 / 6, abs=1e-4)
+
+    for name in ("Data Structures", "data structures", "DATA STRUCTURES "):
+        questions = analytics.get_question_difficulty(storage, name)
+        assert [(q["question"], q["answers"], q["p_correct"]) for q in questions] == [
+            ("Is a queue LIFO?", 3, pytest.approx(1 / 3, abs=1e-4)),
+            ("Is a stack LIFO?", 3, pytest.approx(2 / 3, abs=1e-4)),
+        ]
+    stack = analytics.get_question_difficulty(storage, "data structures")[1]
+    assert [(d["option"], d["share"]) for d in stack["distractors"]] == [
+        (0, pytest.approx(2 / 3, abs=1e-4)),
+        (1, pytest.approx(1 / 3, abs=1e-4)),
+    ]
+
+
+def test_memory_does_not_depend_on_the_largest_id(storage, tmp_path):
+    session_id = storage.ensure_session(None)
+    _take_quiz(storage, session_id, "Stacks", [0, 1])
+    with sqlite3.connect(tmp_path / "chat.db") as connection:
+        # Ids far apart, e.g. after imports; arrays sized by the largest id would not fit in memory
+        for table, column in (("quiz_answers", "question_id"), ("quiz_questions", "id")):
+            connection.execute(f"UPDATE {table} SET {column} = {column} + 10000000000000")
+        for table, column in (("quiz_answers", "attempt_id"), ("quiz_questions", "attempt_id"), ("quiz_attempts", "id")):
+            connection.execute(f"UPDATE {table} SET {column} = {column} + 20000000000000")
+
+    assert analytics.compute_difficulty(storage)["answers"] == 2
+    assert analytics.get_concept_difficulty(storage)[0]["p_correct"] == 1.0
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""AsyncStorage parity tests; run with ``python -m pytest test_async_storage.py`` from backend/"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.async_storage import AsyncStorage  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+
+@pytest.fixture
+def stores(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'chat.db'}")
+    async_storage = AsyncStorage(storage)
+    yield storage, async_storage
+    asyncio.run(async_storage.close())
+
+
+def _seed(storage: Storage) -> str:
+    session_id = storage.ensure_session(None)
+    storage.log_message(session_id, "user", "Quiz me on stacks", task="quiz")
+    storage.log_message(session_id, "assistant", "Here is a quiz", task="quiz")
+    questions = [
+        {"question": "What does pop return?", "options": ["top", "bottom"], "answer_index": 0, "topic": "Stacks"},
+        {"question": "Is a stack FIFO?", "options": ["yes", "no"], "answer_index": 1, "topic": "Stacks"},
+    ]
+    attempt_id, question_rows = storage.log_quiz_attempt(session_id, "Stacks", "{}", questions=questions)
+    storage.record_quiz_answers(
+        session_id,
+        attempt_id,
+        [
+            {"question_id": question_rows[0][0], "selected_index": 0, "is_correct": True},
+            {"question_id": question_rows[1][0], "selected_index": 0, "is_correct": False},
+        ],
+    )
+    storage.update_concept_mastery(session_id, "Stacks", 1, 2)
+    storage.log_weak_topics(session_id, "Stacks: LIFO order")
+    return session_id
+
+
+@pytest.mark.parametrize(
+    "method, args",
+    [
+        ("session_exists", ()),
+        ("get_history", ()),
+        ("get_learning_state", ()),
+        ("get_session_stats", ()),
+        ("get_quiz_history", ()),
+        ("get_weak_topics", ()),
+        ("get_concept_mastery", ()),
+        ("get_concept_mastery", ("Stacks",)),
+        ("get_due_reviews", ()),
+    ],
+)
+def test_async_reads_match_sync_storage(stores, method, args):
+    storage, async_storage = stores
+    session_id = _seed(storage)
+    expected = getattr(storage, method)(session_id, *args)
+    actual = asyncio.run(getattr(async_storage, method)(session_id, *args))
+    assert actual == expected
+
+
+def test_async_writes_are_visible_to_sync_storage(stores):
+    storage, async_storage = stores
+
+    async def write() -> str:
+        session_id = await async_storage.ensure_session(None)
+        await async_storage.log_message(session_id, "user", "What is a queue?")
+        await async_storage.update_concept_mastery(session_id, "Queues", 2, 2)
+        return session_id
+
+    session_id = asyncio.run(write())
+    assert [m["content"] for m in storage.get_history(session_id)] == ["What is a queue?"]
+    assert [(m["concept"], m["correct_answers"]) for m in storage.get_concept_mastery(session_id)] == [("Queues", 2)]
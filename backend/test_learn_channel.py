@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""/ws/learn channel tests; run with ``python -m pytest test_learn_channel.py`` from backend/"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+from fastapi import FastAPI, WebSocket  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.admission import AdmissionController  # noqa: E402
+from app.async_storage import AsyncStorage  # noqa: E402
+from app.learn_channel import PROGRESS_EVERY, LearnChannel  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+QUESTIONS = [
+    {"question": "What does pop return?", "options": ["top", "bottom"], "correct_index": 0, "topic": "Stacks"},
+    {"question": "Is a stack FIFO?", "options": ["yes", "no"], "correct_index": 1, "topic": "Stacks"},
+]
+
+
+class _Orchestrator:
+    """Stands in for LearnOrchestrator: fixed outputs, tokens pushed through ``on_token``"""
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    def start_learning(self, session_id, concept, on_token=None):
+        for text in ("A stack ", "is LIFO."):
+            on_token(text)
+        return {"concept": concept, "explanation": "A stack is LIFO."}
+
+    def generate_concept_quiz(self, session_id, concept, focus_weak_areas=False, on_token=None):
+        # The raw quiz output holds the answer key, so none of it may reach the client
+        for _ in range(2 * PROGRESS_EVERY):
+            on_token("ANSWER: A ")
+        attempt_id, rows = self.storage.log_quiz_attempt(session_id, concept, "{}", questions=QUESTIONS)
+        questions = [
+            {
+                "id": question_id,
+                "question": q["question"],
+                "options": q["options"],
+                "correct_index": q["correct_index"],
+                "explanation": "Because.",
+            }
+            for (question_id, *_), q in zip(rows, QUESTIONS)
+        ]
+        return {"attempt_id": attempt_id, "questions": questions}
+
+    def analyze_quiz_results(self, session_id, attempt_id, concept, on_token=None):
+        on_token("Review FIFO.")
+        return {"weak_areas": ["FIFO"], "mastery": {"concept": concept}}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'chat.db'}")
+    yield storage
+    storage.close()
+
+
+def _client(storage: Storage, admission=None) -> TestClient:
+    app = FastAPI()
+    async_storage = AsyncStorage(storage)
+
+    @app.websocket("/ws/learn")
+    async def learn_socket(websocket: WebSocket):
+        await websocket.accept()
+        await LearnChannel(websocket, _Orchestrator(storage), async_storage, admission=admission).run()
+
+    return TestClient(app)
+
+
+def _receive_until(websocket, message_type: str) -> list:
+    messages = []
+    while not messages or messages[-1]["type"] != message_type:
+        messages.append(websocket.receive_json())
+    return messages
+
+
+def test_learn_quiz_and_analyze_over_one_connection(storage):
+    with _client(storage).websocket_connect("/ws/learn") as websocket:
+        websocket.send_json({"type": "start", "concept": "Stacks"})
+        messages = _receive_until(websocket, "lesson")
+        assert [m["type"] for m in messages] == ["session", "phase", "token", "token", "lesson"]
+        session_id = messages[0]["session_id"]
+
+        websocket.send_json({"type": "quiz"})
+        messages = _receive_until(websocket, "quiz")
+        assert [m["type"] for m in messages] == ["phase", "progress", "progress", "quiz"]
+        quiz = messages[-1]
+        assert all("correct_index" not in q and "explanation" not in q for q in quiz["questions"])
+
+        first, second = (q["id"] for q in quiz["questions"])
+        websocket.send_json({"type": "answer", "question_id": first, "selected_index": 0})
+        answer = websocket.receive_json()
+        assert (answer["is_correct"], answer["correct_index"], answer["answered"]) == (True, 0, 1)
+        websocket.send_json({"type": "answer", "question_id": second, "selected_index": 0})
+        # The last answer starts the analysis
+        messages = _receive_until(websocket, "mastery")
+        assert [m["type"] for m in messages] == ["answer", "phase", "token", "analysis", "mastery"]
+        assert messages[1] == {"type": "phase", "phase": "analyze"}
+
+        websocket.send_json({"type": "analyze"})
+        assert websocket.receive_json() == {"type": "error", "detail": "There is no open quiz"}
+
+    attempt = storage.get_quiz_history(session_id)[0]
+    assert attempt["correct_count"] == 1
+    assert [question["answer"]["selected_index"] for question in attempt["questions"]] == [0, 0]
+
+
+def test_errors_keep_the_connection_usable(storage):
+    admission = AdmissionController(burst=1)
+    with _client(storage, admission).websocket_connect("/ws/learn") as websocket:
+        websocket.send_json({"type": "answer", "question_id": 1, "selected_index": 0})
+        assert websocket.receive_json()["detail"] == "There is no open quiz"
+        websocket.send_text("not json")
+        assert websocket.receive_json()["type"] == "error"
+
+        websocket.send_json({"type": "start", "concept": "Stacks"})
+        _receive_until(websocket, "lesson")
+        # The bucket is empty now, so the next phase is rejected with a retry hint
+        websocket.send_json({"type": "quiz"})
+        error = websocket.receive_json()
+        assert error["type"] == "error" and error["retry_after"] >= 1
+    assert admission.stats()["rejected"] == 1
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Schema migration tests; run with ``python -m pytest test_migrations.py`` from backend/"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app import storage as storage_module  # noqa: E402
+from app.storage import MIGRATIONS, Storage  # noqa: E402
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Schema written by the first version, before any migration existed (user_version 0)
+BASELINE_SCHEMA = """
+CREATE TABLE chat_sessions (id VARCHAR NOT NULL PRIMARY KEY, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE messages (
+    id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR, role VARCHAR, content TEXT, task VARCHAR, meta TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE weak_topics (
+    id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR, topic VARCHAR, detail TEXT, severity VARCHAR,
+    source VARCHAR, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE quiz_attempts (
+    id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR, task VARCHAR, topic VARCHAR, raw_output TEXT,
+    total_questions INTEGER, correct_count INTEGER, meta TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE quiz_questions (
+    id INTEGER NOT NULL PRIMARY KEY, attempt_id INTEGER, sequence INTEGER, question TEXT, options TEXT,
+    correct_index INTEGER, explanation TEXT
+);
+CREATE TABLE roadmap_tasks (
+    id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR, title VARCHAR, detail TEXT, status VARCHAR,
+    priority INTEGER, weak_topic_id INTEGER, created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE quiz_answers (
+    id INTEGER NOT NULL PRIMARY KEY, attempt_id INTEGER, question_id INTEGER, selected_index INTEGER,
+    selected_option TEXT, is_correct BOOLEAN, note TEXT, confidence FLOAT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE concept_mastery (
+    id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR, concept VARCHAR, mastery_score FLOAT,
+    total_questions INTEGER, correct_answers INTEGER, quiz_attempts INTEGER,
+    last_practiced DATETIME DEFAULT CURRENT_TIMESTAMP, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO chat_sessions (id) VALUES ('s1'), ('s2');
+INSERT INTO messages (session_id, role, content)
+VALUES ('s1', 'user', 'q1'), ('s1', 'assistant', 'a1'), ('s2', 'user', 'q2');
+INSERT INTO quiz_attempts (id, session_id, topic, total_questions, correct_count) VALUES (1, 's1', 'Stacks', 2, 2);
+INSERT INTO quiz_questions (id, attempt_id, sequence, question) VALUES (1, 1, 1, 'Is a stack LIFO?'), (2, 1, 2, 'Pop?');
+-- Every click was recorded, so a question could have several answers
+INSERT INTO quiz_answers (attempt_id, question_id, selected_index, is_correct)
+VALUES (1, 1, 1, 0), (1, 1, 0, 0), (1, 2, 0, 1);
+INSERT INTO concept_mastery (session_id, concept, total_questions, correct_answers, quiz_attempts)
+VALUES ('s1', 'Stacks', 2, 1, 1), ('s1', 'Stacks', 2, 2, 1);
+"""
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = tmp_path / "chat.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+    return path
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    calls = []
+    rebuild = storage_module._rebuild_aggregates
+
+    def counting(session, session_id=None):
+        calls.append(session_id)
+        return rebuild(session, session_id)
+
+    monkeypatch.setattr(storage_module, "_rebuild_aggregates", counting)
+    return calls
+
+
+def _message_counts(path) -> dict:
+    with sqlite3.connect(path) as connection:
+        return dict(connection.execute("SELECT session_id, message_count FROM session_stats"))
+
+
+def test_baseline_database_is_upgraded_with_one_rebuild(baseline_db, rebuilds):
+    storage = Storage(f"sqlite:///{baseline_db}")
+    assert rebuilds == [None]
+    with sqlite3.connect(baseline_db) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == LATEST_VERSION
+        assert "answered_count" in {row[1] for row in connection.execute("PRAGMA table_info(quiz_attempts)")}
+        assert connection.execute("SELECT COUNT(*) FROM quiz_answers").fetchone()[0] == 2
+        assert connection.execute("SELECT correct_count FROM quiz_attempts").fetchone()[0] == 1
+    assert _message_counts(baseline_db) == {"s1": 2, "s2": 1}
+    assert [(m["concept"], m["total_questions"]) for m in storage.get_concept_mastery("s1")] == [("Stacks", 4)]
+    assert storage.get_session_stats("s1")["quiz_attempts"] == 1
+
+    Storage(f"sqlite:///{baseline_db}")
+    assert rebuilds == [None]
+
+
+def test_database_from_before_the_message_counts_is_rebuilt_once(baseline_db, rebuilds):
+    Storage(f"sqlite:///{baseline_db}")
+    with sqlite3.connect(baseline_db) as connection:
+        # Version 3 had the stats tables, but not their message counts
+        connection.execute("ALTER TABLE session_stats DROP COLUMN message_count")
+        connection.execute("PRAGMA user_version = 3")
+    rebuilds.clear()
+
+    Storage(f"sqlite:///{baseline_db}")
+    assert rebuilds == [None]
+    assert _message_counts(baseline_db) == {"s1": 2, "s2": 1}
+
+
+def test_columns_added_later_reach_an_up_to_date_database(tmp_path, rebuilds):
+    path = tmp_path / "chat.db"
+    Storage(f"sqlite:///{path}")
+    with sqlite3.connect(path) as connection:
+        connection.execute("ALTER TABLE quiz_attempts DROP COLUMN answered_count")
+    rebuilds.clear()
+
+    storage = Storage(f"sqlite:///{path}")
+    assert rebuilds == []
+    session_id = storage.ensure_session(None)
+    storage.log_quiz_attempt(session_id, "Stacks", "{}", questions=[])
+    assert storage.get_quiz_history(session_id)[0]["topic"] == "Stacks"
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Read cache tests; run with ``python -m pytest test_read_cache.py`` from backend/"""
+import asyncio
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.async_storage import AsyncStorage  # noqa: E402
+from app.storage import CACHED_READS, Storage  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "chat.db"
+
+
+@pytest.fixture
+def storage(db_path):
+    storage = Storage(f"sqlite:///{db_path}", profile="production", cache_size=100)
+    yield storage
+    storage.close()
+
+
+def test_cached_reads_are_served_until_a_write(storage):
+    session_id = storage.ensure_session(None)
+    storage.log_message(session_id, "user", "What is a stack?")
+    storage.get_history(session_id)
+    storage.get_history(session_id)
+    assert storage.cache_stats()["hits"] == 1
+
+    storage.log_message(session_id, "user", "What is a queue?")
+    assert len(storage.get_history(session_id)) == 2
+    assert storage.cache_stats()["hits"] == 1
+
+
+def test_writes_of_another_process_invalidate_cached_reads(storage, db_path):
+    session_id = storage.ensure_session(None)
+    storage.update_concept_mastery(session_id, "Stacks", 1, 2)
+    storage.log_message(session_id, "user", "What is a stack?")
+    assert len(storage.get_history(session_id)) == 1
+    assert storage.get_concept_mastery(session_id)[0]["correct_answers"] == 1
+
+    # A script with its own Storage, and one writing plain SQL
+    Storage(f"sqlite:///{db_path}").log_message(session_id, "assistant", "LIFO")
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("UPDATE concept_mastery SET correct_answers = 2 WHERE session_id = ?", (session_id,))
+
+    assert [m["content"] for m in storage.get_history(session_id)] == ["What is a stack?", "LIFO"]
+    assert storage.get_concept_mastery(session_id)[0]["correct_answers"] == 2
+    assert storage.cache_stats()["hits"] == 0
+
+
+def test_write_behind_messages_invalidate_cached_history(db_path):
+    storage = Storage(f"sqlite:///{db_path}", cache_size=100, write_behind=True, flush_interval=60)
+    try:
+        session_id = storage.ensure_session(None)
+        storage.log_message(session_id, "user", "What is a stack?")
+        assert len(storage.get_history(session_id)) == 1
+        storage.log_message(session_id, "user", "What is a queue?")
+        assert len(storage.get_history(session_id)) == 2
+    finally:
+        storage.close()
+
+
+def test_etags_change_with_writes_of_any_process(storage, db_path):
+    session_id = storage.ensure_session(None)
+    other_worker = Storage(f"sqlite:///{db_path}", profile="production", cache_size=100)
+    first = storage.data_version(session_id, ("get_history", "get_weak_topics"))
+    assert other_worker.data_version(session_id, ("get_history", "get_weak_topics")) == first
+
+    other_worker.log_message(session_id, "user", "What is a stack?")
+    second = storage.data_version(session_id, ("get_history", "get_weak_topics"))
+    assert second != first
+    assert storage.data_version(session_id, ("get_weak_topics",)) == other_worker.data_version(
+        session_id, ("get_weak_topics",)
+    )
+
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+    assert storage.data_version(session_id, ("get_history", "get_weak_topics")) not in (first, second)
+
+
+def test_async_etag_matches_sync_etag(storage):
+    session_id = storage.ensure_session(None)
+    storage.log_message(session_id, "user", "What is a stack?")
+    async_storage = AsyncStorage(storage)
+    try:
+        assert asyncio.run(async_storage.data_version(session_id, CACHED_READS)) == storage.data_version(session_id)
+    finally:
+        asyncio.run(async_storage.close())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Retention tests; run with ``python -m pytest test_retention.py`` from backend/"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.retention import RetentionPolicy, archive, compact, list_archives, rehydrate  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return Storage(f"sqlite:///{tmp_path / 'chat.db'}", profile="production")
+
+
+def _seed(storage: Storage, messages: int = 200) -> str:
+    session_id = storage.ensure_session(None)
+    for number in range(messages):
+        storage.log_message(session_id, "user", f"Question {number}: " + "stack " * 50)
+    questions = [{"question": "Is a stack LIFO?", "options": ["yes", "no"], "answer_index": 0, "topic": "Stacks"}]
+    attempt_id, question_rows = storage.log_quiz_attempt(session_id, "Stacks", "{}", questions=questions)
+    storage.record_quiz_answers(
+        session_id, attempt_id, [{"question_id": question_rows[0][0], "selected_index": 0, "is_correct": True}]
+    )
+    storage.log_quiz_attempt(session_id, "Queues", "{}", questions=[])
+    return session_id
+
+
+def test_archive_and_rehydrate_round_trip(storage):
+    session_id = _seed(storage)
+    history = storage.get_history(session_id, limit=1000)
+    attempts = storage.get_quiz_history(session_id)
+
+    counts = archive(storage, RetentionPolicy(keep_messages=10, keep_attempts=1))
+    assert counts == {"messages": 190, "quiz_attempts": 1}
+    assert len(storage.get_history(session_id, limit=1000)) == 10
+    assert [attempt["archived"] for attempt in storage.get_quiz_history(session_id)] == [False, True]
+    assert [chunk["kind"] for chunk in list_archives(storage, session_id)] == ["messages", "quiz_attempts"]
+
+    assert rehydrate(storage, session_id) == counts
+    assert list_archives(storage, session_id) == []
+    assert storage.get_history(session_id, limit=1000) == history
+    assert storage.get_quiz_history(session_id) == attempts
+
+
+def test_compact_in_wal_mode_shrinks_the_file(storage, tmp_path):
+    db_path = tmp_path / "chat.db"
+    _seed(storage, messages=1000)
+    archive(storage, RetentionPolicy(keep_messages=10))
+    # Until the first full VACUUM there is nothing to free incrementally
+    assert compact(storage)["full_vacuum_needed"] == 1
+
+    assert compact(storage, full_vacuum=True)["full_vacuum_needed"] == 0
+    switched = os.path.getsize(db_path)
+    assert not os.path.getsize(f"{db_path}-wal")
+
+    session_id = _seed(storage, messages=1000)
+    archive(storage, RetentionPolicy(keep_messages=10), session_id=session_id)
+    grown = compact(storage, max_pages=1)
+    result = compact(storage)
+    assert result["freed_pages"] > 0
+    assert os.path.getsize(db_path) == result["size_bytes"] < grown["size_bytes"]
+    assert os.path.getsize(db_path) <= switched * 2
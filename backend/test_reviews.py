@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Spaced-repetition scheduling tests; run with ``python -m pytest test_reviews.py`` from backend/"""
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+from app.reviews import plan_reviews  # noqa: E402
+from app.storage import INITIAL_EASE, Storage, _next_review  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "chat.db"
+
+
+@pytest.fixture
+def storage(db_path):
+    storage = Storage(f"sqlite:///{db_path}")
+    yield storage
+    storage.close()
+
+
+def _schedule(db_path, session_id: str, concept: str) -> dict:
+    with sqlite3.connect(db_path) as connection:
+        connection.row_factory = sqlite3.Row
+        row = connection.execute(
+            "SELECT * FROM review_schedule WHERE session_id = ? AND concept = ?", (session_id, concept)
+        ).fetchone()
+    return dict(row)
+
+
+def _make_due(db_path, session_id: str, due_at: datetime) -> None:
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("UPDATE review_schedule SET due_at = ? WHERE session_id = ?", (due_at, session_id))
+
+
+def test_passing_reviews_follow_the_sm2_intervals():
+    repetitions, interval_days, ease = _next_review(0, 0.0, INITIAL_EASE, 5)
+    assert (repetitions, interval_days) == (1, 1.0)
+    repetitions, interval_days, ease = _next_review(repetitions, interval_days, ease, 5)
+    assert (repetitions, interval_days) == (2, 6.0)
+    repetitions, interval_days, ease = _next_review(repetitions, interval_days, ease, 4)
+    assert (repetitions, interval_days) == (3, round(6.0 * ease, 2))
+    assert _next_review(repetitions, interval_days, ease, 1)[:2] == (0, 1.0)
+
+
+def test_only_due_reviews_move_the_schedule(storage, db_path):
+    session_id = storage.ensure_session(None)
+    storage.update_concept_mastery(session_id, "Stacks", 5, 5)
+    first = _schedule(db_path, session_id, "Stacks")
+    assert (first["repetitions"], first["interval_days"]) == (1, 1.0)
+
+    # Quizzing again before the due date does not stretch the interval
+    storage.update_concept_mastery(session_id, "Stacks", 5, 5)
+    early = _schedule(db_path, session_id, "Stacks")
+    assert (early["repetitions"], early["interval_days"], early["due_at"]) == (1, 1.0, first["due_at"])
+
+    _make_due(db_path, session_id, datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1))
+    storage.update_concept_mastery(session_id, "Stacks", 5, 5)
+    due = _schedule(db_path, session_id, "Stacks")
+    assert (due["repetitions"], due["interval_days"]) == (2, 6.0)
+    assert storage.get_due_reviews(session_id)["due"] == []
+
+    # A failed review starts the concept over, even before it is due
+    storage.update_concept_mastery(session_id, "Stacks", 0, 5)
+    lapsed = _schedule(db_path, session_id, "Stacks")
+    assert (lapsed["repetitions"], lapsed["interval_days"], lapsed["lapses"]) == (0, 1.0, 1)
+    assert lapsed["ease"] == due["ease"]
+
+
+def test_plan_reviews_caps_each_sessions_queue(storage, db_path):
+    session_id = storage.ensure_session(None)
+    for number in range(5):
+        storage.update_concept_mastery(session_id, f"Concept {number}", 4, 5)
+    day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = datetime(day.year, day.month, day.day)
+    with sqlite3.connect(db_path) as connection:
+        for number in range(5):
+            connection.execute(
+                "UPDATE review_schedule SET due_at = ? WHERE concept = ?",
+                (start - timedelta(days=5 - number), f"Concept {number}"),
+            )
+        # Practised before the scheduler existed, so it has no schedule yet
+        connection.execute(
+            "INSERT INTO concept_mastery (session_id, concept, mastery_score, total_questions, correct_answers,"
+            " quiz_attempts, last_practiced) VALUES (?, 'Queues', 0.5, 4, 2, 1, ?)",
+            (session_id, start - timedelta(days=10)),
+        )
+
+    counts = plan_reviews(storage, day=day, max_per_day=2)
+    assert counts == {"backfilled": 1, "sessions": 1, "due": 2, "postponed": 4}
+    due = storage.get_due_reviews(session_id, now=start + timedelta(hours=23))["due"]
+    # The most overdue concepts stay, the rest move on two per day
+    assert [review["concept"] for review in due] == ["Queues", "Concept 0"]
+    postponed = {
+        concept: _schedule(db_path, session_id, concept)["due_at"][:10]
+        for concept in ("Concept 1", "Concept 2", "Concept 3", "Concept 4")
+    }
+    assert postponed == {
+        "Concept 1": (start + timedelta(days=1)).date().isoformat(),
+        "Concept 2": (start + timedelta(days=1)).date().isoformat(),
+        "Concept 3": (start + timedelta(days=2)).date().isoformat(),
+        "Concept 4": (start + timedelta(days=2)).date().isoformat(),
+    }
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Storage regression tests; run with ``python -m pytest test_storage.py`` from backend/"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app.storage import DURABILITY_BATCHED, DURABILITY_FSYNC, Storage  # noqa: E402
+
+
+@pytest.mark.parametrize("durability", [DURABILITY_BATCHED, DURABILITY_FSYNC])
+def test_write_behind_flush_persists_messages(tmp_path, durability):
+    db_url = f"sqlite:///{tmp_path / 'chat.db'}"
+    storage = Storage(db_url, write_behind=True, flush_interval=60, durability=durability)
+    try:
+        session_id = storage.ensure_session(None)
+        storage.log_message(session_id, "user", "What is a stack?", task="tutor")
+        storage.flush_messages()
+        # A second instance has no queue to read from, so it only sees committed rows
+        history = Storage(db_url).get_history(session_id)
+    finally:
+        storage.close()
+    assert [(m["role"], m["content"]) for m in history] == [("user", "What is a stack?")]
+
+
+def test_write_behind_messages_of_rolled_back_unit_of_work_are_dropped(tmp_path):
+    storage = Storage(f"sqlite:///{tmp_path / 'chat.db'}", write_behind=True, flush_interval=60)
+    try:
+        session_id = storage.ensure_session(None)
+        with pytest.raises(RuntimeError):
+            with storage.unit_of_work() as uow:
+                uow.log_message(session_id, "user", "Quiz me on stacks")
+                raise RuntimeError("log_quiz_attempt failed")
+        with storage.unit_of_work() as uow:
+            uow.log_message(session_id, "user", "What is a queue?")
+        storage.flush_messages()
+        history = storage.get_history(session_id)
+    finally:
+        storage.close()
+    assert [m["content"] for m in history] == ["What is a queue?"]
+
+
+def _busy_error() -> OperationalError:
+    return OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+
+
+def _fail_once(method):
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise _busy_error()
+        return method(*args, **kwargs)
+
+    return wrapper, calls
+
+
+@pytest.mark.parametrize("method", ["ensure_session", "session_exists"])
+def test_session_methods_retry_when_busy(tmp_path, monkeypatch, method):
+    storage = Storage(f"sqlite:///{tmp_path / 'chat.db'}", profile="production")
+    session_id = storage.ensure_session(None)
+    wrapper, calls = _fail_once(storage._ensure_session if method == "ensure_session" else storage.Session)
+    monkeypatch.setattr(storage, "_ensure_session" if method == "ensure_session" else "Session", wrapper)
+    assert getattr(storage, method)(session_id) in (session_id, True)
+    assert len(calls) == 2
+
+
+def test_write_behind_busy_back_pressure_flush_does_not_duplicate(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'chat.db'}"
+    storage = Storage(db_url, profile="production", write_behind=True, flush_interval=60, max_pending=1)
+    try:
+        session_id = storage.ensure_session(None)
+        wrapper, calls = _fail_once(storage._insert_messages)
+        monkeypatch.setattr(storage, "_insert_messages", wrapper)
+        # Filling the queue flushes on this thread, and that flush hits a busy database
+        storage.log_message(session_id, "user", "What is a heap?")
+        storage.flush_messages()
+        history = Storage(db_url).get_history(session_id)
+    finally:
+        storage.close()
+    assert len(calls) == 2
+    assert [m["content"] for m in history] == ["What is a heap?"]
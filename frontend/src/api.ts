@@ -87,6 +87,10 @@ export async function callAgent(
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(payload),
   })
+  if (response.status === 429) {
+    const retryAfter = response.headers.get('Retry-After') ?? '?'
+    throw new Error(`The tutor is busy, please retry in ${retryAfter}s`)
+  }
   if (!response.ok) throw new Error(`Agent error: ${response.status}`)
   const data = await response.json()
   if (data.session_id) {
@@ -105,6 +109,24 @@ export async function submitQuizAnswer(payload: QuizAnswerPayload) {
   return response.json()
 }
 
+export type QuizAnswersPayload = {
+  session_id: string
+  attempt_id: number
+  answers: Array<Omit<QuizAnswerPayload, 'session_id' | 'attempt_id'>>
+}
+
+// keepalive lets the request finish while the page is being left
+export async function submitQuizAnswers(payload: QuizAnswersPayload, keepalive = false) {
+  const response = await fetch(`${BASE}/api/quiz-answers`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+    keepalive,
+  })
+  if (!response.ok) throw new Error('Failed to save quiz answers')
+  return response.json() as Promise<{ status: string; recorded: number; correct_count: number }>
+}
+
 export async function fetchRoadmapTasks(sessionId: string) {
   const response = await fetch(`${BASE}/api/roadmap?session_id=${encodeURIComponent(sessionId)}`)
   if (!response.ok) throw new Error('Failed to load roadmap tasks')
@@ -121,10 +143,20 @@ export async function updateRoadmapTaskStatus(sessionId: string, taskId: number,
   return response.json()
 }
 
-export async function fetchHistory(sessionId: string) {
-  const response = await fetch(`${BASE}/api/history?session_id=${encodeURIComponent(sessionId)}`)
+export type HistoryPage = { limit?: number; beforeId?: number; afterId?: number }
+
+export async function fetchHistory(sessionId: string, page: HistoryPage = {}) {
+  const params = new URLSearchParams({ session_id: sessionId })
+  if (page.limit !== undefined) params.set('limit', String(page.limit))
+  if (page.beforeId !== undefined) params.set('before_id', String(page.beforeId))
+  if (page.afterId !== undefined) params.set('after_id', String(page.afterId))
+  const response = await fetch(`${BASE}/api/history?${params.toString()}`)
   if (!response.ok) throw new Error('Failed to load history')
-  return response.json() as Promise<{ session_id: string; messages: Array<{ role: string; content: string; task: string; timestamp: string }> }>
+  return response.json() as Promise<{
+    session_id: string
+    messages: Array<{ id: number; role: string; content: string; task: string; created_at: string }>
+    next_before_id: number | null
+  }>
 }
 
 export async function fetchAnalysis(sessionId: string) {
@@ -139,6 +171,25 @@ export async function fetchWeakTopics(sessionId: string) {
   return response.json() as Promise<{ session_id: string; weak_topics: Array<{ id: number; title: string; detail: string; created_at: string }> }>
 }
 
+export type DashboardSection = 'history' | 'weak_topics' | 'roadmap' | 'analysis' | 'mastery' | 'recommendations'
+
+// Loads several page sections in one round trip instead of one request per section
+export async function fetchSessionDashboard(sessionId: string, include: DashboardSection[], historyLimit?: number) {
+  const params = new URLSearchParams({ session_id: sessionId, include: include.join(',') })
+  if (historyLimit !== undefined) params.set('history_limit', String(historyLimit))
+  const response = await fetch(`${BASE}/api/session-dashboard?${params.toString()}`)
+  if (!response.ok) throw new Error('Failed to load session dashboard')
+  return response.json() as Promise<{
+    session_id: string
+    history?: Array<{ id: number; role: string; content: string; task: string; created_at: string }>
+    weak_topics?: Array<{ id: number; title: string; detail: string; created_at: string }>
+    roadmap?: RoadmapTaskDto[]
+    analysis?: { summary: string; timestamp: string } | null
+    mastery?: Array<{ id: number; concept: string; mastery_score: number }>
+    recommendations?: { next_action: { action: string; reason: string; suggestion: string }; performance: any }
+  }>
+}
+
 export async function addMemoryFromText(text: string) {
   const fd = new FormData()
   fd.append('texts', text)
@@ -185,6 +236,32 @@ export async function analyzeConceptQuiz(sessionId: string, attemptId: number, c
   return response.json()
 }
 
+export type LearnSocketRequest =
+  | { type: 'start'; concept: string; session_id?: string }
+  | { type: 'quiz'; focus_weak_areas?: boolean }
+  | { type: 'answer'; question_id: number; selected_index: number; confidence?: number }
+  | { type: 'analyze' }
+
+// Server messages; see backend/app/learn_channel.py for the fields of each type
+export type LearnSocketEvent = { type: 'session' | 'phase' | 'token' | 'progress' | 'lesson' | 'quiz' | 'answer' | 'analysis' | 'mastery' | 'error' } & Record<string, any>
+
+export function openLearnSocket(onEvent: (event: LearnSocketEvent) => void) {
+  const socket = new WebSocket(`${BASE.replace(/^http/, 'ws')}/ws/learn`)
+  socket.onmessage = (message) => onEvent(JSON.parse(message.data))
+  const ready = new Promise<void>((resolve, reject) => {
+    socket.onopen = () => resolve()
+    socket.onerror = () => reject(new Error('Failed to open learn socket'))
+  })
+  return {
+    socket,
+    send: async (request: LearnSocketRequest) => {
+      await ready
+      socket.send(JSON.stringify(request))
+    },
+    close: () => socket.close(),
+  }
+}
+
 export async function getLearningProgress(sessionId: string, concept?: string) {
   const url = concept 
     ? `${BASE}/api/learn/progress?session_id=${encodeURIComponent(sessionId)}&concept=${encodeURIComponent(concept)}`
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { callAgent, fetchHistory, fetchAnalysis, getSessionId } from '../api'
+import { callAgent, fetchSessionDashboard, getSessionId } from '../api'
 import { useNavigate } from 'react-router-dom'
 
 export default function Analytics() {
@@ -14,20 +14,15 @@ export default function Analytics() {
     const sessionId = getSessionId()
     if (sessionId && history.length === 0) {
       // Only load if not already loaded
-      fetchHistory(sessionId)
+      // Conversation analysis only looks at the last 30 messages
+      fetchSessionDashboard(sessionId, ['history', 'analysis'], 30)
         .then(data => {
-          const msgs = data.messages.map(m => ({ role: m.role, content: m.content }))
-          setHistory(msgs)
-        })
-        .catch(err => console.error('Failed to load history:', err))
-      
-      fetchAnalysis(sessionId)
-        .then(data => {
-          if (data.summary) {
-            setSummary(data.summary)
+          setHistory((data.history || []).map(m => ({ role: m.role, content: m.content })))
+          if (data.analysis?.summary) {
+            setSummary(data.analysis.summary)
           }
         })
-        .catch(err => console.error('Failed to load analysis:', err))
+        .catch(err => console.error('Failed to load history:', err))
     }
   }, [])
 
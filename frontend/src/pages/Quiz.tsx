@@ -1,8 +1,12 @@
-import { useState, useEffect } from 'react'
-import { callAgent, getSessionId, submitQuizAnswer, fetchHistory, fetchWeakTopics } from '../api'
-import type { QuizQuestionDto } from '../api'
+import { useState, useEffect, useRef } from 'react'
+import { callAgent, getSessionId, submitQuizAnswers, fetchHistory, fetchWeakTopics } from '../api'
+import type { QuizAnswersPayload, QuizQuestionDto } from '../api'
 import { useNavigate } from 'react-router-dom'
 
+type QuizAnswer = QuizAnswersPayload['answers'][number]
+// Answers of one attempt that have not been sent yet, by question id
+type PendingAnswers = { sessionId: string; attemptId: number; answers: Record<number, QuizAnswer> }
+
 export default function Quiz() {
   const [topic, setTopic] = useState('')
   const [loading, setLoading] = useState(false)
@@ -15,8 +19,84 @@ export default function Quiz() {
   const [weakTopics, setWeakTopics] = useState<Array<{ id: number; title: string; detail: string }>>([])
   const [showRawLog, setShowRawLog] = useState(false)
   const [quizScore, setQuizScore] = useState<{ correct: number; total: number } | null>(null)
-  const [quizComplete, setQuizComplete] = useState(false)
+  // Selected option per question as last confirmed by the server
+  const [savedAnswers, setSavedAnswers] = useState<Record<number, number | undefined>>({})
+  const [saveError, setSaveError] = useState<string | null>(null)
+  const pending = useRef<PendingAnswers | null>(null)
+  const saving = useRef(false)
   const navigate = useNavigate()
+  const quizComplete =
+    questions.length > 0 &&
+    questions.every(q => answerState[q.id] !== undefined && savedAnswers[q.id] === answerState[q.id]?.selected)
+
+  useEffect(() => {
+    if (quizComplete && attemptId) {
+      localStorage.setItem('agentic-quiz-topic', topic)
+      localStorage.setItem('agentic-quiz-attempt-id', attemptId.toString())
+    }
+  }, [quizComplete])
+
+  // Answers still unsent when the page is left (or a new quiz starts) go out in one last request
+  function flushPending() {
+    const batch = pending.current
+    pending.current = null
+    if (!batch || Object.keys(batch.answers).length === 0) return
+    submitQuizAnswers(
+      { session_id: batch.sessionId, attempt_id: batch.attemptId, answers: Object.values(batch.answers) },
+      true,
+    ).catch(err => console.error('Failed to save quiz answers:', err))
+  }
+
+  useEffect(() => {
+    window.addEventListener('pagehide', flushPending)
+    return () => {
+      window.removeEventListener('pagehide', flushPending)
+      flushPending()
+    }
+  }, [])
+
+  // Each answer is saved as it is given; answers given while a save is in flight go out together
+  // in the next request. A failed batch is kept for a retry.
+  async function saveAnswers() {
+    const batch = pending.current
+    if (saving.current || !batch || Object.keys(batch.answers).length === 0) return
+    saving.current = true
+    pending.current = { ...batch, answers: {} }
+    try {
+      await submitQuizAnswers({ session_id: batch.sessionId, attempt_id: batch.attemptId, answers: Object.values(batch.answers) })
+      setSaveError(null)
+      if (pending.current?.attemptId === batch.attemptId) {
+        setSavedAnswers(saved => {
+          const next = { ...saved }
+          for (const [questionId, answer] of Object.entries(batch.answers)) next[Number(questionId)] = answer.selected_index
+          return next
+        })
+      }
+    } catch (err: any) {
+      if (pending.current?.attemptId === batch.attemptId) {
+        // Answers given since then replace the failed ones
+        pending.current = { ...batch, answers: { ...batch.answers, ...pending.current.answers } }
+      } else {
+        console.error('Failed to save quiz answers:', err)
+      }
+      setSaveError(err?.message ?? 'Failed to save quiz answers')
+      return
+    } finally {
+      saving.current = false
+    }
+    saveAnswers()
+  }
+
+  function startQuiz(res: { output: any; meta: any; session_id?: string }) {
+    flushPending()
+    setQuizRaw(res.output?.raw ?? 'No quiz generated')
+    setQuestions(res.output?.questions ?? [])
+    setAttemptId(res.meta?.quiz_attempt_id ?? null)
+    setSessionId(res.session_id ?? getSessionId())
+    setAnswerState({})
+    setSavedAnswers({})
+    setSaveError(null)
+  }
 
   useEffect(() => {
     const sid = getSessionId()
@@ -57,14 +137,9 @@ export default function Quiz() {
     setLoading(true)
     setShowRawLog(false)
     setQuizScore(null)
-    setQuizComplete(false)
     try {
       const res = await callAgent('quiz', conceptTopic)
-      setQuizRaw(res.output?.raw ?? 'No quiz generated')
-      setQuestions(res.output?.questions ?? [])
-      setAttemptId(res.meta?.quiz_attempt_id ?? null)
-      setSessionId(res.session_id ?? getSessionId())
-      setAnswerState({})
+      startQuiz(res)
     } catch (e: any) {
       setQuizRaw(`Error: ${e.message}`)
     } finally {
@@ -77,14 +152,9 @@ export default function Quiz() {
     setLoading(true)
     setShowRawLog(false)
     setQuizScore(null)
-    setQuizComplete(false)
     try {
       const res = await callAgent('quiz', topic)
-      setQuizRaw(res.output?.raw ?? 'No quiz generated')
-      setQuestions(res.output?.questions ?? [])
-      setAttemptId(res.meta?.quiz_attempt_id ?? null)
-      setSessionId(res.session_id ?? getSessionId())
-      setAnswerState({})
+      startQuiz(res)
     } catch (e: any) {
       setQuizRaw(`Error: ${e.message}`)
     } finally {
@@ -94,39 +164,27 @@ export default function Quiz() {
 
   async function handleAnswer(question: QuizQuestionDto, selectedIndex: number) {
     if (!attemptId || !sessionId) return
-    const option = question.options[selectedIndex] ?? ''
-    const payload = {
-      session_id: sessionId,
-      attempt_id: attemptId,
+    const newAnswerState = {
+      ...answerState,
+      [question.id]: {
+        selected: selectedIndex,
+        status: selectedIndex === question.correct_index ? 'correct' : 'incorrect',
+      },
+    } as typeof answerState
+    setAnswerState(newAnswerState)
+    // Update score
+    const correct = Object.values(newAnswerState).filter(a => a.status === 'correct').length
+    setQuizScore({ correct, total: questions.length })
+
+    const answer = {
       question_id: question.id,
       selected_index: selectedIndex,
-      selected_option: option,
+      selected_option: question.options[selectedIndex] ?? '',
       is_correct: selectedIndex === question.correct_index,
     }
-    try {
-      await submitQuizAnswer(payload)
-      const newAnswerState = {
-        ...answerState,
-        [question.id]: {
-          selected: selectedIndex,
-          status: payload.is_correct ? 'correct' : 'incorrect',
-        },
-      }
-      setAnswerState(newAnswerState)
-      // Update score
-      const answered = Object.keys(newAnswerState).length
-      const correct = Object.values(newAnswerState).filter(a => a.status === 'correct').length
-      setQuizScore({ correct, total: questions.length })
-      
-      // Check if all questions answered
-      if (answered === questions.length) {
-        setQuizComplete(true)
-        localStorage.setItem('agentic-quiz-topic', topic)
-        localStorage.setItem('agentic-quiz-attempt-id', attemptId.toString())
-      }
-    } catch (err) {
-      setAnswerState(prev => ({ ...prev, [question.id]: { ...prev[question.id], status: 'saved' } }))
-    }
+    const batch = pending.current?.attemptId === attemptId ? pending.current : { sessionId, attemptId, answers: {} }
+    pending.current = { ...batch, answers: { ...batch.answers, [question.id]: answer } }
+    saveAnswers()
   }
 
   function goToAnalysis() {
@@ -144,15 +202,10 @@ export default function Quiz() {
     setLoading(true)
     setShowRawLog(false)
     setQuizScore(null)
-    setQuizComplete(false)
     
     try {
       const res = await callAgent('quiz', focusedTopic)
-      setQuizRaw(res.output?.raw ?? 'No quiz generated')
-      setQuestions(res.output?.questions ?? [])
-      setAttemptId(res.meta?.quiz_attempt_id ?? null)
-      setSessionId(res.session_id ?? getSessionId())
-      setAnswerState({})
+      startQuiz(res)
     } catch (e: any) {
       setQuizRaw(`Error: ${e.message}`)
     } finally {
@@ -190,6 +243,14 @@ export default function Quiz() {
           📊 Current Score: {quizScore.correct} / {quizScore.total} ({Math.round((quizScore.correct / quizScore.total) * 100)}%)
         </div>
       )}
+      {saveError && (
+        <div className="box" style={{ marginTop: '1rem', padding: '0.75rem', backgroundColor: '#f8d7da' }}>
+          ⚠️ Your answers could not be saved ({saveError}).{' '}
+          <button onClick={saveAnswers} style={{ fontSize: '0.85rem', padding: '0.4rem 0.8rem' }}>
+            Retry
+          </button>
+        </div>
+      )}
       {quizComplete && (
         <div style={{ marginTop: '1rem', marginBottom: '1rem', textAlign: 'center' }}>
           <button 
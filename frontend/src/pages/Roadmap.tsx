@@ -1,5 +1,5 @@
 import { useEffect, useState } from 'react'
-import { fetchRoadmapTasks, fetchWeakTopics, getSessionId, updateRoadmapTaskStatus } from '../api'
+import { fetchSessionDashboard, getSessionId, updateRoadmapTaskStatus } from '../api'
 import type { RoadmapTaskDto, TaskStatus } from '../api'
 import { useNavigate } from 'react-router-dom'
 
@@ -17,13 +17,10 @@ export default function Roadmap() {
     if (!sid || tasks.length > 0 || weakTopics.length > 0) return
     setSessionId(sid)
     setLoading(true)
-    Promise.all([
-      fetchRoadmapTasks(sid),
-      fetchWeakTopics(sid)
-    ])
-      .then(([roadmapRes, weakRes]) => {
-        setTasks(roadmapRes.tasks)
-        setWeakTopics(weakRes.weak_topics || [])
+    fetchSessionDashboard(sid, ['roadmap', 'weak_topics'])
+      .then(data => {
+        setTasks(data.roadmap || [])
+        setWeakTopics(data.weak_topics || [])
       })
       .catch(err => setError(err.message))
       .finally(() => setLoading(false))